@@ -1,9 +1,9 @@
 import streamlit as st
 import networkx as nx
 import matplotlib.pyplot as plt
-import pandas as pd
 from caminho_critico_node import max_path_dag_node_weights
 from generate_direct_graph import generate_graph
+from project_ingestion import SUPPORTED_FORMATS, ProjectValidationError, load_project, sheet_names
 
 try:
     from networkx.drawing.nx_pydot import graphviz_layout
@@ -12,50 +12,46 @@ except ImportError:
 
 st.title("Visualização de Grafos direcionados")
 # # Carregar os dados
-uploaded_file = st.file_uploader("Faça o upload do arquivo Excel para exibir o grafo", type=["xlsx"])
+uploaded_file = st.file_uploader("Faça o upload do arquivo do projeto (Excel, CSV, Parquet ou Feather) para exibir o grafo", type=list(SUPPORTED_FORMATS))
 
 if uploaded_file is not None:
-    # Carrega todas as planilhas disponíveis
-    xls = pd.ExcelFile(uploaded_file)
-    sheet_names = xls.sheet_names
+    dados_arquivo = uploaded_file.getvalue()
 
-    # Permite o usuário selecionar a planilha
-    selected_sheet = st.selectbox("Selecione a aba (sheet):", sheet_names)
+    # Permite o usuário selecionar a planilha (apenas arquivos Excel têm várias)
+    try:
+        abas = sheet_names(dados_arquivo, uploaded_file.name)
+    except ProjectValidationError as e:
+        st.error(f"Arquivo do projeto inválido: {e}")
+        st.stop()
+    selected_sheet = st.selectbox("Selecione a aba (sheet):", abas) if abas else None
 
-    # Lê a planilha selecionada
-    df = pd.read_excel(xls, sheet_name=selected_sheet)
+    # Lê, limpa e valida a planilha e compila a rede do projeto uma única vez por arquivo
+    try:
+        df, schedule = load_project(dados_arquivo, uploaded_file.name, selected_sheet, ("Durações",))
+    except ProjectValidationError as e:
+        st.error(f"Erro na rede do projeto: {e}")
+        st.stop()
 
 else:
-    st.warning("Por favor, faça o upload de um arquivo Excel contendo o Grafo (.xlsx)")
+    st.warning("Por favor, faça o upload de um arquivo contendo o Grafo (.xlsx, .csv, .parquet ou .feather)")
     st.stop()
 
-# Criar o grafo direcionado
-G = nx.DiGraph()
-G.graph['graph'] = {'rankdir': 'LR'}
-
-# Adicionar nós e arestas no grafo
-for _, row in df.iterrows():
-    # Adiciona o nó (atividade)
-    G.add_node(row['Code'], label=row['Task Name'], duration=row['Durações'])
-    
-    # Se houver predecessoras, adicionar aresta
-    if row['Predecessors'] != '-':
-        predecessors = row['Predecessors'].split(',')
-        for pred in predecessors:
-            G.add_edge(pred, row['Code'])
+# Criar o grafo direcionado (usado apenas para o desenho)
+G = schedule.to_networkx()
+nx.set_node_attributes(G, df.set_index('Code')['Durações'].to_dict(), 'duration')
 
 
 
 #CALCULAR CAMINHO CRÍTICO
 atividades = df["Task Name"].tolist()
-atividade_para_codigo = {f"{row['Task Name']} ({row['Code']})": row['Code'] for _, row in df.iterrows()}
+atividade_para_codigo = dict(zip(df["Task Name"] + " (" + df["Code"] + ")", df["Code"]))
 start_node = st.selectbox("Nó inicial para calcular caminho crítico:",list(atividade_para_codigo.keys()))
 end_node = st.selectbox("Nó final para calcular caminha crítico:", list(atividade_para_codigo.keys()))
 caminho_critico = {}
 
 
 if st.button("Gerar Caminho Crítico"):
-    caminho_critico =  max_path_dag_node_weights(G, df.set_index('Code')['Durações'].to_dict(), atividade_para_codigo[start_node], atividade_para_codigo[end_node])
+    caminho_critico =  max_path_dag_node_weights(schedule, df.set_index('Code')['Durações'].to_dict(), atividade_para_codigo[start_node], atividade_para_codigo[end_node])
     codigo_para_atividade = df.set_index('Code')['Task Name'].to_dict()
     atividades_caminho = [codigo_para_atividade[codigo] for codigo in caminho_critico['caminho']]
     caminho_str = " -> ".join(atividades_caminho)
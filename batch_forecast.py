@@ -0,0 +1,228 @@
+import argparse
+import fnmatch
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional, Sequence
+
+import pandas as pd
+
+from caminho_critico_node import cpm_batch
+from probabilist_project_plan import SUPPORTED_DISTRIBUTIONS, generate_samples_parallel
+from profiling import configure_logging
+from project_ingestion import SUPPORTED_FORMATS, load_project, parameter_columns, sheet_names
+from simulation_cache import SimulationCache
+from var_cvar import conditional_value_at_risk, value_at_risk
+
+from complex_network.bayesian_network_store import load_or_build_bayesian_network
+from complex_network.discretize_samples import DISCRETIZATION_METHODS, discretize_durations
+from complex_network.inference_service import InferenceService
+
+DEFAULT_LEVELS = (0.5, 0.8, 0.9, 0.95)
+
+# Output tables, one Parquet file each
+OUTPUT_TABLES = ("summary", "makespan_quantiles", "criticality", "bn_marginals")
+
+
+def forecast_project(path: str, distribution: str = "triangular", n_samples: int = 10000, seed: Optional[int] = 42, levels: Sequence[float] = DEFAULT_LEVELS, sheet: str = "Plan", bayesian_network: bool = True, bin_width: int = 1, method: str = "width", max_states: Optional[int] = None, cache_dir: Optional[str] = None) -> Dict[str, pd.DataFrame]:
+    """
+    Runs the full forecast of one project file, without Streamlit.
+
+    The steps are the same as in `pages/planning.py`: the plan is loaded with `load_project`, the
+    durations are sampled with `generate_samples_parallel` (serially, since every project already
+    runs in its own worker), the CPM pass (`cpm_batch`) gives the makespan over all start activities
+    and the criticality of every activity, VaR/CVaR come from `var_cvar`, and the completion time
+    of every end activity is inferred on the project's Bayesian Network. The same seed and sample
+    count give the same samples as the page.
+
+    :param path: The project file (see `SUPPORTED_FORMATS`).
+    :param distribution: The duration distribution (see `SUPPORTED_DISTRIBUTIONS`).
+    :param n_samples: The number of scenarios.
+    :param seed: The root seed of the sampling.
+    :param levels: The confidence levels of the makespan quantiles (VaR) and CVaR.
+    :param sheet: The sheet of Excel files. The first sheet is used if the file has no such sheet.
+    :param bayesian_network: Whether to build the Bayesian Network and report its marginals.
+    :param bin_width: The bin width in days of the duration discretization (see `discretize_durations`).
+    :param method: The discretization method ('width' or 'quantile').
+    :param max_states: The maximum number of states per activity.
+    :param cache_dir: The directory of the `SimulationCache` used for parsed plans and networks.
+                      Defaults to the default cache directory.
+
+    :return: A dictionary with one DataFrame per table of `OUTPUT_TABLES`, every row tagged with
+             the project file name.
+    """
+    started = time.perf_counter()
+    project = os.path.basename(path)
+    cache = SimulationCache(cache_dir) if cache_dir else SimulationCache()
+    with open(path, "rb") as f:
+        data = f.read()
+    sheets = sheet_names(data, path)
+    selected_sheet = (sheet if sheet in sheets else sheets[0]) if sheets else None
+    df, schedule = load_project(data, path, selected_sheet, parameter_columns(distribution), cache)
+
+    samples = generate_samples_parallel(df, distribution, n_samples, seed=seed, max_workers=1)
+    cpm = cpm_batch(schedule, samples)
+    makespans = cpm["makespan"]
+
+    summary = pd.DataFrame([{
+        "project": project,
+        "activities": len(schedule),
+        "samples": n_samples,
+        "mean": makespans.mean(),
+        "std": makespans.std(),
+        "min": makespans.min(),
+        "max": makespans.max(),
+    }])
+    quantiles = pd.DataFrame({
+        "project": project,
+        "level": list(levels),
+        "makespan": [value_at_risk(makespans, level) for level in levels],
+        "cvar": [conditional_value_at_risk(makespans, level) for level in levels],
+    })
+    names = dict(zip(df["Code"], df["Task Name"]))
+    criticality = pd.DataFrame({
+        "project": project,
+        "code": cpm["nodes"],
+        "task_name": [names[code] for code in cpm["nodes"]],
+        "criticality_index": cpm["criticality_index"],
+        "mean_total_float": cpm["total_float"].mean(axis=0),
+    })
+
+    marginals = []
+    if bayesian_network:
+        discretization_params = discretize_durations(samples, bin_width=bin_width, method=method, max_states=max_states)
+        model = load_or_build_bayesian_network(df, discretization_params, schedule, cache, compact=True)
+        inference = InferenceService(model)
+        for code in schedule.sinks:
+            factor = inference.query([f"T_{code}"])
+            marginals.append(pd.DataFrame({
+                "project": project,
+                "node": f"T_{code}",
+                "day": factor.state_names[f"T_{code}"],
+                "probability": factor.values,
+            }))
+
+    summary["seconds"] = time.perf_counter() - started
+    return {
+        "summary": summary,
+        "makespan_quantiles": quantiles,
+        "criticality": criticality,
+        "bn_marginals": pd.concat(marginals, ignore_index=True) if marginals else pd.DataFrame(columns=["project", "node", "day", "probability"]),
+    }
+
+
+def run_batch(paths: List[str], output_dir: str, max_workers: Optional[int] = None, **options) -> Dict[str, pd.DataFrame]:
+    """
+    Forecasts many project files in a process pool and writes the results to Parquet.
+
+    Every project runs in its own worker. A project that fails (e.g., an invalid plan) is reported
+    in the summary with its error message, and the others go on.
+
+    :param paths: The project files.
+    :param output_dir: The directory of the Parquet files (one per table of `OUTPUT_TABLES`).
+    :param max_workers: The number of worker processes. None uses every core; 1 runs serially.
+    :param options: The keyword arguments of `forecast_project`.
+    :return: The concatenated tables, as written.
+    """
+    results, failures = [], []
+
+    def collect(path: str, compute) -> None:
+        try:
+            results.append(compute())
+            print(f"[{len(results) + len(failures)}/{len(paths)}] {os.path.basename(path)}", file=sys.stderr)
+        except Exception as e:
+            failures.append({"project": os.path.basename(path), "error": f"{type(e).__name__}: {e}"})
+            print(f"[{len(results) + len(failures)}/{len(paths)}] {os.path.basename(path)} failed: {e}", file=sys.stderr)
+
+    if max_workers == 1 or len(paths) <= 1:
+        for path in paths:
+            collect(path, lambda: forecast_project(path, **options))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(forecast_project, path, **options): path for path in paths}
+            for future in as_completed(futures):
+                collect(futures[future], future.result)
+
+    tables = {}
+    for name in OUTPUT_TABLES:
+        frames = [result[name] for result in results]
+        if name == "summary":
+            frames.append(pd.DataFrame(failures, columns=["project", "error"]))
+        filled = [frame for frame in frames if len(frame)]
+        table = pd.concat(filled, ignore_index=True) if filled else (frames[0] if frames else pd.DataFrame(columns=["project"]))
+        tables[name] = table.sort_values("project", kind="stable", ignore_index=True)
+    if results:
+        # Failed projects leave the counts empty; keep them integers
+        tables["summary"] = tables["summary"].astype({"activities": "Int64", "samples": "Int64"})
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name, table in tables.items():
+        table.to_parquet(os.path.join(output_dir, f"{name}.parquet"), index=False)
+    return tables
+
+
+def project_files(directory: str, pattern: Optional[str] = None) -> List[str]:
+    """
+    Lists the project files of a directory (non-recursive), in name order.
+
+    :param directory: The directory to scan.
+    :param pattern: An optional glob pattern (e.g., '*.xlsx'). Defaults to every supported format.
+    :return: The file paths.
+    """
+    names = sorted(os.listdir(directory))
+    if pattern is not None:
+        names = fnmatch.filter(names, pattern)
+    else:
+        names = [name for name in names if os.path.splitext(name)[1].lower().lstrip(".") in SUPPORTED_FORMATS]
+    # Skip the lock files that Excel leaves next to open workbooks
+    return [os.path.join(directory, name) for name in names if not name.startswith("~$") and os.path.isfile(os.path.join(directory, name))]
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Forecast a directory of project plans (Monte Carlo, CPM, VaR/CVaR and Bayesian Network) and write the results to Parquet."
+    )
+    parser.add_argument("projects", help="Directory with the project files (.xlsx, .csv, .parquet, .feather).")
+    parser.add_argument("output", help="Directory of the Parquet files (summary, makespan_quantiles, criticality, bn_marginals).")
+    parser.add_argument("--pattern", default=None, help="Glob pattern of the project files (default: every supported format).")
+    parser.add_argument("--sheet", default="Plan", help="Sheet of the Excel files (default: Plan, or the first sheet).")
+    parser.add_argument("--distribution", default="triangular", choices=SUPPORTED_DISTRIBUTIONS)
+    parser.add_argument("--samples", type=int, default=10000, help="Number of scenarios per project.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--levels", type=float, nargs="+", default=list(DEFAULT_LEVELS), help="Confidence levels of the makespan quantiles and CVaR.")
+    parser.add_argument("--no-bayesian-network", action="store_true", help="Skip the Bayesian Network and its marginals.")
+    parser.add_argument("--bin-width", type=int, default=1, help="Bin width (days) of the duration discretization.")
+    parser.add_argument("--discretization", default="width", choices=DISCRETIZATION_METHODS)
+    parser.add_argument("--max-states", type=int, default=None, help="Maximum number of states per activity.")
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: every core).")
+    parser.add_argument("--cache-dir", default=None, help="Directory of the simulation cache.")
+    parser.add_argument("--log-level", default="WARNING", help="Level of the JSON logs on stderr (DEBUG includes every stage timing).")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    args = parse_args(argv)
+    configure_logging(args.log_level)
+    paths = project_files(args.projects, args.pattern)
+    if not paths:
+        print(f"No project files found in {args.projects}.", file=sys.stderr)
+        return 1
+    if args.discretization == "quantile" and args.max_states is None:
+        print("--discretization quantile needs --max-states.", file=sys.stderr)
+        return 2
+
+    tables = run_batch(
+        paths, args.output, args.workers,
+        distribution=args.distribution, n_samples=args.samples, seed=args.seed, levels=args.levels,
+        sheet=args.sheet, bayesian_network=not args.no_bayesian_network, bin_width=args.bin_width,
+        method=args.discretization, max_states=args.max_states, cache_dir=args.cache_dir,
+    )
+    summary = tables["summary"]
+    failed = int(summary["error"].notna().sum()) if "error" in summary else 0
+    print(f"Forecast {len(paths) - failed} of {len(paths)} projects. Results in {os.path.abspath(args.output)}.", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,390 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_networks import GENERATORS
+from caminho_critico_node import cpm_batch, max_path_dag_node_weights_batch
+from compiled_schedule import CompiledSchedule
+from probabilist_project_plan import generate_samples
+from profiling import configure_logging
+
+from complex_network.completion_distribution import completion_time_distributions
+from complex_network.create_bayesian_network import build_generic_bayesian_network
+from complex_network.deterministic_inference import DeterministicVariableElimination
+from complex_network.discretize_samples import discretize_by_whole_days
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "history.jsonl")
+
+# Networks above these many activities skip the Bayesian Network build and the inference. Exact
+# inference needs memory exponential in the width of the network, and fails well below the build limit
+DEFAULT_MAX_BN_ACTIVITIES = 1000
+DEFAULT_MAX_INFERENCE_ACTIVITIES = 100
+
+# Memory a run may allocate above what is mapped at its start; larger stages fail with MemoryError
+DEFAULT_MEMORY_HEADROOM_MB = 2048
+
+# A stage is reported as a regression when it is this many times slower than its history
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+
+# Seeds of the synthetic networks of the checks below: every check must hold for all of them
+CHECK_SEEDS = (0, 1, 2, 3, 42)
+
+# Networks whose exact inference must stay small with the app engine: (generator, activities,
+# largest table allowed, in entries). Wide merges are decomposed into pairwise chains, so a good
+# elimination order processes their branches one at a time and never multiplies them together.
+# Series-parallel networks are not checked: activities that share a set of several predecessors
+# each get their own chain over it, so the tables grow with the shared set whatever the order
+# (series_parallel_dag(20, seed=3) needs about 2e10 entries)
+ELIMINATION_CHECKS = (
+    ("fan_in", 10, 10 ** 4),
+    ("fan_in", 20, 10 ** 4),
+    ("fan_in", 100, 10 ** 6),
+)
+
+# Networks on which the direct propagation of `completion_time_distributions` must match the exact
+# inference on the Bayesian Network: (generator, activities)
+DISTRIBUTION_CHECKS = (
+    ("series_parallel", 8),
+    ("series_parallel", 12),
+    ("fan_in", 12),
+)
+
+# Largest difference in probability between the propagated and the exact distributions
+DISTRIBUTION_TOLERANCE = 1e-9
+
+
+def limit_memory(headroom_mb: int) -> bool:
+    """
+    Caps the address space of the process at its current size plus `headroom_mb`.
+
+    Exact inference on dense networks can need more memory than the machine has. With the cap, such
+    a stage fails with `MemoryError` and is recorded as failed, instead of the whole run being
+    killed by the operating system. Only Linux exposes the current size (`/proc/self/statm`).
+
+    :param headroom_mb: The extra memory allowed, in MiB.
+    :return: Whether the cap was set.
+    """
+    try:
+        import resource
+        with open("/proc/self/statm") as f:
+            mapped = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (ImportError, OSError, ValueError):
+        return False
+    limit = mapped + headroom_mb * 1024 ** 2
+    resource.setrlimit(resource.RLIMIT_AS, (limit, resource.getrlimit(resource.RLIMIT_AS)[1]))
+    return True
+
+
+def measure(function: Callable[[], Any], repeat: int = 1, memory: bool = True) -> Tuple[Any, float, Optional[int]]:
+    """
+    Times a stage and measures its peak memory.
+
+    The time is the best of `repeat` runs without tracing. The peak memory comes from one more run
+    under `tracemalloc` (which slows Python code down, so it is not timed). NumPy reports its
+    buffers to `tracemalloc`, so arrays are included.
+
+    :param function: The stage, as a function without arguments.
+    :param repeat: The number of timed runs.
+    :param memory: Whether to measure the peak memory.
+    :return: A tuple (result of the last run, seconds, peak bytes or None).
+    """
+    best = float("inf")
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - started)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        try:
+            result = function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, best, peak
+
+
+def benchmark_network(df: pd.DataFrame, n_samples: int, seed: int, repeat: int = 1, memory: bool = True, bayesian_network: bool = True, inference: bool = True, dense: bool = False) -> List[dict]:
+    """
+    Runs every pipeline stage on one project network and measures each one separately.
+
+    The stages run in the order of the planning page, each on the output of the previous ones:
+    compiling the schedule, `generate_samples`, the batched critical path
+    (`max_path_dag_node_weights_batch`), the CPM pass (`cpm_batch`), `discretize_by_whole_days`,
+    `build_generic_bayesian_network` (which creates every CPT with `create_completion_cpt`) and the
+    inference of the end activity's completion time. A stage that fails stops the stages that
+    depend on it, which are reported as skipped.
+
+    :param df: The project table (see `benchmarks.synthetic_networks`).
+    :param n_samples: The number of Monte Carlo samples.
+    :param seed: The sampling seed.
+    :param repeat: The number of timed runs of every stage.
+    :param memory: Whether to measure the peak memory of every stage.
+    :param bayesian_network: Whether to build the Bayesian Network.
+    :param inference: Whether to run the inference (only if the network is built).
+    :param dense: Build dense CPTs and query with pgmpy's `VariableElimination`, instead of the
+                  compact model and `DeterministicVariableElimination` used by the app.
+    :return: One record per stage, with 'stage', 'seconds', 'peak_bytes', 'status', 'error' and 'details'.
+    """
+    records = []
+    outputs: Dict[str, Any] = {}
+
+    def run(stage: str, function: Callable[[], Any], details: Callable[[Any], dict] = lambda result: {}, requires: Sequence[str] = ()) -> None:
+        if any(name not in outputs for name in requires):
+            records.append({"stage": stage, "seconds": None, "peak_bytes": None, "status": "skipped", "error": "A previous stage failed.", "details": {}})
+            return
+        try:
+            result, seconds, peak = measure(function, repeat, memory)
+        except Exception as e:
+            records.append({"stage": stage, "seconds": None, "peak_bytes": None, "status": "failed", "error": f"{type(e).__name__}: {e}", "details": {}})
+            return
+        outputs[stage] = result
+        records.append({"stage": stage, "seconds": seconds, "peak_bytes": peak, "status": "ok", "error": None, "details": details(result)})
+
+    run("compile_schedule", lambda: CompiledSchedule.from_dataframe(df), lambda schedule: {"edges": int(schedule.pred_indptr[-1])})
+    schedule = outputs.get("compile_schedule")
+    run("generate_samples", lambda: generate_samples(df, "triangular", n_samples, seed=seed), requires=["compile_schedule"])
+    if schedule is not None:
+        start, end = schedule.sources[0], schedule.sinks[0]
+        samples = outputs.get("generate_samples")
+        run("critical_path", lambda: max_path_dag_node_weights_batch(schedule, samples, start, end), requires=["generate_samples"])
+        run("cpm", lambda: cpm_batch(schedule, samples), requires=["generate_samples"])
+        run("discretize", lambda: discretize_by_whole_days(samples), lambda params: {"states": sum(len(p["labels"]) for p in params.values())}, requires=["generate_samples"])
+
+    def skip(stage: str) -> None:
+        records.append({"stage": stage, "seconds": None, "peak_bytes": None, "status": "skipped", "error": "Network above the size limit of the stage.", "details": {}})
+
+    if not bayesian_network:
+        skip("build_bayesian_network")
+        skip("inference")
+        return records
+
+    def model_details(model) -> dict:
+        cpds = model.get_cpds()
+        return {"cpds": len(cpds), "cpd_entries": int(sum(np.prod(cpd.cardinality, dtype=float) for cpd in cpds))}
+
+    run("build_bayesian_network", lambda: build_generic_bayesian_network(df, outputs["discretize"], schedule, compact=not dense), model_details, requires=["discretize"])
+    if not inference:
+        skip("inference")
+        return records
+    if dense:
+        from pgmpy.inference import VariableElimination
+        engine = lambda model: VariableElimination(model)
+    else:
+        engine = DeterministicVariableElimination
+    run("inference", lambda: engine(outputs["build_bayesian_network"]).query([f"T_{end}"], show_progress=False),
+        lambda factor: {"states": int(factor.cardinality[0])}, requires=["build_bayesian_network"])
+    return records
+
+
+def check_elimination(checks: Sequence[Tuple[str, int, int]] = ELIMINATION_CHECKS, n_samples: int = 1000, seeds: Sequence[int] = CHECK_SEEDS) -> pd.DataFrame:
+    """
+    Checks that the elimination order of the app engine keeps the inference of some networks small.
+
+    For every check, the compact Bayesian Network of the synthetic network is built and the largest
+    table of the elimination plan of the end activity's completion time (see
+    `DeterministicVariableElimination.largest_factor`) is compared with the allowed size. Unlike the
+    timings, this does not depend on the machine or on a history.
+
+    :param checks: Tuples (generator, activities, largest table allowed in entries).
+    :param n_samples: The number of Monte Carlo samples of the discretization.
+    :param seeds: The seeds of the networks and of the sampling.
+    :return: A DataFrame with 'generator', 'activities', 'seed', 'largest_factor', 'limit' and 'ok'.
+    """
+    rows = []
+    for name, size, limit in checks:
+        for seed in seeds:
+            df = GENERATORS[name](size, seed=seed)
+            schedule = CompiledSchedule.from_dataframe(df)
+            params = discretize_by_whole_days(generate_samples(df, "triangular", n_samples, seed=seed))
+            engine = DeterministicVariableElimination(build_generic_bayesian_network(df, params, schedule, compact=True))
+            end = f"T_{schedule.sinks[0]}"
+            order, _ = engine.elimination_plan([end])
+            largest = engine.largest_factor(order, {end})
+            rows.append({"generator": name, "activities": size, "seed": seed, "largest_factor": largest, "limit": limit, "ok": largest <= limit})
+    return pd.DataFrame(rows, columns=["generator", "activities", "seed", "largest_factor", "limit", "ok"])
+
+
+def check_completion_distributions(checks: Sequence[Tuple[str, int]] = DISTRIBUTION_CHECKS, n_samples: int = 1000, seeds: Sequence[int] = CHECK_SEEDS, tolerance: float = DISTRIBUTION_TOLERANCE) -> pd.DataFrame:
+    """
+    Checks that the direct propagation of the completion times is exact on series-parallel and fan-in networks.
+
+    For every check and seed, the completion time distribution of every activity computed by
+    `completion_time_distributions` is compared with the exact inference on the compact Bayesian
+    Network, and the largest difference in probability is reported.
+
+    :param checks: Tuples (generator, activities).
+    :param n_samples: The number of Monte Carlo samples of the discretization.
+    :param seeds: The seeds of the networks and of the sampling.
+    :param tolerance: The largest difference allowed.
+    :return: A DataFrame with 'generator', 'activities', 'seed', 'max_difference' and 'ok'.
+    """
+    rows = []
+    for name, size in checks:
+        for seed in seeds:
+            df = GENERATORS[name](size, seed=seed)
+            schedule = CompiledSchedule.from_dataframe(df)
+            params = discretize_by_whole_days(generate_samples(df, "triangular", n_samples, seed=seed))
+            propagated = completion_time_distributions(schedule, params)
+            engine = DeterministicVariableElimination(build_generic_bayesian_network(df, params, schedule, compact=True))
+            difference = 0.0
+            for code in schedule.nodes:
+                factor = engine.query([f"T_{code}"])
+                exact = dict(zip((int(state) for state in factor.state_names[f"T_{code}"]), factor.values))
+                direct = dict(zip(propagated[code]['labels'], propagated[code]['probs']))
+                difference = max(difference, max(abs(exact.get(day, 0.0) - direct.get(day, 0.0)) for day in exact.keys() | direct.keys()))
+            rows.append({"generator": name, "activities": size, "seed": seed, "max_difference": difference, "ok": difference <= tolerance})
+    return pd.DataFrame(rows, columns=["generator", "activities", "seed", "max_difference", "ok"])
+
+
+def environment() -> dict:
+    """Describes the code version and the machine of a benchmark run."""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import pgmpy
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "pgmpy": pgmpy.__version__,
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def run_benchmarks(sizes: Sequence[int] = DEFAULT_SIZES, generators: Sequence[str] = tuple(GENERATORS), n_samples: int = 1000, seed: int = 42, repeat: int = 1, memory: bool = True, max_bn_activities: int = DEFAULT_MAX_BN_ACTIVITIES, max_inference_activities: int = DEFAULT_MAX_INFERENCE_ACTIVITIES, dense: bool = False) -> List[dict]:
+    """
+    Benchmarks every stage on synthetic networks of every generator and size.
+
+    :param sizes: The numbers of activities.
+    :param generators: The names of the network generators (see `GENERATORS`).
+    :param n_samples: The number of Monte Carlo samples.
+    :param seed: The seed of the networks and of the sampling.
+    :param repeat: The number of timed runs of every stage.
+    :param memory: Whether to measure the peak memory of every stage.
+    :param max_bn_activities: The largest network whose Bayesian Network is built.
+    :param max_inference_activities: The largest network that runs the inference.
+    :param dense: Benchmark the dense CPTs and pgmpy's `VariableElimination` (see `benchmark_network`).
+    :return: One flat record per (generator, size, stage), tagged with the run and its environment.
+    """
+    run_info = {"run": datetime.now(timezone.utc).isoformat(timespec="seconds"), **environment()}
+    records = []
+    for name in generators:
+        for size in sizes:
+            df = GENERATORS[name](size, seed=seed)
+            print(f"{name} ({size} activities)...", file=sys.stderr)
+            for record in benchmark_network(df, n_samples, seed, repeat, memory, size <= max_bn_activities, size <= max_inference_activities, dense):
+                records.append({**run_info, "generator": name, "activities": size, "samples": n_samples,
+                                "engine": "dense" if dense else "compact", **record})
+    return records
+
+
+def append_history(path: str, records: List[dict]) -> None:
+    """Appends the records to a JSON Lines history file."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record) + "\n")
+
+
+def load_history(path: str) -> pd.DataFrame:
+    """Loads a JSON Lines history file as a DataFrame (empty if the file does not exist)."""
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    return pd.read_json(path, lines=True, dtype=False)
+
+
+def find_regressions(history: pd.DataFrame, records: List[dict], threshold: float = DEFAULT_REGRESSION_THRESHOLD) -> pd.DataFrame:
+    """
+    Compares a run with the history of the same benchmarks.
+
+    Every stage of `records` is compared with the median time of the earlier successful runs of the
+    same generator, size, number of samples, engine and stage, on the same kind of machine
+    (architecture and number of CPUs). A stage is a regression when it is more than `threshold`
+    times slower, or when it failed (e.g., with `MemoryError`) where it used to succeed.
+
+    :param history: The earlier runs (see `load_history`), without the records of this run.
+    :param records: The records of this run.
+    :param threshold: The slowdown ratio above which a stage is reported.
+    :return: A DataFrame with the baseline, the new time, the ratio (empty for failed stages), the
+             status and the error of every regressed stage.
+    """
+    columns = ["machine", "cpus", "generator", "activities", "samples", "engine", "stage"]
+    result_columns = [*columns, "baseline_seconds", "seconds", "ratio", "status", "error"]
+    current = pd.DataFrame(records)
+    if history.empty or current.empty:
+        return pd.DataFrame(columns=result_columns)
+    baseline = (history[history["status"] == "ok"].groupby(columns)["seconds"].median()
+                .rename("baseline_seconds").reset_index())
+    merged = current[current["status"].isin(["ok", "failed"])].merge(baseline, on=columns)
+    merged["ratio"] = merged["seconds"] / merged["baseline_seconds"]
+    regressed = (merged["status"] == "failed") | (merged["ratio"] > threshold)
+    return merged.loc[regressed, result_columns].reset_index(drop=True)
+
+
+def main(argv: Optional[Sequence[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark every pipeline stage on synthetic project networks.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="Numbers of activities.")
+    parser.add_argument("--generators", nargs="+", default=list(GENERATORS), choices=list(GENERATORS))
+    parser.add_argument("--samples", type=int, default=1000, help="Number of Monte Carlo samples.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=1, help="Timed runs per stage (the best is kept).")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc run of every stage.")
+    parser.add_argument("--max-bn-activities", type=int, default=DEFAULT_MAX_BN_ACTIVITIES, help="Largest network whose Bayesian Network is built.")
+    parser.add_argument("--max-inference-activities", type=int, default=DEFAULT_MAX_INFERENCE_ACTIVITIES, help="Largest network that runs the inference.")
+    parser.add_argument("--dense", action="store_true", help="Dense CPTs and pgmpy's VariableElimination instead of the compact model.")
+    parser.add_argument("--memory-headroom", type=int, default=DEFAULT_MEMORY_HEADROOM_MB, help="MiB a run may allocate before stages fail with MemoryError (0 = no cap).")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON Lines file the results are appended to.")
+    parser.add_argument("--no-history", action="store_true", help="Do not append the results to the history.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="Slowdown ratio reported as a regression.")
+    parser.add_argument("--log-level", default="WARNING", help="Level of the JSON logs on stderr (DEBUG includes every stage timing).")
+    args = parser.parse_args(argv)
+    configure_logging(args.log_level)
+
+    history = load_history(args.history)
+    if args.memory_headroom > 0 and not limit_memory(args.memory_headroom):
+        print("Could not cap the memory on this platform; large stages may be killed by the system.", file=sys.stderr)
+    records = run_benchmarks(args.sizes, args.generators, args.samples, args.seed, args.repeat, not args.no_memory, args.max_bn_activities, args.max_inference_activities, args.dense)
+    if not args.no_history:
+        append_history(args.history, records)
+
+    table = pd.DataFrame(records)
+    table["peak_mb"] = table["peak_bytes"] / 1024 ** 2
+    print(table[["generator", "activities", "stage", "status", "seconds", "peak_mb"]].to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+    status = 0
+    regressions = find_regressions(history, records, args.threshold)
+    if len(regressions):
+        print(f"\nStages more than {args.threshold}x slower than their history, or failing where they used to succeed:")
+        print(regressions.to_string(index=False, float_format=lambda value: f"{value:.4f}"))
+        status = 1
+    elimination = check_elimination(n_samples=args.samples)
+    if not elimination["ok"].all():
+        print("\nElimination plans above their size limit:")
+        print(elimination[~elimination["ok"]].to_string(index=False))
+        status = 1
+    distributions = check_completion_distributions(n_samples=args.samples)
+    if not distributions["ok"].all():
+        print("\nCompletion time distributions that differ from the exact inference:")
+        print(distributions[~distributions["ok"]].to_string(index=False))
+        status = 1
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+from typing import Callable, Dict, List, Set
+
+import numpy as np
+import pandas as pd
+
+
+def layered_dag(n_activities: int, seed: int = 0, max_predecessors: int = 3) -> pd.DataFrame:
+    """
+    Generates a layered random project network.
+
+    The inner activities are split into about sqrt(n) layers of similar width. Every activity of a
+    layer depends on 1 to `max_predecessors` random activities of the previous layer. A start
+    activity precedes the first layer and an end activity follows every activity without successors.
+
+    :param n_activities: The number of activities (at least 3).
+    :param seed: The seed of the random structure and durations.
+    :param max_predecessors: The maximum number of predecessors of an inner activity.
+    :return: A project table (see `project_table`).
+    """
+    rng = np.random.default_rng(seed)
+    inner = max(n_activities - 2, 1)
+    width = max(1, int(round(np.sqrt(inner))))
+    layers = [list(range(1 + start, 1 + min(start + width, inner))) for start in range(0, inner, width)]
+
+    predecessors: Dict[int, List[int]] = {0: []}
+    for node in layers[0]:
+        predecessors[node] = [0]
+    for previous, layer in zip(layers, layers[1:]):
+        for node in layer:
+            k = int(rng.integers(1, min(max_predecessors, len(previous)) + 1))
+            predecessors[node] = sorted(int(p) for p in rng.choice(previous, size=k, replace=False))
+    end = inner + 1
+    has_successor = {p for preds in predecessors.values() for p in preds}
+    predecessors[end] = [node for node in predecessors if node not in has_successor]
+    return project_table(predecessors, rng)
+
+
+def series_parallel_dag(n_activities: int, seed: int = 0, series_probability: float = 0.5) -> pd.DataFrame:
+    """
+    Generates a random series-parallel project network.
+
+    Starting from the chain start -> activity -> end, a random inner activity is repeatedly either
+    followed by a new activity (series step, the new one takes over its successors) or duplicated
+    with the same predecessors and successors (parallel step), until the network has
+    `n_activities` activities.
+
+    :param n_activities: The number of activities (at least 3).
+    :param seed: The seed of the random structure and durations.
+    :param series_probability: The probability of a series step.
+    :return: A project table (see `project_table`).
+    """
+    rng = np.random.default_rng(seed)
+    predecessors: Dict[int, Set[int]] = {0: set(), 1: {0}, 2: {1}}
+    successors: Dict[int, Set[int]] = {0: {1}, 1: {2}, 2: set()}
+    inner = [1]
+    for new in range(3, max(n_activities, 3)):
+        node = inner[int(rng.integers(len(inner)))]
+        if rng.random() < series_probability:
+            successors[new] = successors[node]
+            for successor in successors[new]:
+                predecessors[successor].discard(node)
+                predecessors[successor].add(new)
+            successors[node] = {new}
+            predecessors[new] = {node}
+        else:
+            predecessors[new], successors[new] = set(predecessors[node]), set(successors[node])
+            for predecessor in predecessors[new]:
+                successors[predecessor].add(new)
+            for successor in successors[new]:
+                predecessors[successor].add(new)
+        inner.append(new)
+    return project_table({node: sorted(preds) for node, preds in predecessors.items()}, rng)
+
+
+def fan_in_dag(n_activities: int, seed: int = 0, fan_in: int = 20) -> pd.DataFrame:
+    """
+    Generates a project network of successive high fan-in merges.
+
+    After the start activity, groups of up to `fan_in` parallel activities all depend on the last
+    merge activity and are all joined by the next merge activity. The last merge is the end of the
+    project.
+
+    :param n_activities: The number of activities (at least 3).
+    :param seed: The seed of the durations.
+    :param fan_in: The number of parallel activities joined by every merge.
+    :return: A project table (see `project_table`).
+    """
+    rng = np.random.default_rng(seed)
+    predecessors: Dict[int, List[int]] = {0: []}
+    merge, next_node = 0, 1
+    while next_node < n_activities - 1:
+        group = list(range(next_node, min(next_node + fan_in, n_activities - 1)))
+        for node in group:
+            predecessors[node] = [merge]
+        merge, next_node = group[-1] + 1, group[-1] + 2
+        predecessors[merge] = group
+    while len(predecessors) < max(n_activities, 3):
+        # A single activity left (or a tiny network): the project ends with a short chain
+        predecessors[len(predecessors)] = [merge]
+        merge = len(predecessors) - 1
+    return project_table(predecessors, rng)
+
+
+def project_table(predecessors: Dict[int, List[int]], rng: np.random.Generator) -> pd.DataFrame:
+    """
+    Builds the activity table of a synthetic network, in the layout of the project sheets.
+
+    Activity i gets the code 'A<i>'. The three-point durations are whole days: Min. in [1, 5],
+    Mode up to 3 days above it and Max. up to 5 days above the mode.
+
+    :param predecessors: The predecessors of every activity (by number).
+    :param rng: The random generator of the durations.
+    :return: A DataFrame with the columns 'Code', 'Task Name', 'Predecessors', 'Min.', 'Mode' and 'Max.'.
+    """
+    nodes = sorted(predecessors)
+    low = rng.integers(1, 6, size=len(nodes))
+    mode = low + rng.integers(0, 4, size=len(nodes))
+    high = mode + rng.integers(0, 6, size=len(nodes))
+    return pd.DataFrame({
+        "Code": [f"A{node}" for node in nodes],
+        "Task Name": [f"Activity {node}" for node in nodes],
+        "Predecessors": [",".join(f"A{p}" for p in predecessors[node]) or "-" for node in nodes],
+        "Min.": low.astype(float),
+        "Mode": mode.astype(float),
+        "Max.": high.astype(float),
+    })
+
+
+GENERATORS: Dict[str, Callable[..., pd.DataFrame]] = {
+    "layered": layered_dag,
+    "series_parallel": series_parallel_dag,
+    "fan_in": fan_in_dag,
+}
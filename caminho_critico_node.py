@@ -1,91 +1,302 @@
-from collections import defaultdict, deque
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Iterable, List, Optional, Union
 
+import numpy as np
+import pandas as pd
 
-def max_path_dag_node_weights(graph: Dict[Any, List[Any]], node_weights: Dict[Any, float], start: Any, end: Any) -> Union[Dict[str, Any], str]:
+from compiled_schedule import CompiledSchedule
+from profiling import profiled, record_details
+
+
+def max_path_dag_node_weights(graph: Union[Dict[Any, List[Any]], CompiledSchedule], node_weights: Dict[Any, float], start: Any, end: Any) -> Union[Dict[str, Any], str]:
     """
     Calculates the longest path in a Directed Acyclic Graph (DAG) with weights on the nodes.
 
     This algorithm is suitable for finding the critical path in project networks where activities
     are represented as nodes and their durations as node weights. It uses topological sorting
     to process nodes in a linear order, ensuring that all paths to a node are calculated
-    before processing the node itself.
+    before processing the node itself. When a `CompiledSchedule` is given, its cached
+    topological order is reused and only the relaxation pass is executed.
 
-    :param graph: A dictionary representing the DAG, where keys are nodes and values are lists of their successors.
+    :param graph: A dictionary representing the DAG, where keys are nodes and values are lists of their successors,
+                  a NetworkX DiGraph or a `CompiledSchedule`.
     :param node_weights: A dictionary mapping each node to its corresponding weight (e.g., duration).
     :param start: The starting node for the path search.
     :param end: The ending node for the path search.
     :return: A dictionary containing the total weight ('peso_total') and the path ('caminho') as a list of nodes,
              or a string message if no path exists from start to end.
+    :raises ValueError: If the graph contains a cycle.
     """
-    # Topological Sort
-    in_degree = defaultdict(int)
-    topo_order = []
-    queue = deque()
-
-    for u in graph:
-        for v in graph[u]:
-            in_degree[v] += 1
-
-    for u in graph:
-        if in_degree[u] == 0:
-            queue.append(u)
-
-    while queue:
-        u = queue.popleft()
-        topo_order.append(u)
-        for v in graph[u]:
-            in_degree[v] -= 1
-            if in_degree[v] == 0:
-                queue.append(v)
+    schedule = graph if isinstance(graph, CompiledSchedule) else CompiledSchedule.from_graph(graph)
+    nodes = schedule.nodes
+    weights = [node_weights[node] for node in nodes]
+    indptr = schedule.succ_indptr.tolist()
+    indices = schedule.succ_indices.tolist()
 
     # Initialization
-    dist = {u: -float('inf') for u in graph}
-    prev = {u: None for u in graph}
-    dist[start] = node_weights[start]
+    dist = [-float('inf')] * len(nodes)
+    prev = [None] * len(nodes)
+    s = schedule.index[start]
+    dist[s] = weights[s]
 
     # Relaxation step
-    for u in topo_order:
-        for v in graph[u]:
-            if dist[v] < dist[u] + node_weights[v]:
-                dist[v] = dist[u] + node_weights[v]
+    for u in schedule.topo_order.tolist():
+        for v in indices[indptr[u]:indptr[u + 1]]:
+            if dist[v] < dist[u] + weights[v]:
+                dist[v] = dist[u] + weights[v]
                 prev[v] = u
 
     # Path reconstruction
     path = []
-    current = end
-    if dist[end] == -float('inf'):
+    current = schedule.index[end]
+    if dist[current] == -float('inf'):
         return f"No path from {start} to {end}."
 
     while current is not None:
-        path.append(current)
+        path.append(nodes[current])
         current = prev[current]
 
     path.reverse()
 
     return {
-        "peso_total": dist[end],
+        "peso_total": dist[schedule.index[end]],
         "caminho": path
     }
 
-# Example of a directed graph
-# Example usage
-graph = {
-    'A': ['B', 'C'],
-    'B': ['D'],
-    'C': ['D'],
-    'D': []
-}
-
-node_weights = {
-    'A': 2,
-    'B': 3,
-    'C': 4,
-    'D': 5
-}
-
-start_node = 'A'
-end_node = 'D'
-
-result = max_path_dag_node_weights(graph, node_weights, start_node, end_node)
-print(result)
+
+@profiled("critical_path")
+def max_path_dag_node_weights_batch(graph: Union[Dict[Any, List[Any]], CompiledSchedule], samples: Union[pd.DataFrame, np.ndarray], start: Any, end: Any, nodes: Optional[List[Any]] = None, previous: Optional[Dict[str, Any]] = None, changed: Optional[Iterable[Any]] = None) -> Union[Dict[str, Any], str]:
+    """
+    Calculates the longest path of a node-weighted DAG for many weight scenarios at once.
+
+    This is the vectorized counterpart of `max_path_dag_node_weights`. The topological order is
+    taken from the `CompiledSchedule` (compiled on the fly for dicts and DiGraphs) and each node is
+    relaxed once for all samples, pulling the best predecessor with a NumPy `argmax` over the sample
+    axis. Ties are broken exactly as in the scalar version (the predecessor that comes first in the
+    topological order wins).
+
+    With `previous` (the result of an earlier call on the same graph, start and end) and `changed`
+    (the nodes whose weights differ since then), only the changed nodes and their descendants are
+    relaxed again; the other columns are copied from `previous`.
+
+    :param graph: A dictionary representing the DAG, where keys are nodes and values are lists of their successors,
+                  a NetworkX DiGraph or a `CompiledSchedule`.
+    :param samples: A 2D array of shape (n_samples, n_activities) with the node weights of each scenario,
+                    as returned by `generate_samples`. If a DataFrame is given, its columns are the nodes.
+    :param start: The starting node for the path search.
+    :param end: The ending node for the path search.
+    :param nodes: The node represented by each column of `samples`. Required when `samples` is an ndarray.
+    :param previous: The result of an earlier call to update incrementally (needs 'distancia' and 'predecessor').
+    :param changed: The nodes whose weights changed since `previous`. Required with `previous`.
+    :return: A dictionary containing the total weight of every sample ('peso_total', shape (n_samples,)),
+             the longest path weight from start to every node ('distancia', shape (n_samples, n_nodes),
+             -inf if unreachable), the best predecessor of every node in every sample ('predecessor',
+             shape (n_samples, n_nodes), indices into 'nodes' with -1 meaning no predecessor) and the
+             node order ('nodes'), or a string message if no path exists from start to end.
+    :raises ValueError: If the graph contains a cycle.
+    """
+    schedule = graph if isinstance(graph, CompiledSchedule) else CompiledSchedule.from_graph(graph)
+    weights = _weights_matrix(schedule, samples, nodes)
+    record_details(samples=weights.shape[0], activities=weights.shape[1])
+
+    # Initialization
+    n_samples = weights.shape[0]
+    s = schedule.index[start]
+    if previous is None:
+        dist = np.full((n_samples, len(schedule)), -np.inf)
+        prev = np.full((n_samples, len(schedule)), -1, dtype=np.intp)
+        order = schedule.topo_order
+    else:
+        dist = np.array(previous["distancia"], dtype=float)
+        prev = np.array(previous["predecessor"], dtype=np.intp)
+        order = schedule.downstream(changed)
+    dist[:, s] = weights[:, s]
+
+    # Relaxation step (one vectorized pull per node, predecessors already in topological order)
+    indptr, indices = schedule.pred_indptr, schedule.pred_indices
+    for v in order:
+        pred_cols = indices[indptr[v]:indptr[v + 1]]
+        if v == s or len(pred_cols) == 0:
+            continue
+        pred_dist = dist[:, pred_cols]
+        best = np.argmax(pred_dist, axis=1)
+        best_dist = pred_dist[np.arange(n_samples), best]
+        reachable = best_dist > -np.inf
+        dist[:, v] = np.where(reachable, best_dist + weights[:, v], -np.inf)
+        prev[:, v] = np.where(reachable, pred_cols[best], -1)
+
+    e = schedule.index[end]
+    if np.all(dist[:, e] == -np.inf):
+        return f"No path from {start} to {end}."
+
+    return {
+        "peso_total": dist[:, e],
+        "distancia": dist,
+        "predecessor": prev,
+        "nodes": schedule.nodes
+    }
+
+
+@profiled("earliest_finish")
+def earliest_finish_batch(graph: Union[Dict[Any, List[Any]], CompiledSchedule], samples: Union[pd.DataFrame, np.ndarray], nodes: Optional[List[Any]] = None, previous: Optional[np.ndarray] = None, changed: Optional[Iterable[Any]] = None) -> np.ndarray:
+    """
+    Calculates the earliest finish time of every activity for many duration scenarios at once.
+
+    Activities without predecessors start at time 0 and every other activity starts when its last
+    predecessor finishes, so the earliest finish of an end activity is the project makespan over
+    all the start activities (not only from a chosen start node, as in `max_path_dag_node_weights_batch`).
+    With `previous` and `changed`, only the changed activities and their descendants are recomputed.
+
+    :param graph: A dictionary representing the DAG, where keys are nodes and values are lists of their successors,
+                  a NetworkX DiGraph or a `CompiledSchedule`.
+    :param samples: A 2D array of shape (n_samples, n_activities) with the durations of each scenario.
+                    If a DataFrame is given, its columns are the nodes.
+    :param nodes: The node represented by each column of `samples`. Required when `samples` is an ndarray.
+    :param previous: The earliest finish times of an earlier call on the same graph, to update incrementally.
+    :param changed: The activities whose durations changed since `previous`. Required with `previous`.
+    :return: An array of shape (n_samples, n_nodes) with the earliest finish times, columns in the
+             node order of the schedule (`schedule.nodes`).
+    """
+    schedule = graph if isinstance(graph, CompiledSchedule) else CompiledSchedule.from_graph(graph)
+    weights = _weights_matrix(schedule, samples, nodes)
+    record_details(samples=weights.shape[0], activities=weights.shape[1])
+
+    if previous is None:
+        finish, order = np.empty_like(weights), schedule.topo_order
+    else:
+        finish, order = np.array(previous, dtype=float), schedule.downstream(changed)
+    indptr, indices = schedule.pred_indptr, schedule.pred_indices
+    for v in order:
+        pred_cols = indices[indptr[v]:indptr[v + 1]]
+        start = finish[:, pred_cols].max(axis=1) if len(pred_cols) else 0.0
+        finish[:, v] = start + weights[:, v]
+    return finish
+
+
+@profiled("cpm")
+def cpm_batch(graph: Union[Dict[Any, List[Any]], CompiledSchedule], samples: Union[pd.DataFrame, np.ndarray], nodes: Optional[List[Any]] = None, tolerance: float = 1e-9) -> Dict[str, Any]:
+    """
+    Runs the Critical Path Method (forward and backward pass) for many duration scenarios at once.
+
+    The forward pass is `earliest_finish_batch`. The backward pass walks the reverse topological
+    order with one vectorized `min` over the successors of every activity: activities without
+    successors must finish by the project makespan (the latest earliest finish of the scenario) and
+    every other activity by the earliest latest start of its successors. An activity is critical in
+    a scenario when its total float is zero (within `tolerance` times the makespan, to absorb
+    floating point round-off), and its criticality index is the fraction of scenarios where it is critical.
+
+    :param graph: A dictionary representing the DAG, where keys are nodes and values are lists of their successors,
+                  a NetworkX DiGraph or a `CompiledSchedule`.
+    :param samples: A 2D array of shape (n_samples, n_activities) with the durations of each scenario.
+                    If a DataFrame is given, its columns are the nodes.
+    :param nodes: The node represented by each column of `samples`. Required when `samples` is an ndarray.
+    :param tolerance: The relative tolerance below which a total float counts as zero.
+    :return: A dictionary with the (n_samples, n_nodes) matrices of earliest start ('es'), earliest
+             finish ('ef'), latest start ('ls'), latest finish ('lf') and total float ('total_float'),
+             the makespan of every sample ('makespan'), the criticality index of every node
+             ('criticality_index', shape (n_nodes,)) and the node order ('nodes', `schedule.nodes`).
+    """
+    schedule = graph if isinstance(graph, CompiledSchedule) else CompiledSchedule.from_graph(graph)
+    weights = _weights_matrix(schedule, samples, nodes)
+    record_details(samples=weights.shape[0], activities=weights.shape[1])
+    ef = earliest_finish_batch(schedule, weights, nodes=schedule.nodes)
+    makespan = ef.max(axis=1)
+
+    lf = np.empty_like(ef)
+    indptr, indices = schedule.succ_indptr, schedule.succ_indices
+    for v in schedule.topo_order[::-1]:
+        succ_cols = indices[indptr[v]:indptr[v + 1]]
+        lf[:, v] = (lf[:, succ_cols] - weights[:, succ_cols]).min(axis=1) if len(succ_cols) else makespan
+
+    total_float = lf - ef
+    critical = total_float <= tolerance * np.maximum(np.abs(makespan), 1)[:, None]
+    # Critical activities have no float at all: LF = EF and LS = ES, without round-off
+    total_float[critical] = 0.0
+    lf[critical] = ef[critical]
+    return {
+        "es": ef - weights,
+        "ef": ef,
+        "ls": lf - weights,
+        "lf": lf,
+        "total_float": total_float,
+        "makespan": makespan,
+        "criticality_index": critical.mean(axis=0),
+        "nodes": schedule.nodes
+    }
+
+
+def cpm_summary(cpm_result: Dict[str, Any]) -> pd.DataFrame:
+    """
+    Summarizes the output of `cpm_batch` with one row per activity.
+
+    :param cpm_result: The dictionary returned by `cpm_batch`.
+    :return: A DataFrame with the columns 'Code', 'Criticality index', 'Mean total float', 'Mean ES',
+             'Mean EF', 'Mean LS' and 'Mean LF', sorted by decreasing criticality index.
+    """
+    return pd.DataFrame({
+        "Code": cpm_result["nodes"],
+        "Criticality index": cpm_result["criticality_index"],
+        "Mean total float": cpm_result["total_float"].mean(axis=0),
+        "Mean ES": cpm_result["es"].mean(axis=0),
+        "Mean EF": cpm_result["ef"].mean(axis=0),
+        "Mean LS": cpm_result["ls"].mean(axis=0),
+        "Mean LF": cpm_result["lf"].mean(axis=0),
+    }).sort_values("Criticality index", ascending=False, kind="stable", ignore_index=True)
+
+
+def _weights_matrix(schedule: CompiledSchedule, samples: Union[pd.DataFrame, np.ndarray], nodes: Optional[List[Any]]) -> np.ndarray:
+    """Returns the sample matrix with its columns in the node order of `schedule`."""
+    if isinstance(samples, pd.DataFrame):
+        nodes = list(samples.columns)
+        samples = samples.to_numpy(dtype=float)
+    elif nodes is None:
+        raise ValueError("The 'nodes' argument is required when samples is not a DataFrame.")
+    weights = np.asarray(samples, dtype=float)
+    if list(nodes) == schedule.nodes:
+        return weights
+    column = {node: j for j, node in enumerate(nodes)}
+    return weights[:, [column[node] for node in schedule.nodes]]
+
+
+def batch_critical_path(batch_result: Dict[str, Any], sample: int, end: Any) -> List[Any]:
+    """
+    Rebuilds the critical path of a single sample from the output of `max_path_dag_node_weights_batch`.
+
+    :param batch_result: The dictionary returned by `max_path_dag_node_weights_batch`.
+    :param sample: The row (sample index) whose path should be rebuilt.
+    :param end: The ending node used in the batch computation.
+    :return: The path as a list of nodes, from the start node to `end`.
+    """
+    nodes = batch_result["nodes"]
+    prev = batch_result["predecessor"][sample]
+    path = []
+    current = nodes.index(end)
+    while current != -1:
+        path.append(nodes[current])
+        current = prev[current]
+
+    path.reverse()
+    return path
+
+
+if __name__ == "__main__":
+    # Example of a directed graph
+    # Example usage
+    graph = {
+        'A': ['B', 'C'],
+        'B': ['D'],
+        'C': ['D'],
+        'D': []
+    }
+
+    node_weights = {
+        'A': 2,
+        'B': 3,
+        'C': 4,
+        'D': 5
+    }
+
+    start_node = 'A'
+    end_node = 'D'
+
+    result = max_path_dag_node_weights(graph, node_weights, start_node, end_node)
+    print(result)
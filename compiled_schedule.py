@@ -0,0 +1,178 @@
+from collections import deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+
+class CompiledSchedule:
+    """
+    Integer-indexed, immutable representation of a project network.
+
+    The activity sheet (or any graph) is parsed a single time into CSR (compressed sparse row)
+    predecessor and successor arrays, and the topological order is computed and cached together
+    with a cycle check. Path and simulation routines can then be called repeatedly on the same
+    object, paying only for the relaxation pass.
+
+    Node `i` is `nodes[i]`. The predecessors of node `i` are
+    `pred_indices[pred_indptr[i]:pred_indptr[i + 1]]` (sorted by topological position) and its
+    successors are `succ_indices[succ_indptr[i]:succ_indptr[i + 1]]`.
+
+    :param nodes: The node identifiers (e.g., activity codes), in column order.
+    :param edges: The (predecessor, successor) pairs of the network.
+    :param labels: Optional mapping from node to a display label (e.g., the 'Task Name').
+
+    :raises ValueError: If an edge references an unknown node or the network contains a cycle.
+    """
+
+    def __init__(self, nodes: Iterable[Any], edges: Iterable[Tuple[Any, Any]], labels: Optional[Dict[Any, Any]] = None):
+        self.nodes = list(nodes)
+        self.index = {node: i for i, node in enumerate(self.nodes)}
+        if len(self.index) != len(self.nodes):
+            raise ValueError("Duplicated node identifiers in the project network.")
+        self.labels = dict(labels) if labels is not None else {node: node for node in self.nodes}
+
+        n_nodes = len(self.nodes)
+        successors = [[] for _ in range(n_nodes)]
+        for u, v in edges:
+            for node in (u, v):
+                if node not in self.index:
+                    raise ValueError(f"Predecessor '{node}' is not an activity of the project.")
+            if self.index[v] not in successors[self.index[u]]:
+                successors[self.index[u]].append(self.index[v])
+
+        # Topological Sort (Kahn), following node order so ties behave like the dict-based version
+        in_degree = np.zeros(n_nodes, dtype=np.intp)
+        for succ in successors:
+            for v in succ:
+                in_degree[v] += 1
+        queue = deque(i for i in range(n_nodes) if in_degree[i] == 0)
+        topo_order = []
+        while queue:
+            u = queue.popleft()
+            topo_order.append(u)
+            for v in successors[u]:
+                in_degree[v] -= 1
+                if in_degree[v] == 0:
+                    queue.append(v)
+
+        if len(topo_order) != n_nodes:
+            in_cycle = [self.nodes[i] for i in range(n_nodes) if in_degree[i] > 0]
+            raise ValueError(f"The project network contains a cycle involving: {', '.join(map(str, in_cycle))}.")
+
+        self.topo_order = np.array(topo_order, dtype=np.intp)
+        self.topo_position = np.empty(n_nodes, dtype=np.intp)
+        self.topo_position[self.topo_order] = np.arange(n_nodes)
+
+        predecessors = [[] for _ in range(n_nodes)]
+        for u in topo_order:
+            for v in successors[u]:
+                predecessors[v].append(u)
+
+        self.succ_indptr, self.succ_indices = self._to_csr(successors)
+        self.pred_indptr, self.pred_indices = self._to_csr(predecessors)
+        self._successors = successors
+        self._predecessors = predecessors
+
+    @staticmethod
+    def _to_csr(adjacency: List[List[int]]) -> Tuple[np.ndarray, np.ndarray]:
+        indptr = np.zeros(len(adjacency) + 1, dtype=np.intp)
+        indptr[1:] = np.cumsum([len(a) for a in adjacency])
+        indices = np.array([v for a in adjacency for v in a], dtype=np.intp)
+        return indptr, indices
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, code_column: str = "Code", predecessors_column: str = "Predecessors", label_column: Optional[str] = "Task Name") -> "CompiledSchedule":
+        """
+        Compiles the project network from the activity sheet.
+
+        :param df: DataFrame with one row per activity. Predecessors are comma separated codes, or '-' for none.
+        :param code_column: Name of the column with the activity codes.
+        :param predecessors_column: Name of the column with the predecessor codes.
+        :param label_column: Name of the column with the activity names, or None to label nodes by code.
+        :return: The compiled schedule.
+        """
+        codes = df[code_column].tolist()
+        # One vectorized split of all predecessor lists, then one (predecessor, activity) row per edge
+        listed = df.loc[df[predecessors_column] != '-', [code_column, predecessors_column]]
+        exploded = listed.assign(**{predecessors_column: listed[predecessors_column].str.split(',')}).explode(predecessors_column)
+        edges = list(zip(exploded[predecessors_column], exploded[code_column]))
+        labels = dict(zip(codes, df[label_column])) if label_column is not None and label_column in df else None
+        return cls(codes, edges, labels)
+
+    @classmethod
+    def from_graph(cls, graph: Any) -> "CompiledSchedule":
+        """
+        Compiles a dictionary of successor lists or a NetworkX DiGraph.
+
+        :param graph: A dictionary where keys are nodes and values are lists of their successors, or a NetworkX DiGraph.
+        :return: The compiled schedule.
+        """
+        nodes = list(graph)
+        known = set(nodes)
+        for u in list(nodes):
+            for v in graph[u]:
+                if v not in known:
+                    known.add(v)
+                    nodes.append(v)
+        edges = [(u, v) for u in graph for v in graph[u]]
+        labels = None
+        if isinstance(graph, nx.DiGraph):
+            labels = {node: graph.nodes[node].get('label', node) for node in nodes}
+        return cls(nodes, edges, labels)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def predecessors(self, node: Any) -> List[Any]:
+        """Returns the direct predecessors of `node`, in topological order."""
+        return [self.nodes[i] for i in self._predecessors[self.index[node]]]
+
+    def successors(self, node: Any) -> List[Any]:
+        """Returns the direct successors of `node`."""
+        return [self.nodes[i] for i in self._successors[self.index[node]]]
+
+    @property
+    def sources(self) -> List[Any]:
+        """Nodes without predecessors."""
+        return [self.nodes[i] for i in range(len(self.nodes)) if self.pred_indptr[i] == self.pred_indptr[i + 1]]
+
+    @property
+    def sinks(self) -> List[Any]:
+        """Nodes without successors."""
+        return [self.nodes[i] for i in range(len(self.nodes)) if self.succ_indptr[i] == self.succ_indptr[i + 1]]
+
+    def topological_nodes(self) -> List[Any]:
+        """Returns the node identifiers in the cached topological order."""
+        return [self.nodes[i] for i in self.topo_order]
+
+    def downstream(self, nodes: Iterable[Any]) -> np.ndarray:
+        """
+        Returns the indices of `nodes` and of all their descendants, in topological order.
+
+        These are the only nodes whose forward-pass values change when the durations of `nodes` change.
+        """
+        affected = np.zeros(len(self.nodes), dtype=bool)
+        stack = [self.index[node] for node in nodes]
+        while stack:
+            u = stack.pop()
+            if not affected[u]:
+                affected[u] = True
+                stack.extend(self._successors[u])
+        return self.topo_order[affected[self.topo_order]]
+
+    def to_networkx(self) -> nx.DiGraph:
+        """
+        Builds the NetworkX DiGraph used for drawing, with a 'label' attribute on every node.
+
+        :return: A left-to-right NetworkX DiGraph of the project.
+        """
+        G = nx.DiGraph()
+        G.graph['graph'] = {'rankdir': 'LR'}
+        for node in self.nodes:
+            G.add_node(node, label=self.labels.get(node, node))
+        for u, succ in enumerate(self._successors):
+            for v in succ:
+                G.add_edge(self.nodes[u], self.nodes[v])
+        return G
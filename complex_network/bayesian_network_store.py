@@ -0,0 +1,65 @@
+from typing import Optional
+
+import pandas as pd
+from pgmpy.models import DiscreteBayesianNetwork
+
+from complex_network.create_bayesian_network import build_generic_bayesian_network, update_bayesian_network
+from compiled_schedule import CompiledSchedule
+from simulation_cache import SimulationCache
+
+# Bump when the network construction changes, so models built by older code are not reused
+NETWORK_VERSION = 3
+
+
+def bayesian_network_key(schedule: CompiledSchedule, discretization_params: dict, compact: bool = False) -> str:
+    """
+    Builds the store key of a project network.
+
+    The key depends only on what determines the model: the precedence structure of the project
+    and the discretized duration states and probabilities of every activity. Activity names, raw
+    samples or unrelated sheet columns do not change it.
+
+    :param schedule: The `CompiledSchedule` of the project.
+    :param discretization_params: A dictionary with discretized duration data for each activity.
+    :param compact: Whether the completion time nodes use `DeterministicCPD`.
+    :return: A hexadecimal key.
+    """
+    structure = [(code, tuple(schedule.predecessors(code))) for code in schedule.nodes]
+    durations = [
+        (code, tuple(discretization_params[code]['labels']), tuple(discretization_params[code]['probs']))
+        for code in schedule.nodes
+    ]
+    return SimulationCache.make_key("bayesian_network", NETWORK_VERSION, compact, structure, durations)
+
+
+def load_or_build_bayesian_network(project_df: pd.DataFrame, discretization_params: dict, schedule: CompiledSchedule = None, cache: Optional[SimulationCache] = None, compact: bool = False, previous: Optional[DiscreteBayesianNetwork] = None) -> DiscreteBayesianNetwork:
+    """
+    Returns the project's Bayesian Network from the local store, building and storing it on a miss.
+
+    The `DiscreteBayesianNetwork` and all its CPDs are pickled in a `SimulationCache`, keyed by
+    `bayesian_network_key`, so a project that has already been built loads in milliseconds in any
+    session or process. On a miss, a `previous` network of the same project (e.g., before an edit of
+    some durations) is updated with `update_bayesian_network` instead of built from scratch.
+
+    :param project_df: A DataFrame containing project data, including 'Code' and 'Predecessors' columns.
+    :param discretization_params: A dictionary with discretized duration data for each activity.
+    :param schedule: The `CompiledSchedule` of the project. If omitted, it is compiled from `project_df`.
+    :param cache: The store to use. Defaults to a `SimulationCache` in the default directory.
+    :param compact: Whether the completion time nodes use `DeterministicCPD` (see `build_generic_bayesian_network`).
+    :param previous: A network built with the same precedence structure and `compact` setting, to
+                     rebuild only the CPDs that changed.
+
+    :return: A `pgmpy.DiscreteBayesianNetwork` model representing the project, with all CPDs defined.
+    """
+    if schedule is None:
+        schedule = CompiledSchedule.from_dataframe(project_df)
+    if cache is None:
+        cache = SimulationCache()
+    key = bayesian_network_key(schedule, discretization_params, compact)
+
+    def build() -> DiscreteBayesianNetwork:
+        if previous is not None:
+            return update_bayesian_network(previous, discretization_params, schedule, compact)
+        return build_generic_bayesian_network(project_df, discretization_params, schedule, compact)
+
+    return cache.get_object(key, "model", build)
@@ -0,0 +1,197 @@
+from collections import Counter
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+from scipy import signal
+
+from compiled_schedule import CompiledSchedule
+
+# A PMF on consecutive integer days: (first day, probabilities)
+Pmf = Tuple[int, np.ndarray]
+
+# Above this many output points the sum of two PMFs is computed with FFT instead of direct convolution
+FFT_THRESHOLD = 4096
+
+_SOURCE = object()
+
+
+class _Merge(frozenset):
+    """Zero-duration node that stands for the common completion time of a shared set of predecessors."""
+
+
+def _from_params(params: dict) -> Pmf:
+    """Converts discretization parameters ('labels', 'probs') into a dense PMF on consecutive days."""
+    labels = np.asarray(params['labels'], dtype=int)
+    probs = np.asarray(params['probs'], dtype=float)
+    pmf = np.zeros(labels.max() - labels.min() + 1)
+    np.add.at(pmf, labels - labels.min(), probs)
+    return int(labels.min()), pmf / pmf.sum()
+
+
+def _trim(pmf: Pmf) -> Pmf:
+    """Removes the zero-probability days at both ends (including FFT round-off)."""
+    offset, probs = pmf
+    probs = np.where(probs > 1e-15, probs, 0.0)
+    nonzero = np.flatnonzero(probs)
+    probs = probs[nonzero[0]:nonzero[-1] + 1]
+    return offset + int(nonzero[0]), probs / probs.sum()
+
+
+def _add(a: Pmf, b: Pmf) -> Pmf:
+    """PMF of the sum of two independent variables (convolution)."""
+    if a[1].size + b[1].size - 1 > FFT_THRESHOLD and min(a[1].size, b[1].size) > 1:
+        probs = signal.fftconvolve(a[1], b[1])
+    else:
+        probs = np.convolve(a[1], b[1])
+    return _trim((a[0] + b[0], probs))
+
+
+def _max(pmfs: Iterable[Pmf]) -> Pmf:
+    """PMF of the maximum of independent variables (product of CDFs)."""
+    pmfs = list(pmfs)
+    if len(pmfs) == 1:
+        return pmfs[0]
+    low = max(offset for offset, _ in pmfs)
+    high = max(offset + probs.size - 1 for offset, probs in pmfs)
+    days = np.arange(low, high + 1)
+    cdf = np.ones(days.size)
+    for offset, probs in pmfs:
+        cumulative = np.cumsum(probs)
+        cdf *= cumulative[np.clip(days - offset, 0, probs.size - 1)]
+    return _trim((low, np.diff(cdf, prepend=0.0)))
+
+
+def _dominators(predecessors: Dict[Any, list]) -> Dict[Any, Any]:
+    """Immediate dominators of the nodes of a predecessor mapping, seen from `_SOURCE`."""
+    graph = nx.DiGraph()
+    graph.add_node(_SOURCE)
+    graph.add_edges_from((pred, node) for node, preds in predecessors.items() for pred in preds)
+    return nx.immediate_dominators(graph, _SOURCE)
+
+
+def _insert_merges(predecessors: Dict[Any, list], durations: Dict[Any, Pmf]) -> Dict[Any, Any]:
+    """
+    Adds zero-duration merge nodes (in place) so that every maximum of dependent completion times is taken once.
+
+    Activities with the same set of several predecessors get one merge node for that set. Then,
+    until nothing changes, the predecessors of a merge are grouped by the branch of its immediate
+    dominator they belong to (their ancestor in the dominator tree just below it), and the groups of
+    several predecessors are merged first: they end the parallel branches of a nested block.
+
+    :param predecessors: The predecessors of each node (`[_SOURCE]` for the project start).
+    :param durations: The duration PMF of each node.
+
+    :return: The immediate dominator of each node of the augmented network.
+    """
+    def merge(preds: list) -> _Merge:
+        node = _Merge(preds)
+        predecessors.setdefault(node, list(preds))
+        durations[node] = (0, np.ones(1))
+        return node
+
+    shared = Counter(frozenset(preds) for preds in predecessors.values() if len(preds) > 1)
+    for code, preds in list(predecessors.items()):
+        if len(preds) > 1 and shared[frozenset(preds)] > 1:
+            predecessors[code] = [merge(preds)]
+
+    while True:
+        dominator = _dominators(predecessors)
+        changed = False
+        for node, preds in list(predecessors.items()):
+            if len(preds) < 2:
+                continue
+            groups: Dict[Any, list] = {}
+            for pred in preds:
+                branch = pred
+                while branch != dominator[node] and dominator[branch] != dominator[node]:
+                    branch = dominator[branch]
+                groups.setdefault(branch, []).append(pred)
+            if len(groups) > 1 and any(len(group) > 1 for group in groups.values()):
+                predecessors[node] = [merge(group) if len(group) > 1 else group[0] for group in groups.values()]
+                changed = True
+        if not changed:
+            return dominator
+
+
+def completion_time_distributions(project: Any, discretization_params: dict, correct_shared_ancestors: bool = True, start_time: int = 0, nodes: Optional[Iterable[Any]] = None) -> Dict[Any, dict]:
+    """
+    Computes the completion time distribution of the activities directly from the duration PMFs.
+
+    The propagation follows the topological order without building any CPT: the completion time of
+    an activity is `max(predecessor completion times) + own duration`, the sum is a convolution
+    (direct, or FFT for long supports) and the maximum is a product of CDFs.
+
+    A product of CDFs is only exact for independent predecessors. With `correct_shared_ancestors`,
+    zero-duration merge nodes are first added for the shared sets of predecessors and for the nested
+    parallel blocks (see `_insert_merges`), so that each maximum is taken once. Every merge is then
+    factored at its immediate dominator `d` (the last node that all its paths go through):
+    `T_m = T_d + R_d(m)`, where the completion time relative to `d` is propagated recursively inside
+    the region of `d`. On a series-parallel network this follows its decomposition, and the branches
+    of each maximum only share their dominator, so the result is exact there (checked against the
+    exact inference on the Bayesian Network by `benchmarks/run_benchmarks.py`). On other networks,
+    the remaining shared ancestors inside a region are still treated as independent (the usual
+    PERT-style approximation). Without the correction, every merge uses the plain CDF product.
+
+    :param project: The `CompiledSchedule` of the project, or its activity DataFrame.
+    :param discretization_params: A dictionary with discretized duration data for each activity
+                                  ('labels' with integer days and 'probs').
+    :param correct_shared_ancestors: Whether to factor merges at their immediate dominator.
+    :param start_time: Completion time of the project start (activities without predecessors
+                       finish at `start_time + duration`).
+    :param nodes: The activities whose distribution is returned. Defaults to all of them.
+
+    :return: A dictionary mapping each activity code to {'labels': completion days, 'probs': probabilities}.
+    """
+    schedule = project if isinstance(project, CompiledSchedule) else CompiledSchedule.from_dataframe(project)
+    durations = {code: _from_params(discretization_params[code]) for code in schedule.nodes}
+    predecessors = {code: schedule.predecessors(code) or [_SOURCE] for code in schedule.nodes}
+
+    if correct_shared_ancestors:
+        dominator = _insert_merges(predecessors, durations)
+    else:
+        dominator = {code: _SOURCE for code in schedule.nodes}
+
+    memo: Dict[Tuple[Any, Any], Pmf] = {}
+
+    def dependencies(root: Any, node: Any) -> list:
+        if node == root:
+            return []
+        preds = predecessors[node]
+        if len(preds) == 1:
+            return [(root, preds[0])]
+        if dominator[node] == root:
+            return [(root, pred) for pred in preds]
+        return [(root, dominator[node]), (dominator[node], node)]
+
+    def evaluate(root: Any, node: Any) -> Pmf:
+        if node == root:
+            return (start_time if root is _SOURCE else 0, np.ones(1))
+        preds = predecessors[node]
+        if len(preds) == 1:
+            return _add(memo[(root, preds[0])], durations[node])
+        if dominator[node] == root:
+            return _add(_max(memo[(root, pred)] for pred in preds), durations[node])
+        return _add(memo[(root, dominator[node])], memo[(dominator[node], node)])
+
+    # Memoized post-order evaluation with an explicit stack (long chains would exceed the recursion limit)
+    targets = list(nodes) if nodes is not None else schedule.topological_nodes()
+    for target in targets:
+        stack = [(_SOURCE, target)]
+        while stack:
+            key = stack[-1]
+            if key in memo:
+                stack.pop()
+                continue
+            missing = [dep for dep in dependencies(*key) if dep not in memo]
+            if missing:
+                stack.extend(missing)
+            else:
+                memo[key] = evaluate(*key)
+                stack.pop()
+
+    result = {}
+    for target in targets:
+        offset, probs = memo[(_SOURCE, target)]
+        result[target] = {'labels': list(range(offset, offset + probs.size)), 'probs': probs}
+    return result
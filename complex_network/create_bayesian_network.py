@@ -1,13 +1,28 @@
-import numpy as np
+import logging
+
 import networkx as nx
+import numpy as np
 import pandas as pd
 from pgmpy.models import DiscreteBayesianNetwork
 from pgmpy.factors.discrete import TabularCPD
 
-from complex_network.create_cpt_final import create_completion_cpt
+from complex_network.create_cpt_final import create_completion_cpt, create_start_time_cpt
+from complex_network.deterministic_cpd import DeterministicCPD
+from compiled_schedule import CompiledSchedule
+from profiling import profiled, record_details
+
+logger = logging.getLogger(__name__)
+
+
+def stored_entries(cpd: TabularCPD) -> int:
+    """Returns the number of values a CPD keeps in memory (one target per parent configuration for a compact `DeterministicCPD`)."""
+    if isinstance(cpd, DeterministicCPD) and cpd.targets is not None:
+        return int(cpd.targets.size)
+    return int(np.prod(cpd.cardinality, dtype=np.int64))
 
 
-def build_generic_bayesian_network(project_df: pd.DataFrame, discretization_params: dict) -> DiscreteBayesianNetwork:
+@profiled("build_bayesian_network")
+def build_generic_bayesian_network(project_df: pd.DataFrame, discretization_params: dict, schedule: CompiledSchedule = None, compact: bool = False) -> DiscreteBayesianNetwork:
     """
     Builds a generic Bayesian Network for project planning based on activity dependencies and durations.
 
@@ -19,60 +34,192 @@ def build_generic_bayesian_network(project_df: pd.DataFrame, discretization_para
     activity ('T_node') depends on its own duration ('D_node') and the completion times of all its
     predecessors ('T_predecessor').
 
+    Activities without predecessors start at day 0. Every time node has its own range of days,
+    from its earliest to its latest reachable value (see `completion_time_ranges`), so the tables
+    only hold reachable states and no completion time is clipped.
+
+    To keep the CPT sizes linear in the number of predecessors, an activity with k > 1 predecessors gets
+    k - 1 intermediate start time nodes that combine them pairwise through max ('S_node_1', ...,
+    'S_node', see `start_time_chain`). 'T_node' then depends only on 'S_node' and 'D_node', so no CPT has
+    more than three dimensions, and the marginals are identical to a single k + 1 dimensional CPT.
+
     :param project_df: A DataFrame containing project data, including 'Code' and 'Predecessors' columns.
     :param discretization_params: A dictionary with discretized duration data for each activity.
                                   Each entry should contain 'labels' (the possible duration values) and
                                   'probs' (their corresponding probabilities).
+    :param schedule: The `CompiledSchedule` of the project. If omitted, it is compiled from `project_df`.
+    :param compact: If True, completion time nodes get a `DeterministicCPD` (one target state per parent
+                    configuration) instead of a dense table. Use `DeterministicVariableElimination` to
+                    query such models without materializing the tables.
 
     :return: A `pgmpy.DiscreteBayesianNetwork` model representing the project, with all CPDs defined.
     """
-    dependency_graph = nx.DiGraph()
-    for _, row in project_df.iterrows():
-        if row['Predecessors'] != '-':
-            for pred in row['Predecessors'].split(','):
-                dependency_graph.add_edge(pred, row['Code'])
-    
-    # Estimate the number of completion states required (sum of maximum durations on the longest path)
-    max_duration_sum = 0
-    if dependency_graph.nodes:
-        path = nx.dag_longest_path(dependency_graph)
-        max_duration_sum = sum(max(params['labels']) for code, params in discretization_params.items() if code in path) # type: ignore
-    
-    # Add a buffer to the number of states to avoid out-of-bounds issues
-    num_completion_states = max_duration_sum + 5
-    completion_labels = list(range(num_completion_states))
-    print(f"\nCreating {num_completion_states} completion states (days) to cover all possibilities.\n")
-
-    bayesian_model = DiscreteBayesianNetwork()
-    for _, row in project_df.iterrows():
-        activity_code = row['Code']
-        bayesian_model.add_edge(f"D_{activity_code}", f"T_{activity_code}")
-        if row['Predecessors'] != '-':
-            for pred in row['Predecessors'].split(','):
-                bayesian_model.add_edge(f"T_{pred}", f"T_{activity_code}")
+    if schedule is None:
+        schedule = CompiledSchedule.from_dataframe(project_df)
+
+    # Each completion time node gets only the days it can actually reach
+    completion_ranges = completion_time_ranges(schedule, discretization_params)
+    completion_labels = {node: list(range(low, high + 1)) for node, (low, high) in completion_ranges.items()}
+    total_states = sum(len(labels) for labels in completion_labels.values())
+    logger.info("Creating %d completion states over %d time nodes (days).", total_states, len(completion_labels),
+                extra={"completion_states": total_states, "time_nodes": len(completion_labels)})
+
+    edges, start_time_nodes = network_edges(schedule)
+    bayesian_model = DiscreteBayesianNetwork(edges)
 
     # First, create and add all duration CPDs (prior probabilities)
-    duration_cpds = []
-    for _, row in project_df.iterrows():
-        activity_code = row['Code']
-        params = discretization_params[activity_code]
-        d_node = f"D_{activity_code}"
-        prior_probs_array = np.array(params['probs']).reshape(len(params['labels']), 1)
-        
-        cpd_d = TabularCPD(variable=d_node, variable_card=len(params['labels']), 
-                           values=prior_probs_array, state_names={d_node: params['labels']})
-        duration_cpds.append(cpd_d)
-    
-    bayesian_model.add_cpds(*duration_cpds)
+    bayesian_model.add_cpds(*[_duration_cpd(activity_code, discretization_params[activity_code]) for activity_code in schedule.nodes])
 
     # Then, create and add all completion time CPDs
-    completion_cpds = []
-    for _, row in project_df.iterrows():
-        activity_code = row['Code']
-        cpd_t = create_completion_cpt(bayesian_model, activity_code, num_completion_states, completion_labels, discretization_params)
+    completion_cpds = [
+        create_start_time_cpt(bayesian_model, node, completion_labels, compact)
+        for node in start_time_nodes
+    ]
+    for activity_code in schedule.nodes:
+        cpd_t = create_completion_cpt(bayesian_model, activity_code, completion_labels, discretization_params, compact)
         completion_cpds.append(cpd_t)
         
     bayesian_model.add_cpds(*completion_cpds)
 
-    print(f"Is the model valid? {bayesian_model.check_model()}\n")
+    valid = bayesian_model.check_model()
+    cpds = bayesian_model.get_cpds()
+    record_details(cpds=len(cpds), completion_states=total_states, cpt_entries=sum(stored_entries(cpd) for cpd in cpds),
+                   largest_cpt=max(stored_entries(cpd) for cpd in cpds))
+    logger.info("Built a Bayesian Network with %d CPDs (valid: %s).", len(cpds), valid, extra={"cpds": len(cpds), "compact": compact})
     return bayesian_model
+
+
+@profiled("update_bayesian_network")
+def update_bayesian_network(model: DiscreteBayesianNetwork, discretization_params: dict, schedule: CompiledSchedule, compact: bool = False) -> DiscreteBayesianNetwork:
+    """
+    Builds the network of new duration distributions from the network of an earlier run.
+
+    Only the CPDs that differ are rebuilt: the 'D_' priors whose states or probabilities changed
+    and the time nodes ('S_' and 'T_') whose own range of days or whose parents' states changed
+    (see `completion_time_ranges`). A deterministic CPD only depends on those state lists, so the
+    CPDs of all the other nodes are shared with `model`, which is left untouched.
+
+    :param model: The network of the earlier run, built with `build_generic_bayesian_network` for the
+                  same precedence structure and the same `compact` setting.
+    :param discretization_params: A dictionary with the new discretized duration data of each activity.
+    :param schedule: The `CompiledSchedule` of the project.
+    :param compact: Whether the completion time nodes use `DeterministicCPD`.
+
+    :return: A new `pgmpy.DiscreteBayesianNetwork` with all CPDs defined.
+    :raises ValueError: If the precedence structure of `model` differs from `schedule`.
+    """
+    edges, _ = network_edges(schedule)
+    if set(model.edges()) != set(edges):
+        raise ValueError("The precedence structure of the project changed; build the network again.")
+
+    completion_ranges = completion_time_ranges(schedule, discretization_params)
+    completion_labels = {node: list(range(low, high + 1)) for node, (low, high) in completion_ranges.items()}
+    old_cpds = {cpd.variable: cpd for cpd in model.get_cpds()}
+    new_labels = dict(completion_labels)
+    new_labels.update({f"D_{code}": list(discretization_params[code]['labels']) for code in schedule.nodes})
+    relabeled = {var for var, labels in new_labels.items() if list(old_cpds[var].state_names[var]) != labels}
+
+    updated_model = DiscreteBayesianNetwork(edges)
+    cpds = []
+    for activity_code in schedule.nodes:
+        params = discretization_params[activity_code]
+        old_cpd = old_cpds[f"D_{activity_code}"]
+        same_probs = f"D_{activity_code}" not in relabeled and np.array_equal(old_cpd.get_values().ravel(), np.asarray(params['probs'], dtype=float))
+        cpds.append(old_cpd if same_probs else _duration_cpd(activity_code, params))
+    rebuilt = sum(cpd is not old_cpds[cpd.variable] for cpd in cpds)
+    updated_model.add_cpds(*cpds)
+
+    for node in nx.topological_sort(updated_model):
+        if node.startswith("D_"):
+            continue
+        if node not in relabeled and not any(parent in relabeled for parent in updated_model.predecessors(node)):
+            updated_model.add_cpds(old_cpds[node])
+        elif node.startswith("S_"):
+            updated_model.add_cpds(create_start_time_cpt(updated_model, node, completion_labels, compact))
+            rebuilt += 1
+        else:
+            updated_model.add_cpds(create_completion_cpt(updated_model, node[2:], completion_labels, discretization_params, compact))
+            rebuilt += 1
+    record_details(cpds=len(old_cpds), rebuilt_cpds=rebuilt)
+    logger.info("Updated %d of %d CPDs.", rebuilt, len(old_cpds), extra={"rebuilt_cpds": rebuilt, "cpds": len(old_cpds)})
+    return updated_model
+
+
+def network_edges(schedule: CompiledSchedule) -> tuple:
+    """
+    Lists the edges of the project network and its intermediate start time nodes.
+
+    :param schedule: The `CompiledSchedule` of the project.
+    :return: A tuple (edges, start_time_nodes): the (parent, child) pairs of the network, and the 'S_'
+             nodes in construction order.
+    """
+    edges = []
+    start_time_nodes = []
+    for activity_code in schedule.nodes:
+        edges.append((f"D_{activity_code}", f"T_{activity_code}"))
+        preds = schedule.predecessors(activity_code)
+        chain = start_time_chain(activity_code, preds)
+        for node, parents in chain:
+            edges.extend((parent, node) for parent in parents)
+            start_time_nodes.append(node)
+        if chain:
+            edges.append((chain[-1][0], f"T_{activity_code}"))
+        elif preds:
+            edges.append((f"T_{preds[0]}", f"T_{activity_code}"))
+    return edges, start_time_nodes
+
+
+def _duration_cpd(activity_code: str, params: dict) -> TabularCPD:
+    """Creates the prior CPD of the duration node of an activity from its 'labels' and 'probs'."""
+    d_node = f"D_{activity_code}"
+    prior_probs_array = np.array(params['probs']).reshape(len(params['labels']), 1)
+    return TabularCPD(variable=d_node, variable_card=len(params['labels']),
+                      values=prior_probs_array, state_names={d_node: params['labels']})
+
+
+def start_time_chain(activity_code: str, predecessors: list) -> list:
+    """
+    Lists the pairwise max nodes that combine the completion times of an activity's predecessors.
+
+    The first node is the maximum of the first two predecessors and every following node adds one
+    more predecessor, so the last node ('S_<code>') holds the start time of the activity.
+
+    :param activity_code: The code of the activity (e.g., 'F').
+    :param predecessors: The codes of its predecessors.
+
+    :return: A list of (node, [parent, parent]) pairs, empty when the activity has fewer than two predecessors.
+    """
+    chain = []
+    if len(predecessors) < 2:
+        return chain
+    previous = f"T_{predecessors[0]}"
+    for i, pred in enumerate(predecessors[1:], start=1):
+        node = f"S_{activity_code}" if i == len(predecessors) - 1 else f"S_{activity_code}_{i}"
+        chain.append((node, [previous, f"T_{pred}"]))
+        previous = node
+    return chain
+
+
+def completion_time_ranges(schedule: CompiledSchedule, discretization_params: dict) -> dict:
+    """
+    Computes the range of reachable days of every completion ('T_') and start time ('S_') node.
+
+    A forward pass in topological order over the duration bounds: an activity finishes between
+    `max(lowest predecessor completions) + min(duration)` and `max(highest predecessor completions)
+    + max(duration)`, and activities without predecessors start at day 0.
+
+    :param schedule: The `CompiledSchedule` of the project.
+    :param discretization_params: A dictionary with discretized duration data for each activity.
+
+    :return: A dictionary mapping each time node to its (lowest, highest) reachable day.
+    """
+    ranges = {}
+    for activity_code in schedule.topological_nodes():
+        preds = schedule.predecessors(activity_code)
+        for node, parents in start_time_chain(activity_code, preds):
+            ranges[node] = (max(ranges[p][0] for p in parents), max(ranges[p][1] for p in parents))
+        parents = [f"T_{pred}" for pred in preds]
+        start = (max(ranges[p][0] for p in parents), max(ranges[p][1] for p in parents)) if parents else (0, 0)
+        labels = discretization_params[activity_code]['labels']
+        ranges[f"T_{activity_code}"] = (start[0] + int(min(labels)), start[1] + int(max(labels)))
+    return ranges
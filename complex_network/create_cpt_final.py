@@ -1,71 +1,108 @@
+from functools import reduce
+
 import numpy as np
-import itertools
 from pgmpy.models import DiscreteBayesianNetwork
 from pgmpy.factors.discrete import TabularCPD
 
+from complex_network.deterministic_cpd import DeterministicCPD
+
 
-def create_completion_cpt(model: DiscreteBayesianNetwork, activity_code: str, num_completion_states: int, completion_labels: list, discretization_params: dict) -> TabularCPD:
+def create_completion_cpt(model: DiscreteBayesianNetwork, activity_code: str, completion_labels: dict, discretization_params: dict, compact: bool = False) -> TabularCPD:
     """
     Creates the Conditional Probability Table (CPT) for an activity's completion time node.
 
     The completion time of an activity (`T_node`) is determined by the maximum completion time
-    among all its predecessor activities, plus its own duration. This function builds a
-    deterministic CPT that encodes this relationship.
+    among all its predecessor activities, plus its own duration. The time parent is either the
+    single predecessor's `T_` node or the `S_` start time node that already holds that maximum.
+    Activities without predecessors start at day 0, so their completion time is their duration.
 
     For each combination of parent states (predecessor completion times and own duration),
     it calculates the resulting completion time and assigns a probability of 1 to that
-    specific state, with 0 for all others.
+    specific state, with 0 for all others. All combinations are evaluated at once with NumPy
+    broadcasting over the parent index grids, instead of iterating over them in Python.
+
+    Every time node has its own consecutive range of days (see `completion_time_ranges`), which
+    contains all the reachable values, so no combination is clipped.
 
     :param model: The `pgmpy.DiscreteBayesianNetwork` model being constructed.
     :param activity_code: The code for the current activity (e.g., 'A').
-    :param num_completion_states: The total number of discrete states for any completion time node.
-    :param completion_labels: A list of labels for the completion time states (e.g., [0, 1, 2, ...]).
+    :param completion_labels: A dictionary mapping every time node ('T_' and 'S_') to its list of
+                              consecutive day labels.
     :param discretization_params: A dictionary with discretized duration data for all activities.
+    :param compact: If True, return a `DeterministicCPD` that stores only the resulting state of each
+                    parent configuration instead of the dense 0/1 table.
 
     :return: A `pgmpy.factors.discrete.TabularCPD` object for the activity's completion time node.
     """
     t_node = f"T_{activity_code}"
     d_node = f"D_{activity_code}"
-    
+
     # Identify all parent nodes for the current completion time node (T_node)
     parents = sorted(list(model.predecessors(t_node)))
-    
-    evidence = parents
-    evidence_card = []
-    state_names = {t_node: completion_labels}
-    
-    # Filter for parents that are also completion time nodes
-    t_parents = [p for p in parents if p.startswith('T_')]
-    
+    state_names = {t_node: completion_labels[t_node]}
     for parent in parents:
-        if parent.startswith('T_'):
-            evidence_card.append(num_completion_states)
-            state_names[parent] = completion_labels
+        if parent == d_node:
+            state_names[parent] = discretization_params[activity_code]['labels']
         else:
-            # This handles the duration node (D_node)
-            parent_code = parent.split('_')[1]
-            parent_labels = discretization_params[parent_code]['labels']
-            evidence_card.append(len(parent_labels))
-            state_names[parent] = parent_labels
-            
-    # Generate all possible combinations of parent states
-    parent_state_combinations = itertools.product(*[range(card) for card in evidence_card])
-    cpt_values = np.zeros((num_completion_states, np.prod(evidence_card)))
-    
-    for col_idx, combo in enumerate(parent_state_combinations):
-        state_map = dict(zip(parents, combo))
-        t_parent_states_indices = [state_map[p] for p in t_parents]
-        # The start time is the maximum of the predecessors' completion times
-        max_of_t_parents = max(t_parent_states_indices) if t_parent_states_indices else -1
-        
-        d_state_index = state_map[d_node]
-        d_state_value = discretization_params[activity_code]['labels'][d_state_index]
-        
-        # Completion_Time = max(Predecessor_Completion_Times) + Own_Duration
-        result_state = min(max_of_t_parents + d_state_value, num_completion_states - 1)
-        
-        # This is a deterministic CPT, so the probability is 1 for the calculated state
-        cpt_values[result_state, col_idx] = 1
-        
-    return TabularCPD(variable=t_node, variable_card=num_completion_states, values=cpt_values,
-                      evidence=evidence, evidence_card=evidence_card, state_names=state_names)
\ No newline at end of file
+            # Predecessor completion ('T_') or start time ('S_') node
+            state_names[parent] = completion_labels[parent]
+
+    # Completion_Time = max(Predecessor_Completion_Times) + Own_Duration
+    duration = _parent_values(parents, state_names, d_node)
+    t_parents = [p for p in parents if p != d_node]
+    start = reduce(np.maximum, [_parent_values(parents, state_names, p) for p in t_parents]) if t_parents else 0
+    return _deterministic_cpd(t_node, start + duration, parents, state_names, compact)
+
+
+def create_start_time_cpt(model: DiscreteBayesianNetwork, node: str, completion_labels: dict, compact: bool = False) -> TabularCPD:
+    """
+    Creates the CPT of an intermediate start time node, the maximum of its (at most two) parents.
+
+    Start time nodes ('S_' nodes) split the maximum over many predecessor completion times into a
+    chain of pairwise maxima, so no CPT has more than three dimensions (see
+    `build_generic_bayesian_network`).
+
+    :param model: The `pgmpy.DiscreteBayesianNetwork` model being constructed.
+    :param node: The name of the start time node (e.g., 'S_F').
+    :param completion_labels: A dictionary mapping every time node ('T_' and 'S_') to its list of
+                              consecutive day labels.
+    :param compact: If True, return a `DeterministicCPD` instead of the dense 0/1 table.
+
+    :return: A `pgmpy.factors.discrete.TabularCPD` object for the start time node.
+    """
+    parents = sorted(list(model.predecessors(node)))
+    state_names = {var: completion_labels[var] for var in [node] + parents}
+    result = reduce(np.maximum, [_parent_values(parents, state_names, p) for p in parents])
+    return _deterministic_cpd(node, result, parents, state_names, compact)
+
+
+def _parent_values(parents: list, state_names: dict, parent: str) -> np.ndarray:
+    """
+    Places the state values of one parent on its own broadcast axis.
+
+    One axis per parent, in the same (C) order as itertools.product over the evidence cards, so
+    broadcasting evaluates every combination of parent states at once.
+    """
+    shape = [1] * len(parents)
+    shape[parents.index(parent)] = len(state_names[parent])
+    return np.asarray(state_names[parent]).reshape(shape)
+
+
+def _deterministic_cpd(variable: str, result: np.ndarray, evidence: list, state_names: dict, compact: bool) -> TabularCPD:
+    """Builds the CPD that puts probability 1 on the state of value `result` for each parent configuration."""
+    labels = state_names[variable]
+    evidence_card = [len(state_names[parent]) for parent in evidence]
+    result_state = np.broadcast_to(result - labels[0], evidence_card).ravel()
+    if result_state.min() < 0 or result_state.max() >= len(labels):
+        raise ValueError(f"The states of {variable} ({labels[0]} to {labels[-1]}) do not cover all the values of its parents.")
+
+    if compact:
+        return DeterministicCPD(variable=variable, variable_card=len(labels), targets=result_state,
+                                evidence=evidence, evidence_card=evidence_card, state_names=state_names)
+
+    # This is a deterministic CPT, so the probability is 1 for the calculated state
+    cpt_values = np.zeros((len(labels), result_state.size))
+    cpt_values[result_state, np.arange(result_state.size)] = 1
+
+    return TabularCPD(variable=variable, variable_card=len(labels), values=cpt_values,
+                      evidence=evidence, evidence_card=evidence_card, state_names=state_names)
@@ -0,0 +1,76 @@
+import numpy as np
+from pgmpy.factors.discrete import TabularCPD
+
+
+class DeterministicCPD(TabularCPD):
+    """
+    Compact CPD for a variable that is a deterministic function of its parents.
+
+    Instead of the dense 0/1 table of shape (variable_card, prod(evidence_card)), only the index of
+    the resulting state is stored for every parent configuration (`targets`), which divides the
+    memory by `variable_card`. For max-plus completion nodes (`T_x = max(T_preds) + D_x`) this is
+    exactly the information in the table.
+
+    The class is a drop-in `TabularCPD`: `values`, `get_values()` and `to_factor()` materialize the
+    dense table on demand (without keeping it), so pgmpy's model checks and inference classes keep
+    working. `DeterministicVariableElimination` uses `targets` directly and never builds the table.
+    Any in-place operation that assigns new values turns the CPD into a regular dense one.
+
+    :param variable: The name of the deterministic variable (e.g., 'T_A').
+    :param variable_card: The number of states of the variable.
+    :param targets: The state index of the variable for each parent configuration, in the same
+                    (C) order as the columns of the equivalent `TabularCPD`.
+    :param evidence: The parent variables.
+    :param evidence_card: The number of states of each parent.
+    :param state_names: The state names of the variable and its parents.
+    """
+
+    def __init__(self, variable, variable_card, targets, evidence=None, evidence_card=None, state_names={}):
+        evidence = list(evidence) if evidence is not None else []
+        evidence_card = [int(card) for card in evidence_card] if evidence_card is not None else []
+        if len(evidence) != len(evidence_card):
+            raise ValueError("Length of evidence_card doesn't match length of evidence")
+
+        targets = np.asarray(targets, dtype=np.intp).ravel()
+        if targets.size != int(np.prod(evidence_card)):
+            raise ValueError(f"targets must have one entry per parent configuration ({int(np.prod(evidence_card))}). Got {targets.size}.")
+        if targets.size and (targets.min() < 0 or targets.max() >= variable_card):
+            raise ValueError(f"targets must be state indices between 0 and {variable_card - 1}.")
+
+        self.variable = variable
+        self.variable_card = int(variable_card)
+        self.variables = [variable] + evidence
+        self.cardinality = np.array([variable_card] + evidence_card, dtype=int)
+        self.targets = targets
+        self._dense = None
+        self.store_state_names(self.variables, self.cardinality, state_names)
+
+    @property
+    def values(self):
+        if self._dense is not None:
+            return self._dense
+        dense = np.zeros((self.variable_card, self.targets.size))
+        dense[self.targets, np.arange(self.targets.size)] = 1
+        return dense.reshape(tuple(self.cardinality))
+
+    @values.setter
+    def values(self, values):
+        self._dense = values
+        self.targets = None
+
+    @property
+    def is_deterministic(self) -> bool:
+        """Whether the compact representation is still valid (no in-place change was applied)."""
+        return self.targets is not None
+
+    def is_valid_cpd(self):
+        if not self.is_deterministic:
+            return super().is_valid_cpd()
+        # Each parent configuration maps to exactly one state, so every column sums to one
+        return True
+
+    def copy(self):
+        if not self.is_deterministic:
+            return super().copy()
+        return DeterministicCPD(self.variable, self.variable_card, self.targets.copy(), self.variables[1:],
+                               self.cardinality[1:], state_names=self.state_names.copy())
@@ -0,0 +1,342 @@
+from typing import Callable, Dict, List, Optional, Tuple
+
+import networkx as nx
+import numpy as np
+from pgmpy.factors.discrete import DiscreteFactor
+from pgmpy.models import DiscreteBayesianNetwork
+from scipy import sparse
+
+from complex_network.deterministic_cpd import DeterministicCPD
+from profiling import profiled, record_details
+
+# A factor is kept as (variables, values) with one array axis per variable
+Factor = Tuple[Tuple[str, ...], np.ndarray]
+
+
+class DeterministicVariableElimination:
+    """
+    Exact variable elimination that applies `DeterministicCPD`s directly, without dense tables.
+
+    Variables are processed in the topological order with the smallest factors among a few
+    candidates (see `_elimination_order`). A regular CPD is multiplied into the pool of factors as
+    usual. A deterministic CPD `X = f(parents)` is applied as a scatter-add: the product of the
+    factors that mention its parents is pushed through `targets` into a factor over `X`, summing out
+    at the same time every parent that has no later use. Variables are summed out as soon as all
+    their children have been processed, so factors only span the current "frontier" of the network.
+    Only the ancestors of the query and evidence variables are visited.
+
+    The query interface mirrors `pgmpy.inference.VariableElimination.query` for the joint case.
+
+    :param model: A `DiscreteBayesianNetwork`, typically built with `compact=True`.
+    """
+
+    def __init__(self, model: DiscreteBayesianNetwork):
+        self.model = model
+        self.cpds = {cpd.variable: cpd for cpd in model.get_cpds()}
+        self.children = {node: list(model.successors(node)) for node in model.nodes()}
+        self.topological_position = {node: step for step, node in enumerate(nx.topological_sort(model))}
+
+    @profiled("variable_elimination")
+    def query(self, variables: List[str], evidence: Optional[Dict[str, object]] = None, show_progress: bool = False) -> DiscreteFactor:
+        """
+        Computes the joint posterior distribution of `variables` given `evidence`.
+
+        :param variables: The query variables (e.g., ['T_F']).
+        :param evidence: A dictionary mapping evidence variables to their observed state names.
+        :param show_progress: Accepted for compatibility with pgmpy; ignored.
+        :return: A normalized `DiscreteFactor` over `variables`.
+        """
+        observed = self.observed_states(variables, evidence)
+        order, last_use = self.elimination_plan(list(variables) + list(observed))
+        pool = self.eliminate(order, last_use, variables, observed)
+        return self.posterior(pool, variables)
+
+    def observed_states(self, variables: List[str], evidence: Optional[Dict[str, object]]) -> Dict[str, int]:
+        """Validates the evidence and maps every observed state name to its state index."""
+        evidence = dict(evidence or {})
+        if set(variables) & set(evidence):
+            raise ValueError("Can't have the same variables in both `variables` and `evidence`.")
+        return {var: self.cpds[var].name_to_no[var][state] for var, state in evidence.items()}
+
+    def elimination_plan(self, roots: List[str]) -> Tuple[List[str], Dict[str, int]]:
+        """
+        Computes the elimination order over the ancestors of `roots` and, for every variable, the
+        last step that uses it (the step of its last child in the order, or its own step).
+        """
+        order = self._elimination_order(roots)
+        return order, self._last_use(order)
+
+    def eliminate(self, order: List[str], last_use: Dict[str, int], variables: List[str], observed: Dict[str, int], pool: Optional[List[Factor]] = None, start: int = 0, checkpoint: Optional[Callable[[int, List[Factor]], None]] = None) -> List[Factor]:
+        """
+        Processes the variables of `order` from step `start` and returns the remaining factors.
+
+        The factors after a step only depend on the evidence of the variables processed so far,
+        so the elimination can resume from a pool saved at an earlier step.
+
+        :param order: The elimination order (see `elimination_plan`).
+        :param last_use: The last step that uses each variable (see `elimination_plan`).
+        :param variables: The query variables, which are never summed out.
+        :param observed: The state index of every evidence variable.
+        :param pool: The factors before step `start`. Defaults to none (start of the elimination).
+        :param start: The first step to process.
+        :param checkpoint: Called as `checkpoint(step, pool)` with the factors before every step that
+                           processes an evidence variable.
+        :return: The list of factors after the last step.
+        """
+        keep = set(variables)
+        pool = list(pool or [])
+        largest = max((values.size for _, values in pool), default=0)
+        for step in range(start, len(order)):
+            node = order[step]
+            if checkpoint is not None and node in observed:
+                checkpoint(step, list(pool))
+            cpd = self.cpds[node]
+            if isinstance(cpd, DeterministicCPD) and cpd.is_deterministic:
+                pool = self._push_forward(pool, cpd, observed, step, last_use, keep)
+            else:
+                pool.append(self._reduce((tuple(cpd.variables), np.asarray(cpd.values, dtype=float)), observed))
+                for parent in cpd.variables[1:]:
+                    if parent not in observed and last_use[parent] == step and parent not in keep:
+                        pool = self._sum_out(pool, parent)
+
+            if node in observed:
+                pool = [self._reduce(factor, {node: observed[node]}) for factor in pool]
+            elif last_use[node] == step and node not in keep:
+                pool = self._sum_out(pool, node)
+            largest = max(largest, max((values.size for _, values in pool), default=0))
+        record_details(eliminated=len(order) - start, largest_factor=int(largest))
+        return pool
+
+    def posterior(self, pool: List[Factor], variables: List[str]) -> DiscreteFactor:
+        """Multiplies the remaining factors into the normalized joint distribution of `variables`."""
+        keep = set(variables)
+        scope, values = self._product(pool)
+        for var in scope:
+            if var not in keep:
+                values = values.sum(axis=scope.index(var), keepdims=True)
+        values = values.reshape([self._card(var) for var in scope if var in keep])
+        scope = tuple(var for var in scope if var in keep)
+        values = np.transpose(values, [scope.index(var) for var in variables])
+        total = values.sum()
+        if total <= 0:
+            raise ValueError("The evidence has zero probability under the model.")
+
+        return DiscreteFactor(list(variables), [self._card(var) for var in variables], values / total,
+                              state_names={var: self.cpds[var].state_names[var] for var in variables})
+
+    def _elimination_order(self, roots: List[str]) -> List[str]:
+        """
+        Orders the ancestors of `roots`, keeping the candidate order with the smallest largest factor.
+
+        No single order suits every network: the depth-first order processes the branches feeding a
+        merge chain one after the other (wide fan-ins), while the greedy orders keep the bands of
+        parallel chains narrow, where the depth-first order leaves whole chains open. All of them, and
+        the plain topological order, are scored with `largest_factor`.
+        """
+        relevant = set(roots)
+        for root in roots:
+            relevant |= nx.ancestors(self.model, root)
+        candidates = [
+            self._greedy_order(roots, relevant),
+            self._greedy_order(roots, relevant, by_count=True),
+            self._depth_first_order(roots),
+            sorted(relevant, key=self.topological_position.__getitem__),
+        ]
+        return min(candidates, key=lambda order: self.largest_factor(order, set(roots)))
+
+    def _greedy_order(self, roots: List[str], relevant: set, by_count: bool = False) -> List[str]:
+        """
+        Orders the variables of `relevant` greedily, keeping the set of open variables small.
+
+        A variable is open from its step until its last child has been processed. At each step,
+        among the variables whose parents have been processed, the one that increases the product of
+        the open cardinalities the least (or closes the most) is taken, ties broken by topological
+        order. With `by_count`, the number of open variables is used instead of the product of their
+        cardinalities and ties are broken by depth-first order, which finishes one parallel block
+        before opening the next even when its variables have more states. A root with a single child
+        (a duration node) is taken together with its child.
+        """
+        keep = set(roots)
+        parents = {node: list(self.model.predecessors(node)) for node in relevant}
+        remaining = {node: sum(child in relevant for child in self.children[node]) for node in relevant}
+        log_card = {node: 1.0 if by_count else float(np.log(self._card(node))) for node in relevant}
+        if by_count:
+            tie_break = {node: step for step, node in enumerate(self._depth_first_order(roots))}
+        else:
+            tie_break = self.topological_position
+        bundled = {node for node in relevant if not parents[node] and remaining[node] == 1 and node not in keep}
+
+        def closes(parent: str) -> bool:
+            return remaining[parent] == 1 and parent not in keep
+
+        order: List[str] = []
+        processed = set()
+        ready = {node for node in relevant - bundled if all(p in bundled for p in parents[node])}
+        while ready:
+            def cost(node: str) -> tuple:
+                opened = log_card[node] if remaining[node] or node in keep else 0.0
+                closed = sum(log_card[p] for p in parents[node] if p not in bundled and closes(p))
+                return opened - closed, tie_break[node]
+
+            node = min(ready, key=cost)
+            ready.remove(node)
+            for parent in parents[node]:
+                if parent in bundled:
+                    order.append(parent)
+                    processed.add(parent)
+                remaining[parent] -= 1
+            order.append(node)
+            processed.add(node)
+            for child in self.children[node]:
+                if child in relevant and child not in processed and all(p in processed or p in bundled for p in parents[child]):
+                    ready.add(child)
+        return order
+
+    def _depth_first_order(self, roots: List[str]) -> List[str]:
+        """
+        Orders the ancestors of `roots` by a depth-first post-order over the parents.
+
+        Every node comes right after the subtrees of its parents, so the branches that feed a merge
+        (e.g., a chain of pairwise max nodes) are processed one after the other and their variables
+        are summed out before the next branch starts, instead of all being open at the same time.
+        """
+        order: List[str] = []
+        visited = set()
+        for root in roots:
+            if root in visited:
+                continue
+            stack = [(root, iter(sorted(self.model.predecessors(root))))]
+            visited.add(root)
+            while stack:
+                node, parents = stack[-1]
+                parent = next((p for p in parents if p not in visited), None)
+                if parent is None:
+                    order.append(node)
+                    stack.pop()
+                else:
+                    visited.add(parent)
+                    stack.append((parent, iter(sorted(self.model.predecessors(parent)))))
+        return order
+
+    def largest_factor(self, order: List[str], keep: set) -> int:
+        """
+        Returns the number of entries of the largest table `eliminate` would build along `order`.
+
+        The elimination is replayed on the variable sets of the factors only (no values), counting
+        the products formed before every push-forward and sum-out. Evidence is ignored, so this is
+        an upper bound.
+
+        :param order: An elimination order (e.g., from `elimination_plan`).
+        :param keep: The query variables, which are never summed out.
+        :return: The number of entries (a float-rounded integer for astronomically large tables).
+        """
+        last_use = self._last_use(order)
+        pool: List[frozenset] = []
+        largest = 0
+
+        def size(variables: set) -> int:
+            return int(np.prod([self._card(var) for var in variables], dtype=float))
+
+        def combine(pool: List[frozenset], variables: set) -> Tuple[List[frozenset], frozenset]:
+            nonlocal largest
+            involved = [factor for factor in pool if factor & variables]
+            scope = frozenset().union(*involved) | variables
+            largest = max(largest, size(scope))
+            return [factor for factor in pool if not factor & variables], scope
+
+        def sum_out(pool: List[frozenset], variable: str) -> List[frozenset]:
+            if not any(variable in factor for factor in pool):
+                return pool
+            pool, scope = combine(pool, {variable})
+            return pool + [scope - {variable}]
+
+        for step, node in enumerate(order):
+            cpd = self.cpds[node]
+            parents = set(cpd.variables[1:])
+            if isinstance(cpd, DeterministicCPD) and cpd.is_deterministic:
+                kept = {p for p in parents if last_use[p] > step or p in keep}
+                pool, scope = combine(pool, parents)
+                pool.append(scope - (parents - kept) | {node})
+                largest = max(largest, size(pool[-1]))
+            else:
+                pool.append(frozenset(cpd.variables))
+                largest = max(largest, size(pool[-1]))
+                for parent in parents:
+                    if last_use[parent] == step and parent not in keep:
+                        pool = sum_out(pool, parent)
+            if last_use[node] == step and node not in keep:
+                pool = sum_out(pool, node)
+        return largest
+
+    def _last_use(self, order: List[str]) -> Dict[str, int]:
+        """Returns, for every variable of `order`, the step of its last child in the order (or its own step)."""
+        position = {node: step for step, node in enumerate(order)}
+        return {
+            node: max([position[child] for child in self.children[node] if child in position], default=position[node])
+            for node in order
+        }
+
+    def _card(self, variable: str) -> int:
+        return int(self.cpds[variable].variable_card)
+
+    def _product(self, factors: List[Factor]) -> Factor:
+        """Multiplies factors by broadcasting them over the union of their variables."""
+        scope: List[str] = []
+        for variables, _ in factors:
+            scope.extend(var for var in variables if var not in scope)
+        result = np.ones([1] * len(scope))
+        for variables, values in factors:
+            axes = sorted(range(len(variables)), key=lambda i: scope.index(variables[i]))
+            shape = [1] * len(scope)
+            for var in variables:
+                shape[scope.index(var)] = self._card(var)
+            result = result * np.transpose(values, axes).reshape(shape)
+        return tuple(scope), np.broadcast_to(result, [self._card(var) for var in scope])
+
+    def _reduce(self, factor: Factor, observed: Dict[str, int]) -> Factor:
+        """Fixes the observed variables of a factor to their states."""
+        variables, values = factor
+        index = tuple(observed[var] if var in observed else slice(None) for var in variables)
+        return tuple(var for var in variables if var not in observed), values[index]
+
+    def _sum_out(self, pool: List[Factor], variable: str) -> List[Factor]:
+        """Multiplies the factors that mention `variable` and sums it out."""
+        involved = [factor for factor in pool if variable in factor[0]]
+        if not involved:
+            return pool
+        rest = [factor for factor in pool if variable not in factor[0]]
+        scope, values = self._product(involved)
+        axis = scope.index(variable)
+        return rest + [(scope[:axis] + scope[axis + 1:], values.sum(axis=axis))]
+
+    def _push_forward(self, pool: List[Factor], cpd: DeterministicCPD, observed: Dict[str, int], step: int, last_use: Dict[str, int], keep: set) -> List[Factor]:
+        """Applies `X = f(parents)` to the pool, summing out the parents that are no longer needed."""
+        parents = cpd.variables[1:]
+        targets = cpd.targets.reshape([int(card) for card in cpd.cardinality[1:]])
+        targets = targets[tuple(observed[p] if p in observed else slice(None) for p in parents)]
+        free = [p for p in parents if p not in observed]
+        kept = [p for p in free if last_use[p] > step or p in keep]
+
+        involved = [factor for factor in pool if set(factor[0]) & set(free)]
+        rest = [factor for factor in pool if not set(factor[0]) & set(free)]
+        scope, values = self._product(involved)
+        others = [var for var in scope if var not in free]
+        values = np.transpose(values, [scope.index(var) for var in others + free])
+        n_others = int(np.prod([self._card(var) for var in others]))
+        n_configs = targets.size
+        values = values.reshape(n_others, n_configs)
+
+        # Output column of every parent configuration: (kept parents..., X)
+        card_x = self._card(cpd.variable)
+        if kept:
+            grid = np.indices([self._card(p) for p in free]).reshape(len(free), -1)
+            kept_index = np.ravel_multi_index(grid[[free.index(p) for p in kept]], [self._card(p) for p in kept])
+        else:
+            kept_index = np.zeros(n_configs, dtype=np.intp)
+        column = kept_index * card_x + targets.ravel()
+        n_kept = int(np.prod([self._card(p) for p in kept]))
+
+        scatter = sparse.csr_matrix((np.ones(n_configs), (np.arange(n_configs), column)), shape=(n_configs, n_kept * card_x))
+        pushed = np.asarray(scatter.T @ values.T).T
+        shape = [self._card(var) for var in others + kept] + [card_x]
+        return rest + [(tuple(others + kept + [cpd.variable]), pushed.reshape(shape))]
@@ -1,6 +1,15 @@
+import logging
+from typing import Optional, Sequence, Union
+
 import numpy as np
 import pandas as pd
 
+from profiling import profiled, record_details
+
+logger = logging.getLogger(__name__)
+
+DISCRETIZATION_METHODS = ("width", "quantile")
+
 
 def discretize_by_whole_days(samples_df: pd.DataFrame) -> dict:
     """
@@ -9,7 +18,7 @@ def discretize_by_whole_days(samples_df: pd.DataFrame) -> dict:
     This function takes a DataFrame of continuous duration samples for various project
     activities and converts them into a discrete probability distribution. Each unique
     rounded day becomes a discrete state, and its probability is determined by its
-    frequency in the rounded samples.
+    frequency in the rounded samples. It is `discretize_durations` with one-day bins.
 
     :param samples_df: A pandas DataFrame where each column represents an activity
                        and contains its continuous duration samples.
@@ -17,25 +26,183 @@ def discretize_by_whole_days(samples_df: pd.DataFrame) -> dict:
              dictionary containing the discrete 'labels' (states), a 'value_map'
              from state to value, and their corresponding 'probs' (probabilities).
     """
-    # 1. Round all samples to the nearest integer and convert to int
-    rounded_df = np.round(samples_df).astype(int)
-    
-    discretization_params = {}
-    print("\nDiscretizing by Whole Days (rounding):")
+    return discretize_durations(samples_df, bin_width=1)
+
+
+@profiled("discretize")
+def discretize_durations(samples: Union[pd.DataFrame, np.ndarray], bin_width: int = 1, method: str = "width", max_states: Optional[int] = None, columns: Optional[Sequence[str]] = None) -> dict:
+    """
+    Discretizes the duration samples of all activities at once.
+
+    Every sample is mapped to a bin index, the indices of each column are shifted to their own
+    range and the whole matrix is counted with a single `np.bincount` (the bin sums, used for the
+    labels and the error report, come from the same call with weights). Only bins with samples
+    become states, and every state label is a whole number of days.
+
+    - `method='width'`: bins of `bin_width` days centered on multiples of `bin_width` (one-day bins
+      reproduce rounding to the nearest day). With `max_states`, the bins of an activity whose
+      samples span more states are widened by an integer factor until they fit.
+    - `method='quantile'`: `max_states` equal-probability bins per activity, each labeled with the
+      mean of its samples rounded to the day. Bins that round to the same day are merged.
 
-    for activity_code in rounded_df.columns:
-        counts = rounded_df[activity_code].value_counts(normalize=True).sort_index()
+    :param samples: The duration samples, one column per activity (DataFrame or 2D array).
+    :param bin_width: The bin width in whole days (`method='width'`).
+    :param method: 'width' or 'quantile'.
+    :param max_states: The maximum number of states per activity. Required for 'quantile'.
+    :param columns: The activity codes of the array columns. Defaults to the DataFrame columns.
+
+    :return: A dictionary where each key is an activity code. The value is another dictionary with
+             the discrete 'labels' (states), a 'value_map' from state to value, their 'probs', the
+             bin 'edges' (`len(labels) + 1` values from -inf to inf, see `assign_states`) and the
+             'error' introduced by the discretization: mean absolute difference between samples
+             and labels ('mae') and absolute change of the mean ('mean_shift') and standard
+             deviation ('std_shift').
+    """
+    if method not in DISCRETIZATION_METHODS:
+        raise ValueError(f"Unknown discretization method '{method}'. Choose one of {DISCRETIZATION_METHODS}.")
+    if int(bin_width) != bin_width or bin_width < 1:
+        raise ValueError(f"bin_width must be a positive whole number of days. Got {bin_width}.")
+    if max_states is not None and max_states < 1:
+        raise ValueError(f"max_states must be at least 1. Got {max_states}.")
+    if method == "quantile" and max_states is None:
+        raise ValueError("Quantile binning needs max_states (the number of bins per activity).")
+
+    if columns is None:
+        columns = list(samples.columns) if isinstance(samples, pd.DataFrame) else list(range(np.shape(samples)[1]))
+    values = np.asarray(samples, dtype=float)
+    n_samples = values.shape[0]
+
+    if method == "width":
+        bins, widths = _width_bins(values, int(bin_width), max_states)
+        low = bins.min(axis=0)
+    else:
+        bins, sorted_values = _quantile_bins(values, max_states)
+        low = np.zeros(values.shape[1], dtype=np.int64)
+
+    # One bincount over the whole matrix: the bins of column j start at offsets[j]
+    sizes = bins.max(axis=0) - low + 1
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    bins -= low - offsets
+    flat = bins.ravel()
+    counts = np.bincount(flat, minlength=int(sizes.sum()))
+    column_of_bin = np.repeat(np.arange(values.shape[1]), sizes)
+
+    # Label (whole days) of every bin of every column
+    if method == "width":
+        bin_labels = (np.arange(sizes.sum()) - offsets[column_of_bin] + low[column_of_bin]) * widths[column_of_bin]
+    else:
+        sums = np.bincount(flat, weights=values.ravel(), minlength=int(sizes.sum()))
+        bin_labels = np.round(sums / np.maximum(counts, 1))
+    bin_labels = bin_labels.astype(np.int64)
+
+    # Discretization error, with every sample replaced by the label of its bin
+    residuals = values - bin_labels[bins]
+    mae = np.abs(residuals).mean(axis=0)
+    mean_shift = np.abs(residuals.mean(axis=0))
+    values_mean = values.mean(axis=0)
+    values_var = np.einsum("ij,ij->j", values, values) / n_samples - values_mean ** 2
+    labels_mean = np.bincount(column_of_bin, weights=counts * bin_labels) / n_samples
+    labels_var = np.bincount(column_of_bin, weights=counts * bin_labels.astype(float) ** 2) / n_samples - labels_mean ** 2
+    std_shift = np.abs(np.sqrt(np.maximum(labels_var, 0)) - np.sqrt(np.maximum(values_var, 0)))
+
+    discretization_params = {}
+    for j, activity_code in enumerate(columns):
+        segment = slice(offsets[j], offsets[j] + sizes[j])
+        used = counts[segment] > 0
+        # Bins that share a label (quantile bins rounded to the same day) become one state
+        states, inverse = np.unique(bin_labels[segment][used], return_inverse=True)
+        probabilities = np.bincount(inverse, weights=counts[segment][used]) / n_samples
+        if method == "width" or len(states) == 1:
+            # Adjacent bins meet halfway between their labels; empty gaps are split at the midpoint
+            inner = (states[:-1] + states[1:]) / 2
+        else:
+            # Between the last sample of a state and the first sample of the next one
+            first_bins = np.flatnonzero(used)[1:][np.diff(inverse) > 0]
+            first_ranks = -(-first_bins * n_samples // max_states)
+            inner = (sorted_values[first_ranks - 1, j] + sorted_values[first_ranks, j]) / 2
+        states = states.tolist()
 
-        states = counts.index.tolist()
-        probabilities = counts.values.tolist()
-     
-        value_map = {state: state for state in states}
-        
         discretization_params[activity_code] = {
             'labels': states,
-            'value_map': value_map,
-            'probs': probabilities
+            'value_map': {state: state for state in states},
+            'probs': probabilities.tolist(),
+            'edges': [-np.inf] + inner.tolist() + [np.inf],
+            'error': {'mae': float(mae[j]), 'mean_shift': float(mean_shift[j]), 'std_shift': float(std_shift[j])},
+        }
+        logger.debug("Activity %s: %d states -> %s", activity_code, len(states), states, extra={"activity": activity_code, "states": len(states)})
+
+    total_states = sum(len(params['labels']) for params in discretization_params.values())
+    record_details(activities=len(discretization_params), states=total_states)
+    logger.info("Discretized %d activities into %d duration states.", len(discretization_params), total_states,
+                extra={"activities": len(discretization_params), "states": total_states, "method": method})
+    return discretization_params
+
+
+def _width_bins(values: np.ndarray, bin_width: int, max_states: Optional[int]) -> tuple:
+    """Returns the bin index of every sample and the bin width (days) of every column."""
+    widths = np.full(values.shape[1], bin_width, dtype=np.int64)
+    bins = np.rint(values if bin_width == 1 else values / bin_width).astype(np.int64)
+    if max_states is None:
+        return bins, widths
+
+    # First guess from the span in base bins, then one base width more until the rounded span fits
+    spans = bins.max(axis=0) - bins.min(axis=0) + 1
+    too_wide = spans > max_states
+    widths = np.where(too_wide, bin_width * np.ceil(spans / max_states).astype(np.int64), widths)
+    while too_wide.any():
+        bins = np.rint(values / widths).astype(np.int64)
+        spans = bins.max(axis=0) - bins.min(axis=0) + 1
+        too_wide = spans > max_states
+        widths = np.where(too_wide, widths + bin_width, widths)
+    return bins, widths
+
+
+def _quantile_bins(values: np.ndarray, n_bins: int) -> tuple:
+    """
+    Returns the equal-probability bin (0..n_bins-1) of every sample, from its rank in the column,
+    and the sorted columns. Bin `b` starts at rank `ceil(b * n / n_bins)`.
+    """
+    order = np.argsort(values, axis=0, kind="stable")
+    ranks = np.empty_like(order)
+    np.put_along_axis(ranks, order, np.arange(values.shape[0])[:, None], axis=0)
+    return (ranks * n_bins) // values.shape[0], np.take_along_axis(values, order, axis=0)
+
+
+def assign_states(samples: Union[pd.DataFrame, np.ndarray], discretization_params: dict, columns: Optional[Sequence[str]] = None) -> np.ndarray:
+    """
+    Maps duration samples to the discrete states of `discretize_durations`.
+
+    :param samples: The duration samples, one column per activity (DataFrame or 2D array).
+    :param discretization_params: The result of `discretize_durations` (needs 'edges').
+    :param columns: The activity codes of the array columns. Defaults to the DataFrame columns.
+
+    :return: An integer array with the same shape as `samples` holding the state index of every
+             sample (the label is `discretization_params[code]['labels'][index]`).
+    """
+    if columns is None:
+        columns = list(samples.columns) if isinstance(samples, pd.DataFrame) else list(discretization_params)
+    values = np.asarray(samples, dtype=float)
+    states = np.empty(values.shape, dtype=np.int64)
+    for j, activity_code in enumerate(columns):
+        inner_edges = np.asarray(discretization_params[activity_code]['edges'][1:-1])
+        states[:, j] = np.searchsorted(inner_edges, values[:, j], side="right")
+    return states
+
+
+def discretization_report(discretization_params: dict) -> pd.DataFrame:
+    """
+    Summarizes the number of states and the error of a discretization, one row per activity.
+
+    :param discretization_params: The result of `discretize_durations`.
+    :return: A DataFrame with the columns 'Code', 'States', 'MAE', 'Mean shift' and 'Std shift'.
+    """
+    return pd.DataFrame([
+        {
+            'Code': code,
+            'States': len(params['labels']),
+            'MAE': params['error']['mae'],
+            'Mean shift': params['error']['mean_shift'],
+            'Std shift': params['error']['std_shift'],
         }
-        print(f" - Activity {activity_code}: {len(states)} states -> {states}")
-        
-    return discretization_params
\ No newline at end of file
+        for code, params in discretization_params.items()
+    ])
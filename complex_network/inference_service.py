@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+from pgmpy.factors.discrete import DiscreteFactor
+from pgmpy.models import DiscreteBayesianNetwork
+
+from complex_network.deterministic_inference import DeterministicVariableElimination
+from profiling import profiled, record_details
+
+
+class InferenceService:
+    """
+    Answers repeated queries on one Bayesian Network, reusing earlier work.
+
+    - The elimination plan (order and last use of every variable) is computed once per set of query
+      variables and shared by all evidence sets whose variables it already covers.
+    - Results are kept in an LRU cache keyed by the query variables and the frozenset of evidence,
+      so going back to a scenario that was already asked for costs a dictionary lookup.
+    - The factors right before every evidence step are kept as checkpoints. The factors at a step
+      only depend on the evidence processed before it, so a new evidence set resumes from the
+      latest checkpoint whose earlier evidence is the same, instead of starting from scratch.
+
+    :param model: A `DiscreteBayesianNetwork`, typically built with `compact=True`.
+    :param max_results: The maximum number of query results kept.
+    :param max_checkpoints: The maximum number of intermediate factor lists kept.
+    """
+
+    def __init__(self, model: DiscreteBayesianNetwork, max_results: int = 128, max_checkpoints: int = 256):
+        self.engine = DeterministicVariableElimination(model)
+        self.max_results = max_results
+        self.max_checkpoints = max_checkpoints
+        self._plans: Dict[tuple, tuple] = {}
+        self._results: "OrderedDict[tuple, DiscreteFactor]" = OrderedDict()
+        self._checkpoints: "OrderedDict[tuple, list]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @profiled("inference")
+    def query(self, variables: List[str], evidence: Optional[Dict[str, object]] = None, show_progress: bool = False) -> DiscreteFactor:
+        """
+        Computes the joint posterior distribution of `variables` given `evidence`.
+
+        :param variables: The query variables (e.g., ['T_F']).
+        :param evidence: A dictionary mapping evidence variables to their observed state names.
+        :param show_progress: Accepted for compatibility with pgmpy; ignored.
+        :return: A normalized `DiscreteFactor` over `variables` (a copy, safe to modify).
+        """
+        variables = tuple(variables)
+        evidence = dict(evidence or {})
+        key = (variables, frozenset(evidence.items()))
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            record_details(cached=True)
+            return self._results[key].copy()
+
+        self.misses += 1
+        result = self._compute(variables, evidence)
+        self._results[key] = result
+        if len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+        return result.copy()
+
+    def clear(self) -> None:
+        """Drops the cached results and checkpoints."""
+        self._results.clear()
+        self._checkpoints.clear()
+
+    def _compute(self, variables: tuple, evidence: dict) -> DiscreteFactor:
+        observed = self.engine.observed_states(list(variables), evidence)
+        if variables not in self._plans:
+            self._plans[variables] = self.engine.elimination_plan(list(variables))
+        order, last_use = self._plans[variables]
+        position = {node: step for step, node in enumerate(order)}
+        if any(var not in position for var in observed):
+            # Evidence outside the ancestors of the query changes the plan: no reuse
+            return self.engine.query(list(variables), evidence)
+
+        def earlier_evidence(step: int) -> frozenset:
+            return frozenset((var, state) for var, state in observed.items() if position[var] < step)
+
+        # Latest checkpoint that saw the same evidence before its step
+        start, pool = 0, None
+        for (query_variables, step, seen), saved in reversed(self._checkpoints.items()):
+            if query_variables == variables and step > start and seen == earlier_evidence(step):
+                start, pool = step, saved
+        if pool is not None:
+            self._checkpoints.move_to_end((variables, start, earlier_evidence(start)))
+
+        def checkpoint(step: int, factors: list) -> None:
+            self._checkpoints[(variables, step, earlier_evidence(step))] = factors
+            if len(self._checkpoints) > self.max_checkpoints:
+                self._checkpoints.popitem(last=False)
+
+        pool = self.engine.eliminate(order, last_use, list(variables), observed, pool, start, checkpoint)
+        return self.engine.posterior(pool, list(variables))
@@ -0,0 +1,185 @@
+from itertools import combinations
+from typing import Dict, List, Optional
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+from pgmpy.factors import factor_product
+from pgmpy.factors.discrete import DiscreteFactor
+from pgmpy.inference import BeliefPropagation
+from pgmpy.models import DiscreteBayesianNetwork, JunctionTree
+
+from complex_network.deterministic_inference import DeterministicVariableElimination
+from profiling import profiled, record_details
+
+SENSITIVITY_METHODS = ("auto", "belief_propagation", "elimination")
+
+# Largest clique potential (number of entries) that 'auto' accepts for belief propagation
+MAX_CLIQUE_SIZE = 2_000_000
+
+
+def build_junction_tree(model: DiscreteBayesianNetwork, elimination_order: List[str]) -> JunctionTree:
+    """
+    Builds the junction tree of a Bayesian Network from a given elimination order.
+
+    pgmpy's `to_junction_tree` triangulates with a generic heuristic, which produces huge cliques on
+    project networks. Here the moral graph is triangulated by eliminating the variables in
+    `elimination_order`, the maximal cliques are joined by a maximum-weight spanning tree over
+    their separator sizes and every CPD is multiplied into the first clique that contains it.
+
+    :param model: The Bayesian Network (CPDs of any kind, including `DeterministicCPD`).
+    :param elimination_order: All the variables of the model, in elimination order.
+    :return: A `JunctionTree` with the clique potentials, ready for `BeliefPropagation`.
+    """
+    cliques = triangulated_cliques(model, elimination_order)
+    clique_graph = nx.Graph()
+    clique_graph.add_nodes_from(cliques)
+    for first, second in combinations(cliques, 2):
+        shared = len(set(first) & set(second))
+        if shared:
+            clique_graph.add_edge(first, second, weight=shared)
+    tree = JunctionTree()
+    tree.add_nodes_from(cliques)
+    tree.add_edges_from(nx.maximum_spanning_tree(clique_graph).edges())
+
+    factors: Dict[tuple, list] = {clique: [] for clique in cliques}
+    for cpd in model.get_cpds():
+        scope = set(cpd.variables)
+        factors[next(clique for clique in cliques if scope <= set(clique))].append(cpd.to_factor())
+    cardinality = model.get_cardinality()
+    state_names = {cpd.variable: cpd.state_names[cpd.variable] for cpd in model.get_cpds()}
+    for clique in cliques:
+        potential = DiscreteFactor(clique, [cardinality[var] for var in clique], np.ones(int(np.prod([cardinality[var] for var in clique]))),
+                                   state_names={var: state_names[var] for var in clique})
+        if factors[clique]:
+            potential = potential * factor_product(*factors[clique])
+        tree.add_factors(potential)
+    return tree
+
+
+def triangulated_cliques(model: DiscreteBayesianNetwork, elimination_order: List[str]) -> List[tuple]:
+    """
+    Returns the maximal cliques of the moral graph triangulated by `elimination_order`.
+
+    :param model: The Bayesian Network.
+    :param elimination_order: All the variables of the model, in elimination order.
+    :return: A list of cliques (tuples of sorted variable names).
+    """
+    graph = nx.Graph(model.moralize().edges())
+    graph.add_nodes_from(model.nodes())
+
+    cliques = []
+    for variable in elimination_order:
+        neighbors = set(graph.neighbors(variable))
+        graph.add_edges_from(combinations(neighbors, 2))
+        graph.remove_node(variable)
+        clique = frozenset(neighbors | {variable})
+        if not any(clique <= other for other in cliques):
+            cliques = [other for other in cliques if not other <= clique] + [clique]
+    return [tuple(sorted(clique)) for clique in cliques]
+
+
+@profiled("sensitivity_sweep")
+def sensitivity_sweep(model: DiscreteBayesianNetwork, end_variable: str, activities: Optional[List[str]] = None, method: str = "auto") -> dict:
+    """
+    Computes the end date distribution conditioned on every duration state of every activity.
+
+    With `method='belief_propagation'`, a junction tree of the ancestors of `end_variable` is built
+    (see `build_junction_tree`, with the order of `DeterministicVariableElimination`) and calibrated
+    once with pgmpy's `BeliefPropagation`. The joint `P(end, D_x)` of every activity then comes
+    from the calibrated beliefs of the cliques between `D_x` and `end` (out-of-clique inference),
+    and `P(end | D_x = d)` for all the states `d` at once by normalizing its columns. This replaces
+    one evidence query per (activity, duration state) pair. `method='elimination'` computes the same
+    joints with `DeterministicVariableElimination`, without dense clique potentials, for networks
+    whose cliques do not fit in memory. The dense potentials hold every completion node together
+    with its parents, so they grow quickly with the number of states; `method='auto'` uses belief
+    propagation only if no clique has more than `MAX_CLIQUE_SIZE` entries.
+
+    :param model: The project's Bayesian Network (see `build_generic_bayesian_network`).
+    :param end_variable: The completion time variable of the project end (e.g., 'T_F').
+    :param activities: The activity codes to sweep. Defaults to every activity that precedes the end.
+    :param method: 'auto', 'belief_propagation' or 'elimination'.
+
+    :return: A dictionary with:
+             - 'end_labels': the states (days) of `end_variable`.
+             - 'conditionals': for each activity code, {'labels': duration states, 'probs': array
+               (n_duration_states, n_end_states) with `P(end | D_x = label)` in each row}.
+             - 'tornado': a DataFrame with one row per activity (see `tornado_table`).
+             - 'method': the method that was used.
+    """
+    if method not in SENSITIVITY_METHODS:
+        raise ValueError(f"Unknown sensitivity method '{method}'. Choose one of {SENSITIVITY_METHODS}.")
+    relevant = nx.ancestors(model, end_variable) | {end_variable}
+    if activities is None:
+        activities = [node[2:] for node in nx.topological_sort(model) if node.startswith("D_") and node in relevant]
+    elimination = DeterministicVariableElimination(model)
+
+    inference = elimination
+    if method != "elimination":
+        # Variables are eliminated at the step of their last use, as in the elimination engine
+        sub_model = _ancestral_model(model, relevant)
+        order, last_use = elimination.elimination_plan([end_variable])
+        position = {var: step for step, var in enumerate(order)}
+        elimination_order = sorted(order, key=lambda var: (last_use[var], position[var]))
+        cardinality = sub_model.get_cardinality()
+        largest = max(np.prod([cardinality[var] for var in clique], dtype=float) for clique in triangulated_cliques(sub_model, elimination_order))
+        if method == "belief_propagation" or largest <= MAX_CLIQUE_SIZE:
+            inference = BeliefPropagation(build_junction_tree(sub_model, elimination_order))
+            # Dividing by separators with impossible states is 0/0, which pgmpy already maps to 0
+            with np.errstate(divide="ignore", invalid="ignore"):
+                inference.calibrate()
+    result_method = "belief_propagation" if isinstance(inference, BeliefPropagation) else "elimination"
+    record_details(method=result_method, activities=len(activities))
+
+    end_labels = elimination.cpds[end_variable].state_names[end_variable]
+    conditionals = {}
+    for code in activities:
+        duration = f"D_{code}"
+        if result_method == "belief_propagation":
+            with np.errstate(divide="ignore", invalid="ignore"):
+                joint = inference.query([duration, end_variable], joint=True, show_progress=False)
+        else:
+            joint = inference.query([duration, end_variable])
+        values = joint.values if joint.variables == [duration, end_variable] else joint.values.T
+        conditionals[code] = {
+            'labels': list(joint.state_names[duration]),
+            'probs': values / values.sum(axis=1, keepdims=True),
+        }
+
+    return {'end_labels': end_labels, 'conditionals': conditionals, 'tornado': tornado_table(end_labels, conditionals), 'method': result_method}
+
+
+def _ancestral_model(model: DiscreteBayesianNetwork, relevant: set) -> DiscreteBayesianNetwork:
+    """Returns the sub-network with only the `relevant` variables (closed under ancestors) and their CPDs."""
+    sub_model = DiscreteBayesianNetwork(model.subgraph(relevant).edges())
+    sub_model.add_nodes_from(relevant)
+    sub_model.add_cpds(*[cpd for cpd in model.get_cpds() if cpd.variable in relevant])
+    return sub_model
+
+
+def tornado_table(end_labels: list, conditionals: dict) -> pd.DataFrame:
+    """
+    Summarizes a sensitivity sweep as a tornado table.
+
+    For each activity, the expected end date is computed given its shortest and its longest
+    duration state. The swing (difference between the two) measures how much the activity moves
+    the end date; rows are sorted by decreasing swing.
+
+    :param end_labels: The states (days) of the end variable.
+    :param conditionals: The 'conditionals' of `sensitivity_sweep`.
+    :return: A DataFrame with the columns 'Code', 'Shortest duration', 'Longest duration',
+             'End date (shortest)', 'End date (longest)' and 'Swing'.
+    """
+    end_days = np.asarray(end_labels, dtype=float)
+    rows = []
+    for code, conditional in conditionals.items():
+        expected = conditional['probs'] @ end_days
+        rows.append({
+            'Code': code,
+            'Shortest duration': conditional['labels'][0],
+            'Longest duration': conditional['labels'][-1],
+            'End date (shortest)': expected[0],
+            'End date (longest)': expected[-1],
+            'Swing': expected[-1] - expected[0],
+        })
+    return pd.DataFrame(rows).sort_values('Swing', ascending=False, ignore_index=True)
@@ -1,3 +1,6 @@
+import io
+from collections import OrderedDict
+
 import networkx as nx
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
@@ -11,7 +14,110 @@ END_NODE_COLOR = '#E69F00'       # Orange
 INTERMEDIATE_NODE_COLOR = '#999999'  # Dark Gray
 CRITICAL_PATH_COLOR = '#D55E00'  # Vermilion (better for colorblindness than pure red)
 
-def generate_graph(G: nx.DiGraph, critical_path: list = None) -> plt.Figure:
+LAYOUT_METHODS = ("auto", "dot", "layered")
+
+# Above this many nodes, 'auto' uses the built-in layered layout instead of Graphviz dot
+DOT_MAX_NODES = 300
+
+# Layout positions by graph structure (nodes, edges, direction and method), least recently used first
+MAX_CACHED_LAYOUTS = 32
+_layout_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+
+
+def graph_layout(G: nx.DiGraph, method: str = "auto") -> dict:
+    """
+    Computes the node positions of the project graph, cached by graph structure.
+
+    The positions only depend on the nodes and edges, so redrawing the same network with other
+    durations or another critical path reuses them instead of running the layout again (Graphviz
+    `dot` runs in a subprocess).
+
+    :param G: The NetworkX DiGraph of the project. A `rankdir` of 'LR' in `G.graph['graph']`
+              (see `CompiledSchedule.to_networkx`) draws it left to right.
+    :param method: 'dot' (Graphviz), 'layered' (built-in, see `layered_layout`) or 'auto', which uses
+                   dot up to `DOT_MAX_NODES` nodes and falls back to the layered layout when Graphviz
+                   is not available.
+    :return: A dictionary mapping each node to its (x, y) position.
+    :raises ValueError: If the method is unknown.
+    :raises ImportError: If `method='dot'` and pydot is not installed.
+    """
+    if method not in LAYOUT_METHODS:
+        raise ValueError(f"Unknown layout method '{method}'. Choose one of {LAYOUT_METHODS}.")
+    rankdir = G.graph.get('graph', {}).get('rankdir', 'TB')
+    key = (tuple(G.nodes), frozenset(G.edges), rankdir, method)
+    if key in _layout_cache:
+        _layout_cache.move_to_end(key)
+        return _layout_cache[key]
+
+    if method == "layered" or (method == "auto" and len(G) > DOT_MAX_NODES):
+        pos = layered_layout(G, horizontal=rankdir == 'LR')
+    elif method == "dot":
+        pos = graphviz_layout(G, prog="dot")
+    else:
+        try:
+            pos = graphviz_layout(G, prog="dot")
+        except Exception:
+            pos = layered_layout(G, horizontal=rankdir == 'LR')
+
+    _layout_cache[key] = pos
+    if len(_layout_cache) > MAX_CACHED_LAYOUTS:
+        _layout_cache.popitem(last=False)
+    return pos
+
+
+def layered_layout(G: nx.DiGraph, horizontal: bool = True, sweeps: int = 4) -> dict:
+    """
+    Places the nodes of a DAG in layers, without Graphviz (for networks too large for `dot`).
+
+    Every node goes to the layer of its longest path from a start node, so all edges point forward.
+    Inside a layer, the nodes are ordered by the barycenter of their neighbors in the previous layer
+    (downward sweeps) or the next layer (upward sweeps), which reduces edge crossings.
+
+    :param G: The NetworkX DiGraph of the project (must be acyclic).
+    :param horizontal: Whether the layers go from left to right (otherwise from top to bottom).
+    :param sweeps: The number of barycenter ordering sweeps.
+    :return: A dictionary mapping each node to its (x, y) position.
+    """
+    layer = {}
+    for node in nx.topological_sort(G):
+        layer[node] = max((layer[pred] + 1 for pred in G.predecessors(node)), default=0)
+    layers = [[] for _ in range(max(layer.values(), default=-1) + 1)]
+    for node in G.nodes:
+        layers[layer[node]].append(node)
+
+    rank = {node: i for nodes in layers for i, node in enumerate(nodes)}
+    for sweep in range(sweeps):
+        downward = sweep % 2 == 0
+        for nodes in (layers[1:] if downward else layers[-2::-1]):
+            for node in nodes:
+                neighbors = list(G.predecessors(node) if downward else G.successors(node))
+                rank[node] = sum(rank[n] for n in neighbors) / len(neighbors) if neighbors else rank[node]
+            nodes.sort(key=lambda node: rank[node])
+            rank.update({node: i for i, node in enumerate(nodes)})
+
+    pos = {}
+    for depth, nodes in enumerate(layers):
+        for i, node in enumerate(nodes):
+            offset = i - (len(nodes) - 1) / 2
+            pos[node] = (depth * 100.0, -offset * 100.0) if horizontal else (offset * 100.0, -depth * 100.0)
+    return pos
+
+
+def figure_bytes(fig: plt.Figure, fmt: str = "png") -> bytes:
+    """
+    Renders a figure to an image file in memory and closes it.
+
+    :param fig: The matplotlib Figure (e.g., from `generate_graph`).
+    :param fmt: The image format ('png' or 'svg').
+    :return: The contents of the image file.
+    """
+    buf = io.BytesIO()
+    fig.savefig(buf, format=fmt, bbox_inches="tight")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+def generate_graph(G: nx.DiGraph, critical_path: list = None, layout: str = "auto") -> plt.Figure:
     """
     Generates a plot of the project graph, highlighting the critical path.
 
@@ -25,10 +131,11 @@ def generate_graph(G: nx.DiGraph, critical_path: list = None) -> plt.Figure:
     :param critical_path: A list of node identifiers representing the critical path.
                           If provided, these nodes and their connecting edges will be
                           highlighted. Defaults to None.
+    :param layout: The layout method (see `graph_layout`).
     :return: A matplotlib Figure object containing the plotted graph.
     """
     try:
-        pos = graphviz_layout(G, prog="dot")
+        pos = graph_layout(G, layout)
     except ImportError:
         st.error(
             "Error: The graphviz layout module is not installed. "
@@ -40,8 +147,8 @@ def generate_graph(G: nx.DiGraph, critical_path: list = None) -> plt.Figure:
         st.stop()
 
     # Identify start and end nodes
-    start_nodes = [n for n, d in G.in_degree() if d == 0]
-    end_nodes = [n for n, d in G.out_degree() if d == 0]
+    start_nodes = {n for n, d in G.in_degree() if d == 0}
+    end_nodes = {n for n, d in G.out_degree() if d == 0}
 
     fig, ax = plt.subplots(figsize=(12, 10))
     
@@ -54,18 +161,14 @@ def generate_graph(G: nx.DiGraph, critical_path: list = None) -> plt.Figure:
         else:
             node_colors.append(INTERMEDIATE_NODE_COLOR)
 
-    # Edge colors (highlighting the critical path)
+    # Edge colors (highlighting the consecutive pairs of the critical path)
+    path_edges = set(zip(critical_path, critical_path[1:])) if critical_path else set()
     edge_colors = []
     edge_widths = []
     for u, v in G.edges():
-        if critical_path and u in critical_path and v in critical_path:
-            # Check if the edge is part of the sequential critical path
-            if critical_path.index(v) - critical_path.index(u) == 1:
-                edge_colors.append(CRITICAL_PATH_COLOR)
-                edge_widths.append(4)
-            else:
-                edge_colors.append("black")
-                edge_widths.append(1.0)
+        if (u, v) in path_edges:
+            edge_colors.append(CRITICAL_PATH_COLOR)
+            edge_widths.append(4)
         else:
             edge_colors.append("black")
             edge_widths.append(1.0)
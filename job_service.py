@@ -0,0 +1,463 @@
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterator, Optional
+
+import pandas as pd
+
+from probabilist_project_plan import SUPPORTED_DISTRIBUTIONS, generate_samples_parallel
+from profiling import configure_logging
+from project_ingestion import file_format, load_project, parameter_columns
+from simulation_cache import DEFAULT_CACHE_DIR, SimulationCache
+
+from complex_network.bayesian_network_store import bayesian_network_key, load_or_build_bayesian_network
+from complex_network.discretize_samples import DISCRETIZATION_METHODS, discretize_durations
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_DATABASE = os.path.join(DEFAULT_CACHE_DIR, "jobs.sqlite3")
+
+# Largest request body accepted (the project file travels base64-encoded inside it)
+MAX_REQUEST_BYTES = 64 * 1024 ** 2
+
+# Seconds between two reads of the job store while streaming or waiting for a job
+POLL_INTERVAL = 0.25
+
+FINISHED_STATUSES = ("done", "failed")
+
+
+class JobStore:
+    """
+    SQLite store of the jobs: status, progress, result and error of every job id.
+
+    Every call opens its own connection, so the service and its worker processes can all write
+    progress to the same file (in WAL mode, readers do not block the writers).
+
+    :param path: The database file.
+    """
+
+    def __init__(self, path: str = DEFAULT_DATABASE):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._execute("PRAGMA journal_mode=WAL")
+        self._execute(
+            "CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+            "progress REAL NOT NULL DEFAULT 0, message TEXT, result TEXT, error TEXT, created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def _execute(self, sql: str, parameters: tuple = ()) -> list:
+        with contextlib.closing(sqlite3.connect(self.path, timeout=30)) as connection:
+            connection.row_factory = sqlite3.Row
+            with connection:
+                return connection.execute(sql, parameters).fetchall()
+
+    def create(self, job_id: str, kind: str) -> dict:
+        """Registers a job as queued, replacing any earlier run with the same id."""
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO jobs (id, kind, status, progress, message, result, error, created, updated) VALUES (?, ?, 'queued', 0, 'Queued', NULL, NULL, ?, ?)",
+            (job_id, kind, now, now),
+        )
+        return self.get(job_id)
+
+    def update(self, job_id: str, **fields: Any) -> None:
+        """Updates some of the columns 'status', 'progress', 'message', 'result' (JSON-encoded here) and 'error'."""
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        self._execute(f"UPDATE jobs SET {columns}, updated = ? WHERE id = ?", (*fields.values(), time.time(), job_id))
+
+    def get(self, job_id: str) -> Optional[dict]:
+        """Returns the job as a dictionary (with the result decoded), or None if it does not exist."""
+        rows = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,))
+        if not rows:
+            return None
+        job = dict(rows[0])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def interrupt_unfinished(self) -> int:
+        """Marks the jobs left queued or running by a service that stopped as failed. Returns how many."""
+        rows = self._execute("SELECT id FROM jobs WHERE status IN ('queued', 'running')")
+        for row in rows:
+            self.update(row["id"], status="failed", message="Interrupted", error="The service stopped before the job finished.")
+        return len(rows)
+
+
+# ------------------------- Jobs (run in the worker processes) -------------------------
+
+def _samples_settings(settings: dict) -> dict:
+    distribution = settings.get("distribution", "triangular")
+    if distribution not in SUPPORTED_DISTRIBUTIONS:
+        raise ValueError(f"Unsupported distribution: {distribution}. Use one of {', '.join(SUPPORTED_DISTRIBUTIONS)}.")
+    n_samples = int(settings.get("n_samples", 10000))
+    if n_samples < 1:
+        raise ValueError("n_samples must be at least 1.")
+    return {"distribution": distribution, "n_samples": n_samples, "seed": int(settings.get("seed", 42))}
+
+
+def _bayesian_network_settings(settings: dict) -> dict:
+    method = settings.get("method", "width")
+    if method not in DISCRETIZATION_METHODS:
+        raise ValueError(f"Unknown discretization method '{method}'. Choose one of {DISCRETIZATION_METHODS}.")
+    bin_width = int(settings.get("bin_width", 1))
+    if bin_width < 1:
+        raise ValueError("bin_width must be at least 1.")
+    max_states = settings.get("max_states")
+    if method == "quantile" and max_states is None:
+        raise ValueError("The 'quantile' method needs max_states.")
+    return {**_samples_settings(settings), "method": method, "bin_width": bin_width, "max_states": None if max_states is None else int(max_states)}
+
+
+def samples_job(request: dict, cache: SimulationCache, progress: Callable[[float, str], None]) -> dict:
+    """
+    Samples the activity durations of a project into the cache.
+
+    The samples are stored under the same key as in `pages/planning.py`, so the page (or any other
+    client sharing the cache directory) loads them memory-mapped once the job is done.
+
+    :param request: The job request: 'data' (file contents), 'file_name', 'sheet' and 'settings'.
+    :param cache: The cache shared with the clients.
+    :param progress: Function (fraction, message) that reports the progress.
+    :return: {'samples_key': ...}
+    """
+    settings = request["settings"]
+    progress(0.0, "Loading the project")
+    df, _ = load_project(request["data"], request["file_name"], request["sheet"], parameter_columns(settings["distribution"]), cache)
+    key = cache.make_key("samples", df, settings["distribution"], settings["n_samples"], settings["seed"])
+    progress(0.1, "Sampling durations")
+    cache.get_array(key, "samples", lambda: generate_samples_parallel(df, settings["distribution"], settings["n_samples"], seed=settings["seed"], max_workers=1).to_numpy())
+    return {"samples_key": key}
+
+
+def bayesian_network_job(request: dict, cache: SimulationCache, progress: Callable[[float, str], None]) -> dict:
+    """
+    Samples, discretizes and builds the compact Bayesian Network of a project into the cache.
+
+    The samples, the discretization and the model are stored under the keys of `pages/planning.py`.
+
+    :param request: The job request (see `samples_job`), with the discretization settings.
+    :param cache: The cache shared with the clients.
+    :param progress: Function (fraction, message) that reports the progress.
+    :return: {'samples_key': ..., 'discretization_key': ..., 'model_key': ...}
+    """
+    settings = request["settings"]
+    result = samples_job(request, cache, lambda fraction, message: progress(0.4 * fraction, message))
+    df, schedule = load_project(request["data"], request["file_name"], request["sheet"], parameter_columns(settings["distribution"]), cache)
+    progress(0.4, "Discretizing durations")
+    options = (settings["method"], settings["bin_width"], settings["max_states"])
+    discretization_key = cache.make_key("discretization", result["samples_key"], *options)
+
+    def discretize() -> dict:
+        samples = pd.DataFrame(cache.load_array(result["samples_key"], "samples"), columns=df["Code"].tolist(), copy=False)
+        return discretize_durations(samples, bin_width=settings["bin_width"], method=settings["method"], max_states=settings["max_states"])
+
+    params = cache.get_object(discretization_key, "discretization", discretize)
+    progress(0.5, "Building the Bayesian Network")
+    load_or_build_bayesian_network(df, params, schedule, cache, compact=True)
+    return {**result, "discretization_key": discretization_key, "model_key": bayesian_network_key(schedule, params, compact=True)}
+
+
+# Kind of job: (settings validation, job function, names of the cache entries of its result)
+JOB_KINDS = {
+    "samples": (_samples_settings, samples_job, {"samples_key": "samples"}),
+    "bayesian_network": (_bayesian_network_settings, bayesian_network_job, {"samples_key": "samples", "discretization_key": "discretization", "model_key": "model"}),
+}
+
+
+def _run_job(database: str, cache_dir: str, job_id: str, kind: str, request: dict) -> None:
+    """Runs a job in a worker process, writing its progress, result or error to the store."""
+    store = JobStore(database)
+    store.update(job_id, status="running", message="Starting")
+    try:
+        result = JOB_KINDS[kind][1](request, SimulationCache(cache_dir), lambda fraction, message: store.update(job_id, progress=fraction, message=message))
+    except Exception as e:
+        store.update(job_id, status="failed", message="Failed", error=f"{type(e).__name__}: {e}")
+        return
+    store.update(job_id, status="done", progress=1.0, message="Done", result=result)
+
+
+# ------------------------- Service -------------------------
+
+def job_key(kind: str, data: bytes, file_name: str, sheet: Optional[str], settings: dict) -> str:
+    """
+    Builds the id of a job from everything that determines its result.
+
+    Identical requests (same file contents, sheet and settings, whatever the file name or the user)
+    get the same id and share one run.
+    """
+    digest = hashlib.sha256(data).hexdigest()
+    return SimulationCache.make_key("job", kind, digest, file_format(file_name), sheet, sorted(settings.items()))
+
+
+class JobService:
+    """
+    Local job service for the heavy steps of the planning page (sampling, Bayesian Network build).
+
+    Jobs run in a process pool, off the Streamlit script threads, and write their progress and
+    result to a `JobStore`. Their outputs land in the shared `SimulationCache` under the same keys
+    the page uses, so a finished job is picked up by the page as a cache hit. Job ids are content
+    keys (see `job_key`): a request identical to a queued, running or finished job returns that
+    job instead of starting another run. Finished jobs whose outputs were evicted from the cache,
+    and failed jobs, run again.
+
+    The HTTP API (JSON, one request per connection):
+
+    - ``POST /jobs`` with {'kind', 'file_name', 'data' (base64), 'sheet', 'settings'}: submits a job
+      and returns it (202).
+    - ``GET /jobs/<id>``: returns the job ('status' is queued, running, done or failed, with
+      'progress', 'message', 'result' and 'error').
+    - ``GET /jobs/<id>/events``: streams the job as server-sent events until it finishes.
+    - ``GET /health``: returns {'status': 'ok'}.
+
+    :param database: The SQLite file of the `JobStore`.
+    :param cache_dir: The directory of the `SimulationCache` shared with the clients.
+    :param max_workers: The number of worker processes. None uses every core.
+    """
+
+    def __init__(self, database: str = DEFAULT_DATABASE, cache_dir: str = DEFAULT_CACHE_DIR, max_workers: Optional[int] = None):
+        self.store = JobStore(database)
+        self.cache = SimulationCache(cache_dir)
+        self.max_workers = max_workers
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self._running: Dict[str, asyncio.Future] = {}
+
+    def submit(self, kind: str, data: bytes, file_name: str, sheet: Optional[str] = None, settings: Optional[dict] = None) -> dict:
+        """
+        Submits a job, or returns the identical job that is already queued, running or done.
+
+        Must be called from the service's event loop.
+
+        :param kind: One of `JOB_KINDS` ('samples' or 'bayesian_network').
+        :param data: The contents of the project file.
+        :param file_name: The name of the project file (selects the format).
+        :param sheet: The sheet of an Excel file.
+        :param settings: The job settings (distribution, n_samples, seed and, for the Bayesian
+                         Network, method, bin_width and max_states). Missing ones take defaults.
+        :return: The job (see `JobStore.get`).
+        :raises ValueError: If the kind, the file format or a setting is not valid.
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Unknown job kind '{kind}'. Choose one of {tuple(JOB_KINDS)}.")
+        settings = JOB_KINDS[kind][0](settings or {})
+        job_id = job_key(kind, data, file_name, sheet, settings)
+        job = self.store.get(job_id)
+        if job is not None and (job_id in self._running or (job["status"] == "done" and self._outputs_cached(kind, job["result"]))):
+            return job
+
+        job = self.store.create(job_id, kind)
+        request = {"data": data, "file_name": file_name, "sheet": sheet, "settings": settings}
+        try:
+            pool, future = self._submit_to_pool(_run_job, self.store.path, self.cache.directory, job_id, kind, request)
+        except Exception as e:
+            self.store.update(job_id, status="failed", message="Failed", error=f"{type(e).__name__}: {e}")
+            raise
+        future = asyncio.wrap_future(future)
+        self._running[job_id] = future
+        future.add_done_callback(lambda done: self._finished(job_id, done, pool))
+        return job
+
+    def _submit_to_pool(self, function: Callable, *args: Any) -> tuple:
+        """Submits a call to the process pool, replacing the pool if a dead worker broke it. Returns (pool, future)."""
+        if self.pool is not None:
+            try:
+                return self.pool, self.pool.submit(function, *args)
+            except BrokenProcessPool:
+                self._discard_pool(self.pool)
+        self.pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self.pool, self.pool.submit(function, *args)
+
+    def _discard_pool(self, pool: ProcessPoolExecutor) -> None:
+        if self.pool is pool:
+            self.pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _outputs_cached(self, kind: str, result: Optional[dict]) -> bool:
+        return result is not None and all(self.cache.contains(result[field], name) for field, name in JOB_KINDS[kind][2].items())
+
+    def _finished(self, job_id: str, future: asyncio.Future, pool: ProcessPoolExecutor) -> None:
+        self._running.pop(job_id, None)
+        if not future.cancelled() and future.exception() is not None:
+            # The worker process died (e.g., out of memory) before it could record the failure
+            self.store.update(job_id, status="failed", message="Failed", error=f"{type(future.exception()).__name__}: {future.exception()}")
+            if isinstance(future.exception(), BrokenProcessPool):
+                # A broken pool rejects every later job: the next submission starts a new one
+                self._discard_pool(pool)
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> None:
+        """Serves the HTTP API until cancelled."""
+        interrupted = self.store.interrupt_unfinished()
+        if interrupted:
+            print(f"Marked {interrupted} unfinished job(s) of a previous run as failed.")
+        server = await asyncio.start_server(self._handle, host, port)
+        print(f"Job service listening on http://{host}:{port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if self.pool is not None:
+                self.pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return await _send_json(writer, 400, {"error": "Malformed request."})
+            method, path = request_line[0], request_line[1].split("?")[0].rstrip("/")
+            length = int(headers.get("content-length", 0))
+            if length > MAX_REQUEST_BYTES:
+                return await _send_json(writer, 413, {"error": f"Request larger than {MAX_REQUEST_BYTES} bytes."})
+            body = await reader.readexactly(length) if length else b""
+            await self._route(method, path, body, writer)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            # Answer instead of dropping the connection (e.g., a new process pool could not be started)
+            with contextlib.suppress(ConnectionError):
+                await _send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"})
+        finally:
+            writer.close()
+
+    async def _route(self, method: str, path: str, body: bytes, writer: asyncio.StreamWriter) -> None:
+        parts = path.strip("/").split("/")
+        if method == "GET" and parts == ["health"]:
+            return await _send_json(writer, 200, {"status": "ok", "running": len(self._running)})
+        if method == "POST" and parts == ["jobs"]:
+            try:
+                payload = json.loads(body)
+                job = self.submit(payload["kind"], base64.b64decode(payload["data"]), payload["file_name"], payload.get("sheet"), payload.get("settings"))
+            except (KeyError, TypeError, ValueError) as e:
+                return await _send_json(writer, 400, {"error": f"Invalid job request: {e}"})
+            return await _send_json(writer, 202, job)
+        if method == "GET" and len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self.store.get(parts[1])
+            if job is None:
+                return await _send_json(writer, 404, {"error": f"Unknown job '{parts[1]}'."})
+            if len(parts) == 2:
+                return await _send_json(writer, 200, job)
+            if parts[2] == "events":
+                return await self._stream(parts[1], writer)
+        return await _send_json(writer, 404, {"error": f"No route for {method} {path or '/'}."})
+
+    async def _stream(self, job_id: str, writer: asyncio.StreamWriter) -> None:
+        """Sends the job as a server-sent event every time it changes, until it finishes."""
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\nConnection: close\r\n\r\n")
+        last_update = None
+        while True:
+            job = self.store.get(job_id)
+            if job["updated"] != last_update:
+                last_update = job["updated"]
+                writer.write(f"data: {json.dumps(job)}\n\n".encode())
+                await writer.drain()
+            if job["status"] in FINISHED_STATUSES:
+                return
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: Any) -> None:
+    body = json.dumps(payload).encode()
+    reason = {200: "OK", 202: "Accepted", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large", 500: "Internal Server Error"}[status]
+    writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body)
+    await writer.drain()
+
+
+# ------------------------- Client -------------------------
+
+class JobClient:
+    """
+    Client of the `JobService` HTTP API, with the standard library only.
+
+    :param url: The base URL of the service (e.g., 'http://127.0.0.1:8765').
+    :param timeout: The timeout of every HTTP request, in seconds.
+    """
+
+    def __init__(self, url: str = f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout: float = 10.0):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def _request(self, path: str, payload: Optional[dict] = None) -> dict:
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(self.url + path, data=data, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    def available(self) -> bool:
+        """Checks whether the service answers."""
+        try:
+            return self._request("/health")["status"] == "ok"
+        except OSError:
+            return False
+
+    def submit(self, kind: str, data: bytes, file_name: str, sheet: Optional[str] = None, settings: Optional[dict] = None) -> dict:
+        """Submits a job (see `JobService.submit`) and returns it."""
+        payload = {"kind": kind, "data": base64.b64encode(data).decode("ascii"), "file_name": file_name, "sheet": sheet, "settings": settings or {}}
+        return self._request("/jobs", payload)
+
+    def status(self, job_id: str) -> dict:
+        """Returns the job."""
+        return self._request(f"/jobs/{job_id}")
+
+    def events(self, job_id: str) -> Iterator[dict]:
+        """Yields the job every time it changes, until it finishes (server-sent events)."""
+        with urllib.request.urlopen(f"{self.url}/jobs/{job_id}/events", timeout=None) as response:
+            for line in response:
+                if line.startswith(b"data: "):
+                    yield json.loads(line[6:])
+
+    def wait(self, job_id: str, on_progress: Optional[Callable[[dict], None]] = None, interval: float = 0.5, timeout: Optional[float] = None) -> dict:
+        """
+        Polls a job until it finishes.
+
+        :param job_id: The job id.
+        :param on_progress: Function called with the job after every poll (e.g., to update a progress bar).
+        :param interval: The seconds between two polls.
+        :param timeout: The maximum seconds to wait. None waits forever.
+        :return: The finished job.
+        :raises TimeoutError: If the job does not finish within `timeout`.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            job = self.status(job_id)
+            if on_progress is not None:
+                on_progress(job)
+            if job["status"] in FINISHED_STATUSES:
+                return job
+            if deadline is not None and time.monotonic() > deadline:
+                raise TimeoutError(f"Job {job_id} did not finish within {timeout} seconds.")
+            time.sleep(interval)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local job service for sampling and Bayesian Network builds.")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: every core).")
+    parser.add_argument("--database", default=DEFAULT_DATABASE, help="SQLite file of the jobs.")
+    parser.add_argument("--cache-dir", default=DEFAULT_CACHE_DIR, help="Simulation cache shared with the app (SIMULATION_CACHE_DIR).")
+    parser.add_argument("--log-level", default="WARNING", help="Level of the JSON logs on stderr (DEBUG includes every stage timing).")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    service = JobService(args.database, args.cache_dir, args.workers)
+    with contextlib.suppress(KeyboardInterrupt):
+        asyncio.run(service.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
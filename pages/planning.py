@@ -1,55 +1,154 @@
-from io import BytesIO
-import io
+import os
 import streamlit as st
-import networkx as nx
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
-from caminho_critico_node import max_path_dag_node_weights
-from generate_direct_graph import generate_graph
-from probabilist_project_plan import generate_samples
-from var_cvar import value_at_risk, conditional_value_at_risk
-
-from complex_network.discretize_samples import discretize_by_whole_days
-from complex_network.create_bayesian_network import build_generic_bayesian_network
-from pgmpy.inference import VariableElimination
+from caminho_critico_node import max_path_dag_node_weights_batch, batch_critical_path, cpm_batch, cpm_summary, earliest_finish_batch
+from generate_direct_graph import figure_bytes, generate_graph
+from job_service import JobClient
+from profiling import Profiler, profile_stage
+from project_ingestion import SUPPORTED_FORMATS, THREE_POINT_COLUMNS, ProjectValidationError, load_project, sheet_names
+from probabilist_project_plan import changed_activities, generate_samples_parallel, resample_activities
+from sample_index import SampleIndex
+from simulation_cache import SimulationCache
+from var_cvar import risk_profile
+
+from complex_network.discretize_samples import assign_states, discretize_durations, discretization_report
+from complex_network.bayesian_network_store import bayesian_network_key, load_or_build_bayesian_network
+from complex_network.inference_service import InferenceService
+from complex_network.sensitivity import sensitivity_sweep
 
 
 st.title("Probabilistic Project Planning")
 
-# # Carregar os dados
-uploaded_file = st.file_uploader("Upload the Excel file with project data", type=["xlsx"])
+# Perfil de desempenho (opcional): tempo, memória de pico e tamanhos (CPDs, fatores) de cada etapa
+# desta execução. O painel é atualizado a cada etapa concluída, então continua visível mesmo quando
+# a página para antes do fim (st.stop()). O perfil da execução anterior é encerrado aqui, pois ela
+# pode ter parado sem chegar ao fim (e o tracemalloc vale para o processo inteiro).
+if "perfil" in st.session_state:
+    st.session_state.pop("perfil").stop()
+if st.sidebar.checkbox("Show stage timings", value=False, help="Wall time, peak memory and sizes of every stage of this run."):
+    medir_memoria = st.sidebar.checkbox("Track peak memory (slower)", value=False)
+    painel_perfil = st.sidebar.empty()
 
-if uploaded_file is not None:
-    # Carrega todas as planilhas disponíveis
-    xls = pd.ExcelFile(uploaded_file)
-    sheet_names = xls.sheet_names
+    def mostrar_perfil(perfil):
+        with painel_perfil.container():
+            with st.expander(f"Stage timings ({perfil.total_seconds():.2f} s)", expanded=True):
+                st.dataframe(perfil.table(), hide_index=True)
 
-    # Permite o usuário selecionar a planilha
-    default_index = sheet_names.index("Plan") if "Plan" in sheet_names else 0
-    selected_sheet = st.selectbox("Select the sheet:", sheet_names, index=default_index)
+    st.session_state.perfil = Profiler(memory=medir_memoria, on_record=mostrar_perfil)
+    st.session_state.perfil.start()
 
-    # Lê a planilha selecionada
-    df = pd.read_excel(xls, sheet_name=selected_sheet)
+# # Carregar os dados
+uploaded_file = st.file_uploader("Upload the project file (Excel, CSV, Parquet or Feather)", type=list(SUPPORTED_FORMATS))
+
+if uploaded_file is not None:
+    dados_arquivo = uploaded_file.getvalue()
+    cache = SimulationCache()
+
+    # Permite o usuário selecionar a planilha (apenas arquivos Excel têm várias)
+    try:
+        abas = sheet_names(dados_arquivo, uploaded_file.name)
+    except ProjectValidationError as e:
+        st.error(f"Invalid project file: {e}")
+        st.stop()
+    selected_sheet = None
+    if abas:
+        default_index = abas.index("Plan") if "Plan" in abas else 0
+        selected_sheet = st.selectbox("Select the sheet:", abas, index=default_index)
+
+    # Lê, limpa e valida a planilha (códigos, predecessores, parâmetros e ciclos) uma única vez por arquivo
+    try:
+        df, schedule = load_project(dados_arquivo, uploaded_file.name, selected_sheet, THREE_POINT_COLUMNS, cache)
+    except ProjectValidationError as e:
+        st.error(f"Invalid project network: {e}")
+        st.stop()
 
 else:
-    st.warning("Please upload an Excel file containing the Graph (.xlsx)")
+    st.warning("Please upload a project file (.xlsx, .csv, .parquet or .feather)")
     st.stop()
 
 # --------------------------------------------------------------------
 # Calculando distribuições
 
 distribuicao = "triangular"
+NIVEIS_CONFIANCA = np.round(np.arange(0.01, 1.0001, 0.01), 2)
 
 
 # Número de amostras
-n=10000
-# n = st.number_input(label="Enter the number of samples:", min_value=0, step=1, format="%d")
-# if n is None or n <= 0:
-#     st.warning("Please enter a positive integer number of samples.")
-#     st.stop()
-
-df_amostras = generate_samples(df, distribuicao, n)
+n = st.number_input(label="Enter the number of samples:", min_value=1, value=10000, step=1000, format="%d")
+seed = st.number_input(label="Random seed:", min_value=0, value=42, step=1, format="%d", help="The same seed always reproduces the same scenarios.")
+
+
+# Serviço de jobs local (opcional): com JOB_SERVICE_URL definido, a amostragem e a construção da rede
+# rodam nos processos do serviço, fora desta sessão. Os resultados voltam pelo cache em disco compartilhado
+# (mesmo SIMULATION_CACHE_DIR) e jobs idênticos de usuários diferentes rodam uma única vez.
+cliente_jobs = None
+url_servico_jobs = os.environ.get("JOB_SERVICE_URL")
+if url_servico_jobs and st.sidebar.checkbox("Run heavy steps on the job service", value=True, help=f"Job service at {url_servico_jobs}"):
+    cliente_jobs = JobClient(url_servico_jobs)
+    if not cliente_jobs.available():
+        st.sidebar.warning("The job service is not answering. Running every step here.")
+        cliente_jobs = None
+
+
+def executar_no_servico(tipo, configuracao, rotulo):
+    """
+    Envia uma etapa pesada ao serviço de jobs e acompanha o progresso até o fim.
+
+    Se o job falhar (ou o serviço não compartilhar o cache), a etapa roda localmente em seguida.
+    """
+    barra = st.progress(0.0, text=rotulo)
+    try:
+        job = cliente_jobs.submit(tipo, dados_arquivo, uploaded_file.name, selected_sheet, configuracao)
+        job = cliente_jobs.wait(job["id"], lambda estado: barra.progress(estado["progress"], text=f"{rotulo}: {estado['message']}"))
+    except OSError as e:
+        job = {"status": "failed", "error": str(e)}
+    barra.empty()
+    if job["status"] != "done":
+        st.warning(f"The job service could not run this step ({job['error']}). Running it here.")
+    elif not cache.contains(job["result"]["samples_key"], "samples"):
+        st.warning("The job service does not share this app's cache directory (SIMULATION_CACHE_DIR). Running the step here.")
+
+
+def atividades_alteradas(base, estrutura=None):
+    """
+    Compara a planilha atual com a execução anterior de uma etapa (modo incremental).
+
+    Retorna as atividades cujos parâmetros mudaram, ou None se a etapa precisa ser refeita por
+    completo (sem execução anterior, outro número de amostras, outra semente ou outra rede).
+    """
+    if base is None or (base["n"], base["seed"]) != (int(n), int(seed)) or base.get("estrutura") != estrutura:
+        return None
+    return changed_activities(base["df"], df, distribuicao)
+
+
+def registrar_execucao(etapa, chave, estrutura=None, **extras):
+    """Guarda a planilha e a chave de cache de uma etapa, base da próxima execução incremental."""
+    st.session_state[etapa] = {"df": df, "n": int(n), "seed": int(seed), "chave": chave, "estrutura": estrutura, **extras}
+
+
+# Amostragem em blocos independentes (SeedSequence), em paralelo para execuções grandes.
+# O resultado fica no cache em disco, indexado pelo conteúdo da planilha e pelos parâmetros.
+# Cada atividade tem seu próprio fluxo aleatório: depois de uma edição, só as colunas alteradas são sorteadas de novo.
+chave_amostras = cache.make_key("samples", df, distribuicao, int(n), int(seed))
+
+
+def gerar_amostras():
+    base = st.session_state.get("base_amostras")
+    alteradas = atividades_alteradas(base)
+    anteriores = cache.load_array(base["chave"], "samples") if alteradas is not None else None
+    if anteriores is None:
+        return generate_samples_parallel(df, distribuicao, int(n), seed=int(seed)).to_numpy()
+    return resample_activities(anteriores, df, distribuicao, alteradas, seed=int(seed))
+
+
+# Execuções completas vão para o serviço de jobs; as incrementais são rápidas e ficam aqui
+if cliente_jobs is not None and not cache.contains(chave_amostras, "samples") and atividades_alteradas(st.session_state.get("base_amostras")) is None:
+    executar_no_servico("samples", {"distribution": distribuicao, "n_samples": int(n), "seed": int(seed)}, "Sampling durations")
+amostras = cache.get_array(chave_amostras, "samples", gerar_amostras)
+registrar_execucao("base_amostras", chave_amostras)
+df_amostras = pd.DataFrame(amostras, columns=df["Code"].tolist(), copy=False)
 # --------------------------------------------------------------------
 
 # Exibir os dois DataFrames
@@ -63,26 +162,11 @@ st.subheader("Sample Statistics")
 st.dataframe(df_amostras.describe().T)
 
 
-# Criar o grafo direcionado
-G = nx.DiGraph()
-G.graph['graph'] = {'rankdir': 'LR'}
-
-# Adicionar nós e arestas no grafo
-for _, row in df.iterrows():
-    # Adiciona o nó (atividade)
-    G.add_node(row['Code'], label=row['Task Name'])
-    
-    # Se houver predecessoras, adicionar aresta
-    if row['Predecessors'] != '-':
-        predecessors = row['Predecessors'].split(',')
-        for pred in predecessors:
-            G.add_edge(pred, row['Code'])
+# Criar o grafo direcionado (usado apenas para o desenho)
+G = schedule.to_networkx()
 
 #Mostrar grafo
-tempos_caminho_critico = []
-caminhos_encontrados = []
-
-nos_finais_grafo = [n for n, d in G.out_degree() if d == 0]
+nos_finais_grafo = schedule.sinks
 if not nos_finais_grafo:
     st.error("Could not find an end node in the project graph.")
     st.session_state.clear()
@@ -91,35 +175,54 @@ if not nos_finais_grafo:
 # Assumindo um único nó final para simplificar
 no_final_projeto = nos_finais_grafo[0]
 
+# Estrutura de precedências: as etapas incrementais só reaproveitam execuções com a mesma rede
+estrutura_rede = [(codigo, tuple(schedule.predecessors(codigo))) for codigo in schedule.nodes]
+
 #Selecionar nós para calcular caminho crítico
 atividades = df["Task Name"].tolist()
 st.header("Graph analysis")
 st.write("Default pattern: Using first activity as start node and last activity as end node from Excel data.")
 
-atividade_para_codigo = {f"{row['Task Name']} ({row['Code']})": row['Code'] for _, row in df.iterrows()}
+atividade_para_codigo = dict(zip(df["Task Name"] + " (" + df["Code"] + ")", df["Code"]))
 opcoes = list(atividade_para_codigo.keys())
 valor_default = [k for k, v in atividade_para_codigo.items() if v == no_final_projeto][0]
 start_node = st.selectbox("Enter start node for critical path::",opcoes)
 end_node = st.selectbox("Enter end node for critical path:", list(atividade_para_codigo.keys()), index=opcoes.index(valor_default))
 if st.button("Generate Critical Path"):
-    for i in range(n):
-        for codigo in df['Code']:
-            G.nodes[codigo]['duration'] = df_amostras.at[i, codigo] #atribui o valor de cada atividade naquela amostra ao grafo
-        
-        try:
-            pesos = {codigo: G.nodes[codigo]['duration'] for codigo in G.nodes}
-            caminho = max_path_dag_node_weights(G, pesos, atividade_para_codigo[start_node], atividade_para_codigo[end_node])
-            caminhos_encontrados.append(caminho['caminho'])
-            tempos_caminho_critico.append(caminho['peso_total'])
-        except Exception as e:
-            caminhos_encontrados.append("Error")
-            tempos_caminho_critico.append(np.nan)
-
-
+    # Todas as amostras de uma vez (uma única ordenação topológica), reaproveitando o cache em disco
+    inicio_caminho, fim_caminho = atividade_para_codigo[start_node], atividade_para_codigo[end_node]
+    chave_caminho = cache.make_key("makespans", chave_amostras, inicio_caminho, fim_caminho)
+    makespans = cache.load_array(chave_caminho, "makespans")
+    if makespans is not None:
+        resultado_lote = {"peso_total": makespans, "predecessor": cache.load_array(chave_caminho, "predecessor"), "nodes": schedule.nodes}
+    else:
+        # Modo incremental: só as atividades alteradas e seus sucessores são recalculados
+        base = st.session_state.get("base_caminho")
+        alteradas = atividades_alteradas(base, estrutura_rede) if base is not None and base["nos"] == (inicio_caminho, fim_caminho) else None
+        anterior = None
+        if alteradas is not None:
+            anterior = {"distancia": cache.load_array(base["chave"], "distancia"), "predecessor": cache.load_array(base["chave"], "predecessor")}
+            if anterior["distancia"] is None or anterior["predecessor"] is None:
+                anterior = None
+        resultado_lote = max_path_dag_node_weights_batch(schedule, df_amostras, inicio_caminho, fim_caminho, previous=anterior, changed=alteradas)
+        if isinstance(resultado_lote, str):
+            st.error(resultado_lote)
+            st.stop()
+        cache.save_array(chave_caminho, "distancia", resultado_lote["distancia"])
+        cache.save_array(chave_caminho, "predecessor", resultado_lote["predecessor"])
+        cache.save_array(chave_caminho, "makespans", resultado_lote["peso_total"])
+    registrar_execucao("base_caminho", chave_caminho, estrutura_rede, nos=(inicio_caminho, fim_caminho))
+
+    st.session_state.resultado_lote = resultado_lote
+    st.session_state.chave_resultado = chave_amostras
+    # CPM completo (ida e volta) em todas as amostras: folgas e índice de criticidade de cada atividade
+    st.session_state.resumo_cpm = cache.get_object(cache.make_key("cpm", chave_amostras), "cpm_summary", lambda: cpm_summary(cpm_batch(schedule, df_amostras)))
+    st.session_state.no_final_caminho = atividade_para_codigo[end_node]
     st.session_state.df_resultado = pd.DataFrame({
-        "Caminho Crítico": caminhos_encontrados,
-        "Makespan": tempos_caminho_critico
+        "Makespan": resultado_lote["peso_total"]
     })
+    # Curva de risco completa (uma ordenação + bootstrap vetorizado), no mesmo passo do input de confiança
+    st.session_state.perfil_risco = cache.get_object(chave_caminho, "risk_profile", lambda: risk_profile(resultado_lote["peso_total"], NIVEIS_CONFIANCA, seed=int(seed)))
 
     # st.subheader("Critical Path by Sample")
     # st.dataframe(st.session_state.df_resultado)
@@ -127,6 +230,11 @@ if st.button("Generate Critical Path"):
     st.subheader("Critical Path Statistics")
     st.dataframe(st.session_state.df_resultado["Makespan"].describe().to_frame())
 
+# Resultados de outras amostras (projeto, n ou seed alterados) não valem mais: são descartados
+if st.session_state.get("chave_resultado") != chave_amostras:
+    for chave in ("df_resultado", "resultado_lote", "resumo_cpm", "perfil_risco", "no_final_caminho", "chave_resultado"):
+        st.session_state.pop(chave, None)
+
 if "df_resultado" in st.session_state:
     df_resultado = st.session_state.df_resultado
     st.subheader("Makespan Scenarios")
@@ -138,24 +246,33 @@ if "df_resultado" in st.session_state:
     ax.set_ylabel("Density")
 
     st.pyplot(fig)
+
+    st.subheader("Activity Criticality")
+    st.caption("Criticality index: fraction of the scenarios in which the activity has zero total float (it is on a critical path).")
+    resumo_cpm = st.session_state.resumo_cpm.copy()
+    resumo_cpm.insert(1, "Task Name", resumo_cpm["Code"].map(dict(zip(df["Code"], df["Task Name"]))))
+    st.dataframe(resumo_cpm)
 # GENERATE CRITICAL PATH IMAGE -----------------
     mediana_makespan = np.median(st.session_state.df_resultado["Makespan"])
     idx_mediano = (st.session_state.df_resultado["Makespan"] - mediana_makespan).abs().idxmin()
-    caminho_critico_mediano = st.session_state.df_resultado.loc[idx_mediano, "Caminho Crítico"]
-    for codigo in G.nodes:
-        G.nodes[codigo]['duration'] = round(df_amostras.at[idx_mediano, codigo], 2)
-    fig = generate_graph(G, critical_path=caminho_critico_mediano)
-
-    buf = io.BytesIO()
-    fig.savefig(buf, format="png", bbox_inches="tight")
-    buf.seek(0)
-
-    st.download_button(
-        label="📥 Download Critical Path Image",
-        data=buf,
-        file_name="critical_path.png",
-        mime="image/png"
-    )
+    caminho_critico_mediano = batch_critical_path(st.session_state.resultado_lote, idx_mediano, st.session_state.no_final_caminho)
+
+    # A imagem só é desenhada quando o usuário pede (o layout do grafo fica em cache pela estrutura)
+    formato_imagem = st.radio("Image format:", ["png", "svg"], horizontal=True)
+    chave_imagem = (chave_amostras, int(idx_mediano), tuple(caminho_critico_mediano), formato_imagem)
+    if st.button("Prepare Critical Path Image"):
+        for codigo in G.nodes:
+            G.nodes[codigo]['duration'] = round(df_amostras.at[idx_mediano, codigo], 2)
+        fig = generate_graph(G, critical_path=caminho_critico_mediano)
+        st.session_state.imagem_caminho = (chave_imagem, figure_bytes(fig, formato_imagem))
+
+    if st.session_state.get("imagem_caminho", (None, None))[0] == chave_imagem:
+        st.download_button(
+            label="📥 Download Critical Path Image",
+            data=st.session_state.imagem_caminho[1],
+            file_name=f"critical_path.{formato_imagem}",
+            mime="image/png" if formato_imagem == "png" else "image/svg+xml"
+        )
 # --------------------------------------------------------------------
 
     st.header("Risk Analysis")
@@ -163,28 +280,95 @@ if "df_resultado" in st.session_state:
     if(confidence_level <= 0.00):
         st.warning("Enter a confidence rate to calculate Var and Cvar")
         st.stop()
-    var = value_at_risk(tempos_finais, confidence_level=confidence_level)
-
-    cvar = conditional_value_at_risk(tempos_finais,confidence_level=confidence_level)
-
-    st.metric(label=f"Value at Risk (VaR) at {confidence_level*100:.0f}%", value=f"{var:.2f} days", help="The project duration will not exceed this value with the specified confidence.")
-    st.metric(label=f"Conditional VaR (CVaR) at {confidence_level*100:.0f}%", value=f"{cvar:.2f} days", help="In the worst-case scenarios (beyond the VaR), this is the expected average project duration.")
+    perfil = st.session_state.perfil_risco
+    idx_nivel = int(np.argmin(np.abs(perfil["levels"] - confidence_level)))
+    var, cvar = perfil["var"][idx_nivel], perfil["cvar"][idx_nivel]
+    var_ic, cvar_ic = perfil["var_ci"][idx_nivel], perfil["cvar_ci"][idx_nivel]
+
+    st.metric(label=f"Value at Risk (VaR) at {confidence_level*100:.0f}%", value=f"{var:.2f} days", help=f"The project duration will not exceed this value with the specified confidence. 95% bootstrap interval: {var_ic[0]:.2f} to {var_ic[1]:.2f} days.")
+    st.metric(label=f"Conditional VaR (CVaR) at {confidence_level*100:.0f}%", value=f"{cvar:.2f} days", help=f"In the worst-case scenarios (beyond the VaR), this is the expected average project duration. 95% bootstrap interval: {cvar_ic[0]:.2f} to {cvar_ic[1]:.2f} days.")
+
+    fig_risco, ax_risco = plt.subplots()
+    ax_risco.plot(perfil["levels"], perfil["var"], color='steelblue', label="VaR")
+    ax_risco.fill_between(perfil["levels"], perfil["var_ci"][:, 0], perfil["var_ci"][:, 1], color='steelblue', alpha=0.25)
+    ax_risco.plot(perfil["levels"], perfil["cvar"], color='coral', label="CVaR")
+    ax_risco.fill_between(perfil["levels"], perfil["cvar_ci"][:, 0], perfil["cvar_ci"][:, 1], color='coral', alpha=0.25)
+    ax_risco.axvline(confidence_level, color='black', linestyle='--', linewidth=1)
+    ax_risco.set_title("Risk Curve (95% bootstrap bands)")
+    ax_risco.set_xlabel("Confidence level")
+    ax_risco.set_ylabel("Days")
+    ax_risco.legend()
+    st.pyplot(fig_risco)
 
 # ------------------- REDE BAYESIANA -------------------
 st.header("Bayesian Network Analysis")
 
+# Discretização: menos estados por atividade deixam a rede menor e a inferência mais rápida
+col_metodo, col_largura, col_estados = st.columns(3)
+metodo_discretizacao = col_metodo.selectbox("Discretization:", ["width", "quantile"], format_func=lambda m: {"width": "Fixed-width bins", "quantile": "Quantile bins"}[m])
+largura_bin = col_largura.number_input("Bin width (days):", min_value=1, value=1, step=1, format="%d", disabled=metodo_discretizacao == "quantile")
+max_estados = col_estados.number_input("Max. states per activity (0 = no limit):", min_value=0, value=0 if metodo_discretizacao == "width" else 10, step=1, format="%d")
+max_estados = int(max_estados) or (None if metodo_discretizacao == "width" else 10)
+
 with st.spinner("Discretizing samples and building the Bayesian Network... This may take a few minutes."):
 
-    params_discretizacao = discretize_by_whole_days(df_amostras)
+    opcoes_discretizacao = (metodo_discretizacao, int(largura_bin), max_estados)
+    chave_discretizacao = cache.make_key("discretization", chave_amostras, *opcoes_discretizacao)
+
+    def discretizar():
+        # Cada coluna é discretizada de forma independente: após uma edição, só as alteradas são refeitas
+        base = st.session_state.get("base_discretizacao")
+        alteradas = atividades_alteradas(base) if base is not None and base["opcoes"] == opcoes_discretizacao else None
+        anteriores = cache.load_object(base["chave"], "discretization") if alteradas is not None else None
+        if anteriores is None:
+            return discretize_durations(df_amostras, bin_width=int(largura_bin), method=metodo_discretizacao, max_states=max_estados)
+        params = dict(anteriores)
+        if alteradas:
+            params.update(discretize_durations(df_amostras[alteradas], bin_width=int(largura_bin), method=metodo_discretizacao, max_states=max_estados))
+        return params
+
+    base = st.session_state.get("base_discretizacao")
+    execucao_completa = base is None or base["opcoes"] != opcoes_discretizacao or atividades_alteradas(base) is None
+    if cliente_jobs is not None and execucao_completa and not cache.contains(chave_discretizacao, "discretization"):
+        configuracao = {"distribution": distribuicao, "n_samples": int(n), "seed": int(seed), "method": metodo_discretizacao, "bin_width": int(largura_bin), "max_states": max_estados}
+        executar_no_servico("bayesian_network", configuracao, "Building the Bayesian Network")
+    params_discretizacao = cache.get_object(chave_discretizacao, "discretization", discretizar)
+    registrar_execucao("base_discretizacao", chave_discretizacao, opcoes=opcoes_discretizacao)
+    with st.expander("Discretization error"):
+        st.dataframe(discretization_report(params_discretizacao))
 
     st.session_state.params_discretizacao_bayesiano = params_discretizacao
 
-    modelo_bayesiano = build_generic_bayesian_network(df, params_discretizacao)
-    st.session_state.modelo_bayesiano = modelo_bayesiano
+    # Modelo salvo localmente: projetos já construídos carregam em milissegundos, mesmo em outras sessões.
+    # O serviço de inferência (ordem de eliminação e resultados em cache) vive enquanto o modelo não mudar
+    chave_modelo = bayesian_network_key(schedule, params_discretizacao, compact=True)
+    if st.session_state.get("chave_modelo_bayesiano") != chave_modelo:
+        # Com a mesma rede de precedências, o modelo anterior é atualizado: só as CPTs afetadas pela edição são refeitas
+        modelo_anterior = st.session_state.get("modelo_bayesiano") if st.session_state.get("estrutura_modelo_bayesiano") == estrutura_rede else None
+        modelo_bayesiano = load_or_build_bayesian_network(df, params_discretizacao, schedule, cache, compact=True, previous=modelo_anterior)
+        st.session_state.modelo_bayesiano = modelo_bayesiano
+        st.session_state.servico_inferencia = InferenceService(modelo_bayesiano)
+        st.session_state.chave_modelo_bayesiano = chave_modelo
+        st.session_state.estrutura_modelo_bayesiano = estrutura_rede
     
+    # Índice das amostras por estado de duração: evidências viram interseções de bitmaps
+    chave_indice = (chave_discretizacao, no_final_projeto)
+    if st.session_state.get("chave_indice_amostras") != chave_indice:
+        estados = assign_states(df_amostras, params_discretizacao)
+        duracoes_discretas = np.column_stack([np.asarray(params_discretizacao[codigo]['labels'])[estados[:, j]] for j, codigo in enumerate(df_amostras.columns)])
+        # Términos da execução anterior: só as atividades alteradas e seus sucessores são recalculados
+        base = st.session_state.get("base_indice")
+        alteradas = atividades_alteradas(base, estrutura_rede) if base is not None and base["opcoes"] == opcoes_discretizacao else None
+        termino = earliest_finish_batch(schedule, duracoes_discretas, nodes=list(df_amostras.columns),
+                                        previous=base["termino"] if alteradas is not None else None, changed=alteradas)
+        with profile_stage("sample_index"):
+            st.session_state.indice_amostras = SampleIndex(df_amostras, params_discretizacao, termino[:, schedule.index[no_final_projeto]])
+        st.session_state.chave_indice_amostras = chave_indice
+        registrar_execucao("base_indice", chave_indice, estrutura_rede, opcoes=opcoes_discretizacao, termino=termino)
+
     # st.info(f"Project end node identified for inference: T_{no_final_projeto}")
 
-    inferencia = VariableElimination(modelo_bayesiano)
+    inferencia = st.session_state.servico_inferencia
     resultado_inferencia = inferencia.query(variables=[f"T_{no_final_projeto}"], show_progress=False)
 
     st.session_state.resultado_bayesiano = resultado_inferencia
@@ -239,28 +423,34 @@ if "resultado_bayesiano" in st.session_state:
             st.warning("Please select at least one evidence value to run the conditional analysis.")
         else:
             st.spinner("Calculating inference with the provided evidence...")
-            modelo_bayesiano = st.session_state.modelo_bayesiano
             no_final_projeto = st.session_state.no_final_projeto_bayesiano
 
-            inferencia = VariableElimination(modelo_bayesiano)
-            resultado_condicional = inferencia.query(
-                variables=[f"T_{no_final_projeto}"],
-                evidence=evidence_values,
-                show_progress=False
-            )
+            # Cenários já consultados voltam do cache do serviço; os novos reaproveitam fatores intermediários
+            inferencia = st.session_state.servico_inferencia
+            consulta_rede = lambda evidencias: inferencia.query(variables=[f"T_{no_final_projeto}"], evidence=evidencias, show_progress=False)
 
-            st.write("Conditional Probability Distribution:")
-            variable_name = resultado_condicional.variables[0]
-            time_bn_cond = resultado_condicional.state_names[variable_name]
-            probs_bn_cond = resultado_condicional.values
-            print(time_bn_cond, probs_bn_cond)
+            # Previsão pelas amostras que satisfazem as evidências; com poucas amostras, usa a rede bayesiana
+            previsao = st.session_state.indice_amostras.forecast(evidence_values, fallback=consulta_rede)
+            time_bn_cond = previsao["labels"]
+            probs_bn_cond = previsao["probs"]
 
-            # st.bar_chart(pd.DataFrame(probs_bn_cond, index=time_bn_cond))
+            st.write("Conditional Probability Distribution:")
             fig_bn, ax_bn = plt.subplots()
-            ax_bn.bar(time_bn_cond, probs_bn_cond, color='coral', edgecolor='black')
+            ax_bn.bar(time_bn_cond, probs_bn_cond, color='coral', edgecolor='black', label="Monte Carlo samples" if previsao["source"] == "samples" else "Bayesian Network")
+            if previsao["source"] == "samples":
+                # Conferência com a rede bayesiana
+                resultado_condicional = consulta_rede(evidence_values)
+                tempos_rede = resultado_condicional.state_names[resultado_condicional.variables[0]]
+                ax_bn.plot(tempos_rede, resultado_condicional.values, 'o--', color='black', label="Bayesian Network")
+                probs_rede = dict(zip(tempos_rede, resultado_condicional.values))
+                diferenca = max(abs(p - probs_rede.get(t, 0.0)) for t, p in zip(time_bn_cond, probs_bn_cond))
+                st.caption(f"Estimated from {previsao['effective_sample_size']} matching samples (largest difference to the Bayesian Network: {diferenca:.3f}).")
+            else:
+                st.caption(f"Only {previsao['effective_sample_size']} samples match the evidence: computed with the Bayesian Network.")
             ax_bn.set_title("Makespan")
             ax_bn.set_xlabel("Days")
             ax_bn.set_ylabel("Probability")
+            ax_bn.legend()
             st.pyplot(fig_bn)
 
             idx_max = np.argmax(probs_bn_cond)
@@ -281,3 +471,33 @@ if "resultado_bayesiano" in st.session_state:
             st.write(f"- **Min:** {valor_min} days")
             st.write(f"- **Max:** {valor_max} days")
             st.write(f"- **Most probable scenario:** {most_probable_value} days (p={most_probable_prob:.2f})")
+
+    # --- Análise de sensibilidade ---
+    st.subheader("Sensitivity Analysis")
+    st.write("How much each activity's duration moves the expected end date, from its shortest to its longest duration.")
+
+    if st.button("Run Sensitivity Sweep"):
+        # Uma única varredura (árvore de junção calibrada uma vez) substitui uma consulta por atividade e estado
+        with st.spinner("Computing the end date distribution for every activity duration..."):
+            varredura = sensitivity_sweep(st.session_state.modelo_bayesiano, f"T_{no_final_projeto}")
+        st.session_state.varredura_sensibilidade = varredura
+        st.session_state.chave_varredura = st.session_state.chave_modelo_bayesiano
+
+    if st.session_state.get("chave_varredura") == st.session_state.chave_modelo_bayesiano:
+        tornado = st.session_state.varredura_sensibilidade["tornado"].copy()
+        nomes = dict(zip(df["Code"], df["Task Name"]))
+        tornado.insert(1, "Task Name", tornado["Code"].map(nomes))
+        st.dataframe(tornado)
+
+        media_prior = float(np.dot(tempos_bn, probabilidades_bn))
+        fig_tornado, ax_tornado = plt.subplots(figsize=(8, max(2, 0.4 * len(tornado))))
+        posicoes = np.arange(len(tornado))[::-1]
+        ax_tornado.barh(posicoes, tornado["End date (shortest)"] - media_prior, left=media_prior, color='steelblue', label="Shortest duration")
+        ax_tornado.barh(posicoes, tornado["End date (longest)"] - media_prior, left=media_prior, color='coral', label="Longest duration")
+        ax_tornado.axvline(media_prior, color='black', linewidth=1)
+        ax_tornado.set_yticks(posicoes)
+        ax_tornado.set_yticklabels(tornado["Task Name"])
+        ax_tornado.set_xlabel("Expected days to completion")
+        ax_tornado.set_title("Tornado Chart")
+        ax_tornado.legend()
+        st.pyplot(fig_tornado)
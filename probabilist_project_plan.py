@@ -1,58 +1,360 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
 import pandas as pd
-from parepy_toolbox import random_sampling
-import streamlit as st
+from scipy import special
+
+from caminho_critico_node import max_path_dag_node_weights_batch
+from compiled_schedule import CompiledSchedule
+from profiling import profiled, record_details
+from var_cvar import StreamingRiskEstimator
+
+SUPPORTED_DISTRIBUTIONS = ("triangular", "pert", "normal", "lognormal")
 
-def generate_samples(df: pd.DataFrame, distribution: str, n_samples: int) -> pd.DataFrame:
+# Draws skipped by one `PCG64.jumped` step (from its documentation)
+_PCG64_JUMP = 210306068529402873165736369884012333109
+
+
+def generate_samples(df: pd.DataFrame, distribution: str, n_samples: int, seed: Optional[int] = None, dtype: Any = np.float64) -> pd.DataFrame:
     """
     Generate activity duration samples based on a specified probability distribution.
 
-    This function reads parameters from a DataFrame, builds parameter dictionaries
-    for the 'triangular' or 'normal' distribution, and then generates 'n_samples'
-    for each activity using Latin Hypercube Sampling (LHS).
+    This function reads the distribution parameters of all activities as arrays and draws the
+    whole Latin Hypercube Sampling (LHS) matrix at once with `generate_sample_matrix`.
 
     :param df: DataFrame containing the project activity data.
-               It must include the 'Code' and 'Parameters' columns.
-    :param distribution: The type of probability distribution to use ('triangular' or 'normal').
+               It must include the 'Code' column and the parameter columns of the distribution:
+               'Min.', 'Mode' and 'Max.' ('triangular', 'pert') or 'Mean' and 'Std' ('normal', 'lognormal').
+    :param distribution: The type of probability distribution to use ('triangular', 'pert', 'normal' or 'lognormal').
     :param n_samples: The number of samples to generate for each activity.
+    :param seed: The seed of the random generator. None draws fresh entropy from the operating system.
+    :param dtype: The floating point type of the samples (np.float64 or np.float32).
 
     :return: A pandas DataFrame where each column represents an activity (by its 'Code')
              and each row contains a sample of the activity duration.
 
-    :raises st.error: If an unsupported distribution type is specified in the Excel file.
+    :raises ValueError: If an unsupported distribution type is specified in the Excel file.
     """
+    return pd.DataFrame(generate_sample_matrix(df, distribution, n_samples, seed, dtype), columns=df["Code"].tolist(), copy=False)
 
-    samples = {}
-    params = {}
-    # Calculate for triangular distribution
-    if distribution == "triangular":
-        params = {
-            row["Code"]: {
-                "min": float(row["Min."]),
-                "mode": float(row["Mode"]),
-                "max": float(row["Max."]),
-            }
-            for _, row in df.iterrows()
-        }
-    # Calculate for normal distribution
-    elif distribution == "normal":
-        params = {
-            row["Code"]: {
-                "mean": float(row["Mean"]),
-                "std": float(row["Std"]),
-            }
-            for _, row in df.iterrows()
+
+def generate_sample_matrix(df: pd.DataFrame, distribution: str, n_samples: int, seed: Optional[int] = None, dtype: Any = np.float64) -> np.ndarray:
+    """
+    Draws the full LHS duration matrix of all activities in one vectorized call.
+
+    The parameter columns are read as arrays, an (n_samples x n_activities) Latin Hypercube design
+    is drawn (one stream per activity, see `_latin_hypercube`) and mapped through the closed-form
+    (or `scipy.special`) inverse CDF of the distribution in one vectorized call.
+
+    :param df: DataFrame containing the project activity data (see `generate_samples`).
+    :param distribution: The type of probability distribution to use ('triangular', 'pert', 'normal' or 'lognormal').
+    :param n_samples: The number of samples to generate for each activity.
+    :param seed: The seed of the random generator. None draws fresh entropy from the operating system.
+    :param dtype: The floating point type of the samples (np.float64 or np.float32).
+
+    :return: A C-contiguous array of shape (n_samples, n_activities), columns in the row order of `df`.
+
+    :raises ValueError: If the distribution is not supported.
+    """
+    parameters = _distribution_parameters(df, distribution)
+    return _sample_chunk(distribution, parameters, n_samples, _activity_streams(df["Code"], seed), 0, dtype)
+
+
+def _distribution_parameters(df: pd.DataFrame, distribution: str) -> dict:
+    """
+    Reads the distribution parameters of every activity as arrays.
+
+    :param df: DataFrame containing the project activity data.
+    :param distribution: The type of probability distribution ('triangular', 'pert', 'normal' or 'lognormal').
+    :return: A dictionary of 1D arrays (one entry per activity) used by `_inverse_cdf`.
+    :raises ValueError: If the distribution is not supported, or if a 'lognormal' activity has a
+                        non-positive Mean or Std (its logarithm would be undefined).
+    """
+    if distribution in ("triangular", "pert"):
+        return {
+            "min": df["Min."].to_numpy(dtype=float),
+            "mode": df["Mode"].to_numpy(dtype=float),
+            "max": df["Max."].to_numpy(dtype=float),
         }
-    else: 
-        st.error("Unsupported distribution specified in the Excel file.")
-
-    # Generate samples
-    for k, p in params.items():
-        samples[k] = random_sampling(
-            dist=distribution,
-            parameters=p,
-            method='lhs',
-            n_samples=n_samples
-        )
-
-    # Convert samples to DataFrame
-    return pd.DataFrame(samples)
\ No newline at end of file
+    elif distribution in ("normal", "lognormal"):
+        mean, std = df["Mean"].to_numpy(dtype=float), df["Std"].to_numpy(dtype=float)
+        if distribution == "lognormal":
+            invalid = df["Code"][~((mean > 0) & (std > 0))].tolist()
+            if invalid:
+                raise ValueError(f"The lognormal distribution needs Mean > 0 and Std > 0. Check activities: {', '.join(map(str, invalid[:10]))}.")
+        return {"mean": mean, "std": std}
+    raise ValueError(f"Unsupported distribution: {distribution}. Use one of {', '.join(SUPPORTED_DISTRIBUTIONS)}.")
+
+
+def _activity_streams(codes: Any, seed: Optional[int]) -> List[np.random.PCG64]:
+    """
+    Creates the random stream of every activity from its code and the root seed.
+
+    Every activity draws from its own stream, identified by its full code (through its SHA-256
+    digest), so the samples of an activity do not depend on the other rows of the sheet (common
+    random numbers across edits) and two codes never share a stream. The streams are created once
+    per run; every chunk then draws from its own jump of each stream (see `_latin_hypercube`).
+
+    :param codes: The activity codes, in the column order of the samples.
+    :param seed: The root seed. None draws fresh entropy from the operating system.
+    :return: One `np.random.PCG64` per activity.
+    """
+    entropy = np.random.SeedSequence(seed).entropy
+    streams = []
+    for code in codes:
+        digest = np.frombuffer(hashlib.sha256(str(code).encode()).digest(), dtype=np.uint32)
+        streams.append(np.random.PCG64(np.random.SeedSequence(entropy, spawn_key=tuple(int(word) for word in digest))))
+    return streams
+
+
+def changed_activities(old_df: pd.DataFrame, new_df: pd.DataFrame, distribution: str) -> Optional[List[Any]]:
+    """
+    Lists the activities whose distribution parameters differ between two versions of a sheet.
+
+    Because every activity samples from its own stream (see `_activity_streams`), the samples
+    of the other activities are identical for the same seed and sample count, and only the returned
+    activities need to be resampled.
+
+    :param old_df: The previous project sheet.
+    :param new_df: The edited project sheet.
+    :param distribution: The type of probability distribution (selects the parameter columns).
+    :return: The codes of the changed activities, in sheet order, or None if the activities themselves
+             (codes or their order) differ.
+    :raises ValueError: If the distribution is not supported or its parameters are invalid.
+    """
+    if old_df["Code"].tolist() != new_df["Code"].tolist():
+        return None
+    old_parameters = _distribution_parameters(old_df, distribution)
+    new_parameters = _distribution_parameters(new_df, distribution)
+    changed = np.zeros(len(new_df), dtype=bool)
+    for name, values in new_parameters.items():
+        changed |= ~np.isclose(old_parameters[name], values, rtol=0, atol=0, equal_nan=True)
+    return new_df["Code"][changed].tolist()
+
+
+def _inverse_cdf(distribution: str, uniforms: np.ndarray, parameters: dict) -> np.ndarray:
+    """
+    Maps a matrix of uniforms through the inverse CDF of each column's distribution.
+
+    - 'triangular': closed form on Min./Mode/Max.
+    - 'pert': Beta-PERT on Min./Mode/Max., with shapes 1 + 4 (mode - min) / (max - min) and 1 + 4 (max - mode) / (max - min).
+    - 'normal': Mean/Std.
+    - 'lognormal': Mean/Std of the duration itself (not of its logarithm).
+
+    Activities with Max. equal to Min. are constant.
+    """
+    if distribution in ("triangular", "pert"):
+        low, mode, high = parameters["min"], parameters["mode"], parameters["max"]
+        width = high - low
+        degenerate = width <= 0
+        safe_width = np.where(degenerate, 1.0, width)
+        if distribution == "triangular":
+            c = (mode - low) / safe_width
+            left = low + np.sqrt(uniforms * width * (mode - low))
+            right = high - np.sqrt((1 - uniforms) * width * (high - mode))
+            values = np.where(uniforms < c, left, right)
+        else:
+            alpha = 1 + 4 * (mode - low) / safe_width
+            beta = 1 + 4 * (high - mode) / safe_width
+            values = low + width * special.betaincinv(alpha, beta, uniforms)
+        return np.where(degenerate, low, values)
+
+    mean, std = parameters["mean"], parameters["std"]
+    if distribution == "normal":
+        return mean + std * special.ndtri(uniforms)
+    sigma = np.sqrt(np.log1p((std / mean) ** 2))
+    mu = np.log(mean) - sigma ** 2 / 2
+    return np.exp(mu + sigma * special.ndtri(uniforms))
+
+
+def _latin_hypercube(streams: List[np.random.PCG64], chunk: int, n_samples: int) -> np.ndarray:
+    """
+    Draws a Latin Hypercube design in [0, 1) with one column per activity.
+
+    Each column has its own stratum permutation and jitter, drawn from the activity's stream jumped
+    `chunk` times (as `PCG64.jumped`, which leaves the stream itself untouched), so a column does not
+    depend on the other activities and the chunks never overlap. The columns cannot share one draw:
+    `resample_activities` redraws only some of them and must get the same values as a full run. A
+    single bit generator is loaded with the state of each stream instead of creating one per
+    activity, which dominated the time of wide networks with small chunks.
+    """
+    uniforms = np.empty((len(streams), n_samples))
+    bit_generator = np.random.PCG64(0)
+    rng = np.random.Generator(bit_generator)
+    for j, stream in enumerate(streams):
+        bit_generator.state = stream.state
+        bit_generator.advance(chunk * _PCG64_JUMP)
+        uniforms[j] = rng.permutation(n_samples) + rng.random(n_samples)
+    uniforms /= n_samples
+    return uniforms.T
+
+
+def _sample_chunk(distribution: str, parameters: dict, n_samples: int, streams: List[np.random.PCG64], chunk: int, dtype: Any = np.float64) -> np.ndarray:
+    """
+    Draws one chunk of Latin Hypercube samples for all activities from its own RNG streams.
+
+    :param distribution: The type of probability distribution.
+    :param parameters: The parameter arrays returned by `_distribution_parameters`.
+    :param n_samples: The number of samples in this chunk.
+    :param streams: The random streams of the activities (see `_activity_streams`).
+    :param chunk: The number of this chunk, which selects its jump of every stream.
+    :param dtype: The floating point type of the returned samples.
+    :return: A C-contiguous array of shape (n_samples, n_activities).
+    """
+    uniforms = _latin_hypercube(streams, chunk, n_samples)
+    return np.ascontiguousarray(_inverse_cdf(distribution, uniforms, parameters), dtype=dtype)
+
+
+def _simulate_chunk(distribution: str, parameters: dict, n_samples: int, streams: List[np.random.PCG64], chunk: int, schedule: CompiledSchedule, start: Any, end: Any, return_samples: bool, relative_accuracy: Optional[float]) -> Tuple[Any, Optional[np.ndarray]]:
+    """
+    Samples one chunk and runs the batch critical path on it (executed inside the worker processes).
+
+    When `relative_accuracy` is given, the makespans are folded into a `StreamingRiskEstimator`
+    and only the estimator is sent back.
+    """
+    samples = _sample_chunk(distribution, parameters, n_samples, streams, chunk)
+    result = max_path_dag_node_weights_batch(schedule, samples, start, end, nodes=schedule.nodes)
+    if isinstance(result, str):
+        raise ValueError(result)
+    makespans = result["peso_total"]
+    if relative_accuracy is not None:
+        estimator = StreamingRiskEstimator(relative_accuracy)
+        estimator.update(makespans)
+        makespans = estimator
+    return makespans, samples if return_samples else None
+
+
+def _chunk_plan(n_samples: int, chunk_size: int) -> List[int]:
+    """Splits the sample budget in chunks (the chunk number selects its jump of every stream)."""
+    if n_samples <= 0:
+        raise ValueError("The number of samples must be a positive integer.")
+    sizes = [chunk_size] * (n_samples // chunk_size)
+    if n_samples % chunk_size:
+        sizes.append(n_samples % chunk_size)
+    return sizes
+
+
+@profiled("generate_samples")
+def generate_samples_parallel(df: pd.DataFrame, distribution: str, n_samples: int, seed: Optional[int] = None, chunk_size: int = 50_000, max_workers: Optional[int] = None, dtype: Any = np.float64) -> pd.DataFrame:
+    """
+    Generate activity duration samples in parallel, with reproducible independent RNG streams.
+
+    The sample budget is split in chunks of `chunk_size`. Each chunk draws from its own jump of every
+    activity stream (see `_activity_streams`), is sampled with Latin Hypercube Sampling in a process
+    pool and the chunks are concatenated in order. Because the chunking does not depend on
+    the number of workers, a given seed always produces the same samples. Every activity also has its
+    own stream inside a chunk, so passing only some rows of `df` (e.g., the activities listed by
+    `changed_activities`) reproduces exactly their columns of the full run.
+
+    :param df: DataFrame containing the project activity data (see `generate_samples`).
+    :param distribution: The type of probability distribution to use ('triangular', 'pert', 'normal' or 'lognormal').
+    :param n_samples: The total number of samples to generate for each activity.
+    :param seed: The root seed. None draws fresh entropy from the operating system.
+    :param chunk_size: The number of samples drawn by each task.
+    :param max_workers: The number of worker processes. None uses every core; 1 runs serially.
+    :param dtype: The floating point type of the samples (np.float64 or np.float32).
+
+    :return: A pandas DataFrame where each column represents an activity (by its 'Code')
+             and each row contains a sample of the activity duration.
+
+    :raises ValueError: If the distribution is not supported or `n_samples` is not positive.
+    """
+    parameters = _distribution_parameters(df, distribution)
+    streams = _activity_streams(df["Code"], seed)
+    sizes = _chunk_plan(n_samples, chunk_size)
+    n_chunks = len(sizes)
+    record_details(samples=n_samples, activities=len(df), chunks=n_chunks)
+    args = ([distribution] * n_chunks, [parameters] * n_chunks, sizes, [streams] * n_chunks, range(n_chunks), [dtype] * n_chunks)
+
+    if max_workers == 1 or n_chunks == 1:
+        chunks = list(map(_sample_chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_sample_chunk, *args))
+
+    return pd.DataFrame(np.concatenate(chunks), columns=df["Code"].tolist(), copy=False)
+
+
+@profiled("resample_activities")
+def resample_activities(samples: np.ndarray, df: pd.DataFrame, distribution: str, changed: List[Any], seed: Optional[int] = None, chunk_size: int = 50_000, max_workers: Optional[int] = None) -> np.ndarray:
+    """
+    Updates a sample matrix after the parameters of some activities were edited.
+
+    Only the columns of `changed` are drawn again, from the same streams (common random numbers),
+    so the result equals `generate_samples_parallel` on the edited sheet with the same seed and
+    chunk size, at the cost of the changed columns only.
+
+    :param samples: The sample matrix of the earlier run, of shape (n_samples, n_activities), with its
+                    columns in the row order of `df`. It is not modified.
+    :param df: The edited project sheet (same activities, in the same order, as the earlier run).
+    :param distribution: The type of probability distribution to use ('triangular', 'pert', 'normal' or 'lognormal').
+    :param changed: The codes of the edited activities (see `changed_activities`).
+    :param seed: The root seed of the earlier run.
+    :param chunk_size: The chunk size of the earlier run.
+    :param max_workers: The number of worker processes. None uses every core; 1 runs serially.
+
+    :return: A new array with the updated samples.
+    """
+    updated = np.array(samples)
+    record_details(changed=len(changed))
+    if changed:
+        rows = df["Code"].isin(changed).to_numpy()
+        updated[:, rows] = generate_samples_parallel(df[rows], distribution, updated.shape[0], seed, chunk_size, max_workers, updated.dtype).to_numpy()
+    return updated
+
+
+@profiled("simulate_makespans")
+def simulate_makespans_parallel(df: pd.DataFrame, schedule: CompiledSchedule, distribution: str, n_samples: int, start: Any, end: Any, seed: Optional[int] = None, chunk_size: int = 50_000, max_workers: Optional[int] = None, return_samples: bool = False, streaming: bool = False, relative_accuracy: float = 0.005) -> dict:
+    """
+    Runs the full Monte Carlo simulation (sampling and critical path) in parallel chunks.
+
+    Each worker samples its chunk and computes the makespans with
+    `max_path_dag_node_weights_batch`, so only the makespans travel back to the main process
+    unless `return_samples` is set. This is the mode intended for runs of millions of scenarios.
+    With `streaming`, each chunk is reduced to a `StreamingRiskEstimator` in its worker and the
+    estimators are merged, so VaR/CVaR are reported in bounded memory.
+
+    :param df: DataFrame containing the project activity data (see `generate_samples`).
+    :param schedule: The `CompiledSchedule` of the project.
+    :param distribution: The type of probability distribution to use ('triangular', 'pert', 'normal' or 'lognormal').
+    :param n_samples: The total number of scenarios.
+    :param start: The starting node for the critical path.
+    :param end: The ending node for the critical path.
+    :param seed: The root seed. None draws fresh entropy from the operating system.
+    :param chunk_size: The number of scenarios simulated by each task.
+    :param max_workers: The number of worker processes. None uses every core; 1 runs serially.
+    :param return_samples: Whether to also return the sample matrix.
+    :param streaming: Whether to keep only the merged `StreamingRiskEstimator` instead of the makespans.
+    :param relative_accuracy: The relative error bound of the estimator used in streaming mode.
+
+    :return: A dictionary with the makespan of every scenario ('makespans') or, in streaming mode,
+             the merged estimator ('risk_estimator'), plus the samples as a DataFrame ('samples') if requested.
+
+    :raises ValueError: If the distribution is not supported or there is no path from start to end.
+    """
+    parameters = _distribution_parameters(df.set_index("Code").loc[schedule.nodes].reset_index(), distribution)
+    streams = _activity_streams(schedule.nodes, seed)
+    sizes = _chunk_plan(n_samples, chunk_size)
+    n_chunks = len(sizes)
+    args = ([distribution] * n_chunks, [parameters] * n_chunks, sizes, [streams] * n_chunks, range(n_chunks), [schedule] * n_chunks,
+            [start] * n_chunks, [end] * n_chunks, [return_samples] * n_chunks,
+            [relative_accuracy if streaming else None] * n_chunks)
+
+    if max_workers == 1 or n_chunks == 1:
+        chunks = list(map(_simulate_chunk, *args))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, *args))
+
+    if streaming:
+        estimator = StreamingRiskEstimator(relative_accuracy)
+        for chunk_estimator, _ in chunks:
+            estimator.merge(chunk_estimator)
+        result = {"risk_estimator": estimator}
+    else:
+        result = {"makespans": np.concatenate([makespans for makespans, _ in chunks])}
+    if return_samples:
+        result["samples"] = pd.DataFrame(np.concatenate([samples for _, samples in chunks]), columns=schedule.nodes)
+    return result
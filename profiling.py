@@ -0,0 +1,226 @@
+import contextvars
+import functools
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger("civil_probabilistic_planning.profiling")
+
+# Attributes every LogRecord has; anything else was passed with `extra=` and is a structured field
+_STANDARD_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+
+_active_profiler: contextvars.ContextVar[Optional["Profiler"]] = contextvars.ContextVar("active_profiler", default=None)
+# Details of the innermost stage being measured, filled by `record_details`
+_stage_details: contextvars.ContextVar[Optional[dict]] = contextvars.ContextVar("stage_details", default=None)
+
+
+class Profiler:
+    """
+    Collects the wall time, peak memory and sizes of the stages of one run (e.g., one page rerun).
+
+    Stages are measured with `profile_stage` or the `profiled` decorator while the profiler is
+    active (see `activate`). Stages may be nested: the peak memory of an outer stage includes the
+    peaks of its inner stages.
+
+    :param memory: Whether to measure the peak memory of every stage with `tracemalloc`. Tracing
+                   slows pure Python code down, so it is off by default. NumPy reports its buffers
+                   to `tracemalloc`, so arrays are included.
+    :param on_record: Called with the profiler after every finished stage (e.g., to refresh a panel).
+    """
+
+    def __init__(self, memory: bool = False, on_record: Optional[Callable[["Profiler"], None]] = None):
+        self.memory = memory
+        self.on_record = on_record
+        self.records: List[dict] = []
+        self._stack: List[dict] = []
+        self._started_tracing = False
+        self.active = False
+
+    @contextmanager
+    def activate(self) -> Iterator["Profiler"]:
+        """Makes this profiler receive the stages measured in the current context."""
+        token = self.start()
+        try:
+            yield self
+        finally:
+            self.stop(token)
+
+    def start(self) -> contextvars.Token:
+        """
+        Activates the profiler until `stop` is called with the returned token.
+
+        For scripts that cannot wrap their body in `activate` (e.g., Streamlit pages, which may end
+        early with `st.stop()`).
+        """
+        self.active = True
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        return _active_profiler.set(self)
+
+    def stop(self, token: Optional[contextvars.Token] = None) -> None:
+        """
+        Deactivates the profiler and stops the memory tracing it started.
+
+        Without the token (e.g., from a later Streamlit rerun), the profiler stays set in its
+        context but ignores every stage.
+        """
+        self.active = False
+        if token is not None:
+            _active_profiler.reset(token)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _enter(self, name: str, details: dict) -> dict:
+        frame = {"stage": name, "depth": len(self._stack), "details": dict(details), "peak": 0, "base": 0}
+        if self.memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["base"] = current
+        self._stack.append(frame)
+        frame["started_at"] = time.perf_counter()
+        return frame
+
+    def _exit(self, frame: dict, failed: bool) -> dict:
+        seconds = time.perf_counter() - frame["started_at"]
+        self._stack.pop()
+        peak_bytes = None
+        if self.memory and tracemalloc.is_tracing():
+            frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            peak_bytes = frame["peak"] - frame["base"]
+            if self._stack:
+                self._stack[-1]["peak"] = max(self._stack[-1]["peak"], frame["peak"])
+        record = {"stage": frame["stage"], "depth": frame["depth"], "started_at": frame["started_at"], "seconds": seconds,
+                  "peak_bytes": peak_bytes, "status": "failed" if failed else "ok", **frame["details"]}
+        self.records.append(record)
+        if self.on_record is not None:
+            self.on_record(self)
+        return record
+
+    def table(self) -> pd.DataFrame:
+        """
+        Returns the finished stages in the order they started.
+
+        :return: A DataFrame with 'stage' (indented by nesting depth), 'seconds', 'peak_mb',
+                 'status' and one column per recorded detail (e.g., 'cpds', 'largest_factor').
+        """
+        if not self.records:
+            return pd.DataFrame(columns=["stage", "seconds", "peak_mb", "status"])
+        # Inner stages finish before their outer stage: sort by start time
+        table = pd.DataFrame(self.records).sort_values("started_at", kind="stable")
+        table["stage"] = ["  " * depth + stage for depth, stage in zip(table["depth"], table["stage"])]
+        table["peak_mb"] = table["peak_bytes"] / 1024 ** 2 if self.memory else None
+        detail_columns = [column for column in table.columns if column not in ("stage", "depth", "started_at", "seconds", "peak_bytes", "peak_mb", "status")]
+        return table[["stage", "seconds", "peak_mb", "status", *detail_columns]].reset_index(drop=True)
+
+    def total_seconds(self) -> float:
+        """Returns the wall time of the outermost stages."""
+        return sum(record["seconds"] for record in self.records if record["depth"] == 0)
+
+
+def active_profiler() -> Optional[Profiler]:
+    """Returns the profiler active in the current context, if any."""
+    return _active_profiler.get()
+
+
+@contextmanager
+def profile_stage(name: str, **details: Any) -> Iterator[dict]:
+    """
+    Measures a stage and logs it as a structured record.
+
+    The wall time is always measured and logged (logger 'civil_probabilistic_planning.profiling',
+    level DEBUG, with the fields 'stage', 'seconds', 'peak_bytes', 'status' and the details). When a
+    `Profiler` is active, the stage is also added to it, with its peak memory if it traces memory.
+
+    :param name: The name of the stage (e.g., 'generate_samples').
+    :param details: Sizes known before the stage starts (e.g., n_samples=10000).
+    :return: The details of the stage, as a dictionary the stage can add sizes to (see `record_details`).
+    """
+    profiler = _active_profiler.get()
+    if profiler is not None and not profiler.active:
+        profiler = None
+    frame = profiler._enter(name, details) if profiler is not None else {"details": dict(details), "started_at": time.perf_counter()}
+    token = _stage_details.set(frame["details"])
+    failed = False
+    try:
+        yield frame["details"]
+    except BaseException:
+        failed = True
+        raise
+    finally:
+        _stage_details.reset(token)
+        if profiler is not None:
+            record = profiler._exit(frame, failed)
+        else:
+            record = {"stage": name, "seconds": time.perf_counter() - frame["started_at"], "peak_bytes": None,
+                      "status": "failed" if failed else "ok", **frame["details"]}
+        fields = {key: value for key, value in record.items() if key not in ("depth", "started_at")}
+        logger.debug("Stage %s finished in %.4f s", name, record["seconds"], extra=fields)
+
+
+def record_details(**details: Any) -> None:
+    """
+    Adds sizes to the innermost stage being measured (e.g., cpds=120, largest_factor=4096).
+
+    Does nothing outside a stage, so library code can call it freely.
+    """
+    current = _stage_details.get()
+    if current is not None:
+        current.update(details)
+
+
+def profiled(name: Optional[str] = None) -> Callable:
+    """
+    Decorator that measures every call of a function as a stage (see `profile_stage`).
+
+    :param name: The name of the stage. Defaults to the name of the function.
+    """
+    def decorator(function: Callable) -> Callable:
+        stage = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with profile_stage(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats log records as one JSON object per line, with the fields passed in `extra=`."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        payload.update({key: value for key, value in record.__dict__.items() if key not in _STANDARD_RECORD_FIELDS})
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str)
+
+
+def configure_logging(level: str = "INFO", json_format: bool = True) -> None:
+    """
+    Sends the logs of the project's modules to stderr (for the command-line tools).
+
+    :param level: The lowest level shown ('DEBUG' includes every stage timing).
+    :param json_format: Whether to write JSON lines (see `JsonFormatter`) instead of plain text.
+    """
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if json_format else logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    for name in ("civil_probabilistic_planning", "complex_network"):
+        package_logger = logging.getLogger(name)
+        package_logger.handlers = [handler]
+        package_logger.setLevel(level.upper())
+        package_logger.propagate = False
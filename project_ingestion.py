@@ -0,0 +1,208 @@
+import hashlib
+import io
+import os
+from typing import List, Optional, Sequence, Tuple
+
+import pandas as pd
+
+from compiled_schedule import CompiledSchedule
+from profiling import profiled
+from simulation_cache import SimulationCache
+
+SUPPORTED_FORMATS = ("xlsx", "csv", "parquet", "feather")
+
+# Columns every project sheet needs, and the parameter columns of the triangular and PERT distributions
+REQUIRED_COLUMNS = ("Code", "Predecessors")
+THREE_POINT_COLUMNS = ("Min.", "Mode", "Max.")
+MEAN_STD_COLUMNS = ("Mean", "Std")
+
+# Bump when the parsing or validation rules change, so projects parsed by older code are not reused
+INGESTION_VERSION = 1
+
+
+class ProjectValidationError(ValueError):
+    """Raised when a project file cannot be used: unreadable file, missing columns, bad codes or values, or a cycle."""
+
+
+def file_format(file_name: str) -> str:
+    """
+    Returns the format of a project file from its extension.
+
+    :param file_name: The name of the file (e.g., 'plan.xlsx').
+    :return: One of `SUPPORTED_FORMATS`.
+    :raises ProjectValidationError: If the extension is not supported.
+    """
+    extension = os.path.splitext(file_name)[1].lower().lstrip(".")
+    if extension not in SUPPORTED_FORMATS:
+        raise ProjectValidationError(f"Unsupported file type '.{extension}'. Use one of: {', '.join('.' + f for f in SUPPORTED_FORMATS)}.")
+    return extension
+
+
+def parameter_columns(distribution: str) -> Tuple[str, ...]:
+    """
+    Returns the parameter columns a distribution needs (the `numeric_columns` of `load_project`).
+
+    :param distribution: 'triangular' or 'pert' (Min./Mode/Max.), 'normal' or 'lognormal' (Mean/Std).
+    :return: The column names.
+    """
+    return THREE_POINT_COLUMNS if distribution in ("triangular", "pert") else MEAN_STD_COLUMNS
+
+
+def sheet_names(data: bytes, file_name: str) -> List[str]:
+    """
+    Lists the sheets of an Excel project file.
+
+    :param data: The contents of the file.
+    :param file_name: The name of the file (selects the format).
+    :return: The sheet names, or an empty list for single-table formats (CSV, Parquet, Feather).
+    :raises ProjectValidationError: If the format is not supported or the workbook cannot be opened.
+    """
+    if file_format(file_name) != "xlsx":
+        return []
+    try:
+        return pd.ExcelFile(io.BytesIO(data)).sheet_names
+    except Exception as e:
+        raise ProjectValidationError(f"Could not read '{file_name}': {e}") from e
+
+
+def read_project_table(data: bytes, file_name: str, sheet_name: Optional[str] = None) -> pd.DataFrame:
+    """
+    Reads the raw activity table of a project file.
+
+    Excel needs `openpyxl`, and Parquet and Feather need `pyarrow` (or `fastparquet` for Parquet),
+    which pandas imports on demand.
+
+    :param data: The contents of the file.
+    :param file_name: The name of the file (selects the format).
+    :param sheet_name: The sheet to read from an Excel file. Defaults to the first sheet.
+    :return: The table as read, before cleaning (see `clean_project_table`).
+    :raises ProjectValidationError: If the format is not supported, its optional package is missing
+                                    or the file cannot be parsed.
+    """
+    fmt = file_format(file_name)
+    buffer = io.BytesIO(data)
+    try:
+        if fmt == "xlsx":
+            header = pd.read_excel(io.BytesIO(data), sheet_name=sheet_name or 0, nrows=0).columns
+            return pd.read_excel(buffer, sheet_name=sheet_name or 0, dtype=_text_columns(header))
+        if fmt == "csv":
+            header = pd.read_csv(io.BytesIO(data), sep=None, engine="python", nrows=0).columns
+            return pd.read_csv(buffer, sep=None, engine="python", dtype=_text_columns(header))
+        if fmt == "parquet":
+            return pd.read_parquet(buffer)
+        return pd.read_feather(buffer)
+    except ImportError as e:
+        package = "openpyxl" if fmt == "xlsx" else "pyarrow"
+        raise ProjectValidationError(f"Reading '.{fmt}' files needs the '{package}' package (pip install {package}): {e}") from e
+    except Exception as e:
+        raise ProjectValidationError(f"Could not read '{file_name}': {e}") from e
+
+
+def _text_columns(header: pd.Index) -> dict:
+    """
+    Reads codes and predecessors as text even when they look like numbers ('1', '1,2'), whatever the
+    whitespace around their column names.
+    """
+    return {column: str for column in header if str(column).strip() in REQUIRED_COLUMNS}
+
+
+def clean_project_table(df: pd.DataFrame, numeric_columns: Sequence[str] = ()) -> pd.DataFrame:
+    """
+    Normalizes and validates an activity table, with vectorized string operations.
+
+    - Column names and the 'Code', 'Task Name' and 'Predecessors' cells are stripped of whitespace,
+      and fully empty rows (e.g., formatted but unused Excel rows) are dropped. Activities without
+      a name are named after their code.
+    - Predecessor lists are normalized to comma separated codes without spaces, with '-' for none
+      (empty cells and stray commas included).
+    - Codes must be present and unique, and every predecessor must be a code of the table.
+    - `numeric_columns` must hold numbers. When they include Min./Mode/Max., every activity must
+      satisfy Min. <= Mode <= Max.
+
+    :param df: The raw activity table (see `read_project_table`).
+    :param numeric_columns: Parameter columns that are required and must be numeric.
+    :return: A cleaned copy of the table, with a default index.
+    :raises ProjectValidationError: If the table does not describe a valid project.
+    """
+    df = df.rename(columns=lambda column: column.strip() if isinstance(column, str) else column)
+    df = df.dropna(how="all").reset_index(drop=True)
+    missing = [column for column in (*REQUIRED_COLUMNS, *numeric_columns) if column not in df]
+    if missing:
+        raise ProjectValidationError(f"Missing column(s): {', '.join(repr(column) for column in missing)}.")
+
+    codes = df["Code"].astype("string").str.strip()
+    if (codes.isna() | (codes == "")).any():
+        rows = (codes.isna() | (codes == "")).to_numpy().nonzero()[0]
+        raise ProjectValidationError(f"Activities without a code in row(s): {', '.join(str(row + 2) for row in rows[:10])}.")
+    duplicated = codes[codes.duplicated()].unique().tolist()
+    if duplicated:
+        raise ProjectValidationError(f"Duplicated activity code(s): {', '.join(duplicated[:10])}.")
+    df["Code"] = codes.astype(str)
+    names = df["Task Name"].astype("string").str.strip() if "Task Name" in df else pd.Series(pd.NA, index=df.index, dtype="string")
+    df["Task Name"] = names.mask(names == "").fillna(codes).astype(str)
+
+    predecessors = (
+        df["Predecessors"].astype("string").fillna("-")
+        .str.replace(r"\s+", "", regex=True)
+        .str.replace(r",+", ",", regex=True)
+        .str.strip(",")
+    )
+    df["Predecessors"] = predecessors.mask(predecessors.isin(["", "-"]), "-").astype(str)
+
+    exploded = df.loc[df["Predecessors"] != "-", ["Code", "Predecessors"]]
+    exploded = exploded.assign(Predecessors=exploded["Predecessors"].str.split(",")).explode("Predecessors")
+    unknown = exploded[~exploded["Predecessors"].isin(df["Code"])]
+    if len(unknown):
+        listed = [f"{pred} (in {code})" for code, pred in zip(unknown["Code"], unknown["Predecessors"])]
+        raise ProjectValidationError(f"Unknown predecessor code(s): {', '.join(listed[:10])}.")
+
+    for column in numeric_columns:
+        values = pd.to_numeric(df[column], errors="coerce")
+        invalid = df["Code"][values.isna()].tolist()
+        if invalid:
+            raise ProjectValidationError(f"Column '{column}' must be numeric. Check activities: {', '.join(invalid[:10])}.")
+        df[column] = values
+    if set(THREE_POINT_COLUMNS) <= set(numeric_columns):
+        low, mode, high = (df[column] for column in THREE_POINT_COLUMNS)
+        invalid = df["Code"][(low > mode) | (mode > high)].tolist()
+        if invalid:
+            raise ProjectValidationError(f"Min. <= Mode <= Max. does not hold for activities: {', '.join(invalid[:10])}.")
+    return df
+
+
+def parse_project(data: bytes, file_name: str, sheet_name: Optional[str] = None, numeric_columns: Sequence[str] = ()) -> Tuple[pd.DataFrame, CompiledSchedule]:
+    """
+    Reads, cleans and validates a project file and compiles its network (see `load_project`).
+
+    :raises ProjectValidationError: If the file does not describe a valid project (including cycles).
+    """
+    df = clean_project_table(read_project_table(data, file_name, sheet_name), numeric_columns)
+    try:
+        schedule = CompiledSchedule.from_dataframe(df)
+    except ValueError as e:
+        raise ProjectValidationError(str(e)) from e
+    return df, schedule
+
+
+@profiled("load_project")
+def load_project(data: bytes, file_name: str, sheet_name: Optional[str] = None, numeric_columns: Sequence[str] = (), cache: Optional[SimulationCache] = None) -> Tuple[pd.DataFrame, CompiledSchedule]:
+    """
+    Loads a project file (Excel, CSV, Parquet or Feather) into a clean activity table and its network.
+
+    The result is cached by the SHA-256 of the file contents (and the sheet and validation
+    columns), so uploading the same file again skips parsing, validation and compilation.
+
+    :param data: The contents of the file (e.g., `uploaded_file.getvalue()`).
+    :param file_name: The name of the file (selects the format).
+    :param sheet_name: The sheet to read from an Excel file. Defaults to the first sheet.
+    :param numeric_columns: Parameter columns that are required and must be numeric (e.g., `THREE_POINT_COLUMNS`).
+    :param cache: The store to use. Defaults to a `SimulationCache` in the default directory.
+    :return: A tuple (df, schedule) with the cleaned table (see `clean_project_table`) and its
+             `CompiledSchedule`, already checked for cycles.
+    :raises ProjectValidationError: If the file does not describe a valid project.
+    """
+    if cache is None:
+        cache = SimulationCache()
+    digest = hashlib.sha256(data).hexdigest()
+    key = SimulationCache.make_key("project", INGESTION_VERSION, digest, file_format(file_name), sheet_name, tuple(numeric_columns))
+    return cache.get_object(key, "project", lambda: parse_project(data, file_name, sheet_name, numeric_columns))
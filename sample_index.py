@@ -0,0 +1,101 @@
+from functools import reduce
+from typing import Any, Callable, Dict, Optional, Sequence, Union
+
+import numpy as np
+import pandas as pd
+from pgmpy.factors.discrete import DiscreteFactor
+
+from complex_network.discretize_samples import assign_states
+
+# Below this many matching samples, conditional forecasts fall back to the Bayesian Network
+MIN_EFFECTIVE_SAMPLES = 200
+
+
+class SampleIndex:
+    """
+    Bitmap index of the Monte Carlo samples by the discretized duration state of each activity.
+
+    For every activity and duration state, the ids of the samples in that state are kept as a
+    packed bitmap (`np.packbits`, one bit per sample). Evidence such as `D_A = 5` is answered by
+    intersecting the bitmaps of the observed states (a bitwise AND over `n_samples / 8` bytes) and
+    counting the outcome of the matching samples by whole day. The samples are equally likely, so
+    the number of matches is the effective sample size of the estimate.
+
+    :param samples: The duration samples, one column per activity (DataFrame or 2D array).
+    :param discretization_params: The discretization of the durations (see `discretize_durations`).
+    :param outcome: The outcome of every sample (e.g., the project makespan), in days.
+    :param columns: The activity codes of the array columns. Defaults to the DataFrame columns.
+    """
+
+    def __init__(self, samples: Union[pd.DataFrame, np.ndarray], discretization_params: dict, outcome: np.ndarray, columns: Optional[Sequence[str]] = None):
+        if columns is None:
+            columns = list(samples.columns) if isinstance(samples, pd.DataFrame) else list(discretization_params)
+        states = assign_states(samples, discretization_params, columns)
+        self.n_samples = states.shape[0]
+        self.labels = {code: list(discretization_params[code]['labels']) for code in columns}
+        self.bitmaps = {
+            code: np.packbits(states[:, j][None, :] == np.arange(len(self.labels[code]))[:, None], axis=1)
+            for j, code in enumerate(columns)
+        }
+
+        days = np.rint(np.asarray(outcome, dtype=float)).astype(np.int64)
+        if days.shape != (self.n_samples,):
+            raise ValueError(f"outcome must have one value per sample ({self.n_samples}). Got shape {days.shape}.")
+        self.first_day = int(days.min())
+        self.outcome_bins = days - self.first_day
+        self.outcome_labels = list(range(self.first_day, int(days.max()) + 1))
+
+    def _state_bitmap(self, variable: str, state: Any) -> np.ndarray:
+        code = variable[2:] if variable not in self.labels and variable.startswith("D_") else variable
+        if code not in self.labels:
+            raise ValueError(f"Unknown activity '{variable}'.")
+        if state not in self.labels[code]:
+            raise ValueError(f"Unknown duration state {state} for activity '{code}'. Choose one of {self.labels[code]}.")
+        return self.bitmaps[code][self.labels[code].index(state)]
+
+    def matching(self, evidence: Dict[str, Any]) -> np.ndarray:
+        """
+        Returns the packed bitmap of the samples that satisfy all the evidence.
+
+        :param evidence: A dictionary mapping activities ('D_A' or 'A') to duration states.
+        :return: A uint8 array with one bit per sample.
+        """
+        if not evidence:
+            return np.packbits(np.ones(self.n_samples, dtype=bool))
+        return reduce(np.bitwise_and, [self._state_bitmap(var, state) for var, state in evidence.items()])
+
+    def count(self, evidence: Dict[str, Any]) -> int:
+        """Returns the number of samples that satisfy all the evidence (the effective sample size)."""
+        return int(np.count_nonzero(np.unpackbits(self.matching(evidence))))
+
+    def conditional_distribution(self, evidence: Dict[str, Any]) -> dict:
+        """
+        Estimates the outcome distribution given the evidence from the matching samples.
+
+        :param evidence: A dictionary mapping activities ('D_A' or 'A') to duration states.
+        :return: A dictionary with the outcome 'labels' (days), their 'probs' (all zero if no sample
+                 matches) and the 'effective_sample_size'.
+        """
+        ids = np.flatnonzero(np.unpackbits(self.matching(evidence), count=self.n_samples))
+        counts = np.bincount(self.outcome_bins[ids], minlength=len(self.outcome_labels))
+        probs = counts / ids.size if ids.size else counts.astype(float)
+        return {'labels': self.outcome_labels, 'probs': probs, 'effective_sample_size': int(ids.size)}
+
+    def forecast(self, evidence: Dict[str, Any], fallback: Optional[Callable[[Dict[str, Any]], DiscreteFactor]] = None, min_samples: int = MIN_EFFECTIVE_SAMPLES) -> dict:
+        """
+        Conditional forecast from the samples, falling back to the Bayesian Network when too few match.
+
+        :param evidence: A dictionary mapping duration variables ('D_A') to states.
+        :param fallback: A function that returns the posterior `DiscreteFactor` of the outcome for
+                         the evidence, e.g. `lambda ev: service.query(['T_F'], ev)`.
+        :param min_samples: The smallest effective sample size accepted from the samples.
+        :return: The result of `conditional_distribution` plus its 'source' ('samples' or
+                 'bayesian_network').
+        """
+        result = self.conditional_distribution(evidence)
+        result['source'] = 'samples'
+        if result['effective_sample_size'] < min_samples and fallback is not None:
+            factor = fallback(evidence)
+            variable = factor.variables[0]
+            result.update(labels=list(factor.state_names[variable]), probs=np.asarray(factor.values), source='bayesian_network')
+        return result
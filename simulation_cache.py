@@ -0,0 +1,214 @@
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "SIMULATION_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "civil_probabilistic_planning")
+)
+DEFAULT_MAX_BYTES = int(os.environ.get("SIMULATION_CACHE_MAX_BYTES", 2 * 1024 ** 3))
+
+# Bump when the sampling or simulation algorithms change, so old entries are not reused
+CACHE_VERSION = 3
+
+
+class SimulationCache:
+    """
+    Content-addressed on-disk cache for sample matrices, simulation results and derived objects.
+
+    Every entry lives in its own directory named after a SHA-256 key computed from the inputs that
+    produced it (activity sheet, distribution, sample count, seed, ...). Arrays are stored as `.npy`
+    files and loaded back memory-mapped, so reopening a plan costs neither recomputation nor a copy
+    into RAM. Small Python objects (discretization parameters, models) are pickled. When the total
+    size exceeds `max_bytes`, the least recently used entries are removed.
+
+    :param directory: Root directory of the cache.
+    :param max_bytes: Maximum total size of the cache, in bytes.
+    """
+
+    def __init__(self, directory: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts: Any) -> str:
+        """
+        Builds the content hash of the given inputs.
+
+        DataFrames are hashed by content (values, index and column names), arrays by dtype, shape
+        and bytes, and any other value by its `repr`.
+
+        :param parts: The inputs that determine the cached result.
+        :return: A hexadecimal SHA-256 key.
+        """
+        digest = hashlib.sha256(f"v{CACHE_VERSION}".encode())
+        for part in parts:
+            if isinstance(part, pd.DataFrame):
+                digest.update(repr(list(part.columns)).encode())
+                digest.update(pd.util.hash_pandas_object(part, index=True).to_numpy().tobytes())
+            elif isinstance(part, np.ndarray):
+                digest.update(f"{part.dtype}{part.shape}".encode())
+                digest.update(np.ascontiguousarray(part).tobytes())
+            else:
+                digest.update(repr(part).encode())
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def _entry(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def _touch(self, key: str) -> None:
+        """Marks the entry as recently used."""
+        try:
+            os.utime(self._entry(key))
+        except OSError:
+            pass
+
+    def _write(self, key: str, filename: str, writer: Callable[[Any], None]) -> str:
+        """Writes a file atomically inside the entry directory and returns its path."""
+        entry = self._entry(key)
+        os.makedirs(entry, exist_ok=True)
+        path = os.path.join(entry, filename)
+        handle, temporary = tempfile.mkstemp(dir=entry, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as f:
+                writer(f)
+            os.replace(temporary, path)
+        except BaseException:
+            if os.path.exists(temporary):
+                os.remove(temporary)
+            raise
+        self._touch(key)
+        self.evict()
+        return path
+
+    def contains(self, key: str, name: str) -> bool:
+        """
+        Checks whether an array or object is cached, without loading it.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the array or object inside the entry.
+        :return: True if the entry holds `name`.
+        """
+        entry = self._entry(key)
+        return os.path.exists(os.path.join(entry, f"{name}.npy")) or os.path.exists(os.path.join(entry, f"{name}.pkl"))
+
+    def load_array(self, key: str, name: str) -> Optional[np.ndarray]:
+        """
+        Loads a cached array as a read-only memory map.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the array inside the entry.
+        :return: The memory-mapped array, or None if it is not cached.
+        """
+        path = os.path.join(self._entry(key), f"{name}.npy")
+        if not os.path.exists(path):
+            return None
+        self._touch(key)
+        return np.load(path, mmap_mode="r")
+
+    def save_array(self, key: str, name: str, array: np.ndarray) -> np.ndarray:
+        """
+        Stores an array and returns it memory-mapped from the cache.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the array inside the entry.
+        :param array: The array to store.
+        :return: The stored array, memory-mapped (or the array itself if it was evicted right away).
+        """
+        path = self._write(key, f"{name}.npy", lambda f: np.save(f, np.asarray(array)))
+        return np.load(path, mmap_mode="r") if os.path.exists(path) else np.asarray(array)
+
+    def get_array(self, key: str, name: str, compute: Callable[[], np.ndarray]) -> np.ndarray:
+        """
+        Returns the cached array, computing and storing it on a miss.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the array inside the entry.
+        :param compute: Function without arguments that produces the array.
+        :return: The (memory-mapped) array.
+        """
+        array = self.load_array(key, name)
+        if array is None:
+            array = self.save_array(key, name, compute())
+        return array
+
+    def load_object(self, key: str, name: str) -> Any:
+        """
+        Loads a pickled object.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the object inside the entry.
+        :return: The object, or None if it is not cached.
+        """
+        path = os.path.join(self._entry(key), f"{name}.pkl")
+        if not os.path.exists(path):
+            return None
+        self._touch(key)
+        with open(path, "rb") as f:
+            return pickle.load(f)
+
+    def save_object(self, key: str, name: str, value: Any) -> Any:
+        """
+        Pickles an object into the cache.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the object inside the entry.
+        :param value: The object to store.
+        :return: The object itself.
+        """
+        self._write(key, f"{name}.pkl", lambda f: pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL))
+        return value
+
+    def get_object(self, key: str, name: str, compute: Callable[[], Any]) -> Any:
+        """
+        Returns the cached object, computing and storing it on a miss.
+
+        :param key: The entry key (see `make_key`).
+        :param name: The name of the object inside the entry.
+        :param compute: Function without arguments that produces the object.
+        :return: The object.
+        """
+        value = self.load_object(key, name)
+        if value is None:
+            value = self.save_object(key, name, compute())
+        return value
+
+    def size(self) -> int:
+        """Returns the total size of the cache, in bytes."""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        """Yields (last access time, entry directory, size in bytes) for every entry."""
+        for prefix in os.listdir(self.directory):
+            prefix_dir = os.path.join(self.directory, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                entry = os.path.join(prefix_dir, key)
+                try:
+                    size = sum(os.path.getsize(os.path.join(entry, f)) for f in os.listdir(entry))
+                    yield os.path.getmtime(entry), entry, size
+                except OSError:
+                    continue
+
+    def evict(self) -> None:
+        """Removes the least recently used entries until the cache fits in `max_bytes`."""
+        entries = sorted(self._entries())
+        total = sum(size for _, _, size in entries)
+        for _, entry, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """Removes every entry."""
+        shutil.rmtree(self.directory, ignore_errors=True)
+        os.makedirs(self.directory, exist_ok=True)
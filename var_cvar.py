@@ -1,5 +1,8 @@
 import numpy as np
 
+from profiling import profiled
+
+
 def value_at_risk(data, confidence_level=0.95):
     """
     Calcula o Value at Risk (VaR) de uma lista de valores.
@@ -31,3 +34,240 @@ def conditional_value_at_risk(data, confidence_level=0.95):
     var = value_at_risk(data, confidence_level)
     cvar = data[data >= var].mean()
     return cvar
+
+
+@profiled("risk_profile")
+def risk_profile(data, levels, n_bootstrap=1000, ci=0.95, seed=None):
+    """
+    Calcula VaR e CVaR para vários níveis de confiança com uma única ordenação.
+
+    Os valores são ordenados uma vez; o VaR de todos os níveis sai de uma chamada a
+    `np.percentile` e o CVaR de somas acumuladas da amostra ordenada, com os mesmos resultados de
+    `value_at_risk` e `conditional_value_at_risk`. Os intervalos de confiança vêm de um bootstrap
+    vetorizado: cada reamostragem é representada pelas contagens de cada valor ordenado, de modo que
+    os quantis e as médias da cauda de todas as reamostragens são obtidos sem reordenar nada.
+
+    Args:
+        data (list or array): Lista de valores (por exemplo, perdas ou durações).
+        levels (list or array): Níveis de confiança (ex: [0.90, 0.95, 0.99]).
+        n_bootstrap (int): Número de reamostragens bootstrap (0 para não calcular intervalos).
+        ci (float): Nível de confiança dos intervalos bootstrap (ex: 0.95 para 95%).
+        seed (int, optional): Semente do gerador aleatório do bootstrap.
+
+    Returns:
+        dict: 'levels', 'var' e 'cvar' (um valor por nível) e, se `n_bootstrap` > 0, 'var_ci' e
+        'cvar_ci' com os limites inferior e superior de cada nível (formato (n_levels, 2)).
+    """
+    data = np.sort(np.asarray(data, dtype=float).ravel())
+    levels = np.atleast_1d(np.asarray(levels, dtype=float))
+    n = data.size
+    cumulative = np.concatenate(([0.0], np.cumsum(data)))
+
+    var = np.percentile(data, levels * 100)
+    first = np.searchsorted(data, var, side="left")
+    cvar = (cumulative[-1] - cumulative[first]) / (n - first)
+    profile = {"levels": levels, "var": var, "cvar": cvar}
+    if n_bootstrap <= 0:
+        return profile
+
+    rng = np.random.default_rng(seed)
+    position = levels * (n - 1)
+    lower = np.floor(position).astype(np.intp)
+    upper = np.minimum(lower + 1, n - 1)
+    fraction = position - lower
+
+    boot_var = np.empty((n_bootstrap, levels.size))
+    boot_cvar = np.empty((n_bootstrap, levels.size))
+    block = max(1, min(n_bootstrap, 2_000_000 // n))
+    for start in range(0, n_bootstrap, block):
+        size = min(block, n_bootstrap - start)
+        rows = np.arange(size)[:, None]
+        # Contagem de cada valor ordenado em cada reamostragem
+        draws = rng.integers(0, n, size=(size, n)) + rows * n
+        counts = np.bincount(draws.ravel(), minlength=size * n).reshape(size, n)
+        ranks = np.cumsum(counts, axis=1)
+        weighted = np.cumsum(counts * data, axis=1)
+
+        # Valor de ordem r da reamostragem b: primeira posição com contagem acumulada > r
+        flat = (ranks + rows * n).ravel()
+        value_lower = data[np.searchsorted(flat, lower + rows * n, side="right") - rows * n]
+        value_upper = data[np.searchsorted(flat, upper + rows * n, side="right") - rows * n]
+        block_var = value_lower + fraction * (value_upper - value_lower)
+
+        # Média dos valores >= VaR em cada reamostragem
+        tail_start = np.searchsorted(data, block_var, side="left")
+        before = np.where(tail_start > 0, np.take_along_axis(weighted, np.maximum(tail_start - 1, 0), axis=1), 0.0)
+        count_before = np.where(tail_start > 0, np.take_along_axis(ranks, np.maximum(tail_start - 1, 0), axis=1), 0)
+        boot_var[start:start + size] = block_var
+        boot_cvar[start:start + size] = (weighted[:, -1:] - before) / (n - count_before)
+
+    alpha = (1 - ci) / 2 * 100
+    profile["var_ci"] = np.percentile(boot_var, [alpha, 100 - alpha], axis=0).T
+    profile["cvar_ci"] = np.percentile(boot_cvar, [alpha, 100 - alpha], axis=0).T
+    return profile
+
+
+class StreamingRiskEstimator:
+    """
+    Estimador incremental de VaR e CVaR com memória limitada.
+
+    Os valores são agrupados em baldes logarítmicos (esquema do DDSketch): o balde k contém os
+    valores em (gamma^(k-1), gamma^k], com gamma = (1 + alpha) / (1 - alpha), e cada balde guarda
+    a contagem, a soma exata, o mínimo e o máximo dos seus valores. O número de baldes cresce apenas com o logaritmo da
+    razão entre o maior e o menor valor observado, e não com o número de amostras.
+
+    Limite de erro: o VaR estimado difere do valor de `value_at_risk` (mesma interpolação linear
+    de `np.percentile`) por no máximo `alpha` em termos relativos. O CVaR usa as somas exatas dos
+    baldes acima do VaR e só aproxima a parte da cauda que cai no balde do VaR, portanto também fica
+    dentro de `alpha` (relativo) do valor de `conditional_value_at_risk`.
+
+    Os valores precisam ser não negativos (durações). Estimadores com o mesmo `alpha` podem ser
+    combinados com `merge`, o que permite que cada bloco da simulação tenha o seu próprio estimador.
+
+    Args:
+        relative_accuracy (float): Erro relativo máximo alpha (ex: 0.005 para 0,5%).
+    """
+
+    def __init__(self, relative_accuracy=0.005):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy deve estar entre 0 e 1.")
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = np.log(self._gamma)
+        self._offset = 0
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._sums = np.zeros(0)
+        self._mins = np.zeros(0)
+        self._maxs = np.zeros(0)
+        self._zero_count = 0
+        self.count = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, data):
+        """
+        Acrescenta um bloco de valores ao estimador.
+
+        Args:
+            data (list or array): Valores do bloco (por exemplo, makespans de um bloco da simulação).
+        """
+        data = np.asarray(data, dtype=float).ravel()
+        if data.size == 0:
+            return
+        if np.any(data < 0) or np.any(np.isnan(data)):
+            raise ValueError("StreamingRiskEstimator aceita apenas valores não negativos.")
+
+        self.count += data.size
+        self.min = min(self.min, data.min())
+        self.max = max(self.max, data.max())
+
+        positive = data[data > 0]
+        self._zero_count += data.size - positive.size
+        if positive.size == 0:
+            return
+        keys = np.ceil(np.log(positive) / self._log_gamma).astype(np.int64)
+        offset = keys.min()
+        index = keys - offset
+        size = index.max() + 1
+        mins = np.full(size, np.inf)
+        maxs = np.full(size, -np.inf)
+        np.minimum.at(mins, index, positive)
+        np.maximum.at(maxs, index, positive)
+        self._add_buckets(offset, np.bincount(index), np.bincount(index, weights=positive), mins, maxs)
+
+    def merge(self, other):
+        """
+        Incorpora outro estimador (por exemplo, de outro processo) a este.
+
+        Args:
+            other (StreamingRiskEstimator): Estimador com a mesma precisão relativa.
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Só é possível combinar estimadores com a mesma precisão relativa.")
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._zero_count += other._zero_count
+        if other._counts.size:
+            self._add_buckets(other._offset, other._counts, other._sums, other._mins, other._maxs)
+
+    def _add_buckets(self, offset, counts, sums, mins, maxs):
+        """Acumula baldes que começam no índice `offset`, ampliando os vetores se preciso."""
+        low = min(self._offset, offset) if self._counts.size else offset
+        high = max(self._offset + self._counts.size, offset + counts.size) if self._counts.size else offset + counts.size
+        if self._counts.size != high - low:
+            start = self._offset - low
+            end = start + self._counts.size
+            new_counts = np.zeros(high - low, dtype=np.int64)
+            new_sums = np.zeros(high - low)
+            new_mins = np.full(high - low, np.inf)
+            new_maxs = np.full(high - low, -np.inf)
+            new_counts[start:end], new_sums[start:end] = self._counts, self._sums
+            new_mins[start:end], new_maxs[start:end] = self._mins, self._maxs
+            self._offset, self._counts, self._sums, self._mins, self._maxs = low, new_counts, new_sums, new_mins, new_maxs
+        start = offset - self._offset
+        end = start + counts.size
+        self._counts[start:end] += counts
+        self._sums[start:end] += sums
+        self._mins[start:end] = np.minimum(self._mins[start:end], mins)
+        self._maxs[start:end] = np.maximum(self._maxs[start:end], maxs)
+
+    def _value_at_rank(self, rank):
+        """Valor representativo da estatística de ordem `rank` (base zero) e o índice do seu balde."""
+        if rank < self._zero_count:
+            return 0.0, -1
+        cumulative = np.cumsum(self._counts) + self._zero_count
+        bucket = int(np.searchsorted(cumulative, rank, side="right"))
+        value = 2 * self._gamma ** (bucket + self._offset) / (self._gamma + 1)
+        return float(np.clip(value, self._mins[bucket], self._maxs[bucket])), bucket
+
+    def value_at_risk(self, confidence_level=0.95):
+        """
+        Estima o Value at Risk (VaR) dos valores já observados.
+
+        Args:
+            confidence_level (float): Nível de confiança (ex: 0.95 para 95%).
+
+        Returns:
+            float: Valor de VaR no nível de confiança especificado.
+        """
+        if self.count == 0:
+            raise ValueError("Nenhum valor foi adicionado ao estimador.")
+        position = confidence_level * (self.count - 1)
+        lower = int(np.floor(position))
+        fraction = position - lower
+        var, _ = self._value_at_rank(lower)
+        if fraction > 0:
+            upper, _ = self._value_at_rank(lower + 1)
+            var = var + fraction * (upper - var)
+        return var
+
+    def conditional_value_at_risk(self, confidence_level=0.95):
+        """
+        Estima o CVaR (Conditional Value at Risk) dos valores já observados.
+
+        Args:
+            confidence_level (float): Nível de confiança (ex: 0.95 para 95%).
+
+        Returns:
+            float: Valor de CVaR no nível de confiança especificado.
+        """
+        if self.count == 0:
+            raise ValueError("Nenhum valor foi adicionado ao estimador.")
+        position = confidence_level * (self.count - 1)
+        lower = int(np.floor(position))
+        # Mesma cauda de `conditional_value_at_risk`: valores >= VaR interpolado
+        first = lower if position == lower else lower + 1
+        tail_count = self.count - first
+
+        value, bucket = self._value_at_rank(first)
+        if bucket < 0:
+            # VaR igual a zero: a cauda contém todos os valores
+            return float(self._sums.sum() / self.count)
+        cumulative = np.cumsum(self._counts) + self._zero_count
+        above = int(self.count - cumulative[bucket])
+        if self._mins[bucket] == self._maxs[bucket]:
+            # Balde com valores empatados: todos são >= VaR, como em `conditional_value_at_risk`
+            return float(self._sums[bucket:].sum() / (above + self._counts[bucket]))
+        tail_sum = self._sums[bucket + 1:].sum() + (tail_count - above) * value
+        return float(tail_sum / tail_count)